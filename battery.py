@@ -0,0 +1,264 @@
+"""Batteriemodell mit Verlusten für die Speicher-Simulation
+
+Eine Batterie ist entweder eine Kapazität in kWh (verlustfrei, wie bisher)
+oder ein Dict bzw. ``Battery`` mit Kapazität und Verlustparametern:
+
+- ``round_trip_efficiency``: Wirkungsgrad Laden + Entladen, je Richtung die Wurzel
+- ``max_charge_kw`` / ``max_discharge_kw``: Lade- und Entladeleistung
+- ``reserve_soc``: Anteil der Kapazität, der nie entladen wird
+- ``self_discharge_per_day``: Selbstentladung als Anteil des Ladestands je Tag
+- ``inverter_efficiency``: Wandlerverluste auf dem Weg in und aus der Batterie
+
+Der verlustbehaftete Kern rechnet alle Konfigurationen gemeinsam. Mit numba
+(``pip install .[fast]``) läuft er kompiliert, sonst als numpy-Schleife über
+die Stunden wie die verlustfreie Simulation.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+Battery = namedtuple('Battery', [
+    'capacity_kwh', 'round_trip_efficiency', 'max_charge_kw', 'max_discharge_kw',
+    'reserve_soc', 'self_discharge_per_day', 'inverter_efficiency'],
+    defaults=(1.0, math.inf, math.inf, 0.0, 0.0, 1.0))
+
+# Kennwerte je Konfiguration für den Kern (je Zeitschritt, Energien in kWh)
+LossParams = namedtuple('LossParams', [
+    'capacity', 'charge_efficiency', 'discharge_efficiency', 'charge_limit', 'discharge_limit',
+    'reserve', 'retention'])
+
+
+def battery_spec(battery):
+    """Kapazität, Dict oder Battery als Battery"""
+    if isinstance(battery, Battery):
+        return battery
+    if isinstance(battery, dict):
+        return Battery(**battery)
+    return Battery(float(battery))
+
+
+def capacity_of(battery):
+    """Nennkapazität (kWh) einer Batterie-Angabe"""
+    return battery_spec(battery).capacity_kwh
+
+
+def scale_battery(battery, factor):
+    """Batterie für ein um ``factor`` skaliertes Profil: Kapazität und Leistungen geteilt durch ``factor``
+
+    Das Modell ist linear: ertrag(k·pv, B, L) = k · ertrag(pv, scale_battery(B, k), L/k).
+    """
+    spec = battery_spec(battery)
+    return spec._replace(capacity_kwh=spec.capacity_kwh / factor, max_charge_kw=spec.max_charge_kw / factor,
+                         max_discharge_kw=spec.max_discharge_kw / factor)
+
+
+def is_lossless(battery):
+    """True, wenn die Batterie keine Verlustparameter hat (reine Kapazität)"""
+    return battery_spec(battery)[1:] == Battery(0.0)[1:]
+
+
+def battery_list(batteries):
+    """Batterie-Angaben als Liste; eine Zahl, ein Dict oder eine ``Battery`` zählt als eine Batterie"""
+    if isinstance(batteries, np.ndarray):
+        return list(np.atleast_1d(batteries))
+    if isinstance(batteries, (Battery, dict)) or not hasattr(batteries, '__iter__'):
+        return [batteries]
+    return list(batteries)
+
+
+def split_batteries(batteries, step_hours=1.0):
+    """Batterie-Angaben in (Kapazitäten, LossParams oder None) aufteilen
+
+    Sind alle Batterien verlustfrei (auch reine Zahlen), ist das zweite
+    Element None und die bisherige Simulation wird verwendet.
+    """
+    if isinstance(batteries, np.ndarray) and batteries.dtype != object:
+        return batteries, None
+    items = battery_list(batteries)
+    if all(isinstance(b, (int, float, np.number)) for b in items):
+        return batteries, None
+    specs = [battery_spec(b) for b in items]
+    capacities = np.array([spec.capacity_kwh for spec in specs])
+    if all(is_lossless(spec) for spec in specs):
+        return capacities, None
+    return capacities, loss_params(specs, step_hours)
+
+
+def scale_batteries(batteries, factors):
+    """``scale_battery`` je Konfiguration, z.B. für das 1 kWp-Referenzprofil mit ``factors`` = Peakleistungen
+
+    Sind alle Batterien verlustfrei, bleibt es bei einem Array der
+    Kapazitäten (schnelle verlustfreie Simulation), sonst eine Liste von ``Battery``.
+    """
+    items = battery_list(batteries)
+    factors = np.broadcast_to(np.asarray(factors, dtype=float), (len(items),))
+    capacities, params = split_batteries(items)
+    if params is None:
+        return np.asarray(capacities, dtype=float) / factors
+    return [scale_battery(b, f) for b, f in zip(items, factors.tolist())]
+
+
+def interpolate_battery(batteries, capacity_kwh):
+    """Batterie beliebiger Kapazität aus Beispielen (z.B. den Szenarien in main.py)
+
+    Jeder Parameter wird linear über die Kapazität interpoliert und außerhalb
+    der Beispiele konstant fortgesetzt, z.B. die Ladeleistung.
+    """
+    specs = sorted((battery_spec(b) for b in battery_list(batteries)), key=lambda spec: spec.capacity_kwh)
+    capacities = [spec.capacity_kwh for spec in specs]
+    values = []
+    for column in list(zip(*specs))[1:]:
+        # Gleiche Werte (auch unbegrenzte Leistung) unverändert übernehmen
+        same = all(value == column[0] for value in column)
+        values.append(column[0] if same else float(np.interp(capacity_kwh, capacities, column)))
+    return Battery(float(capacity_kwh), *values)
+
+
+def loss_params(specs, step_hours=1.0):
+    """Kennwerte der Batterien für Zeitschritte von ``step_hours`` Stunden"""
+    column = {name: np.array([getattr(spec, name) for spec in specs], dtype=float)
+              for name in Battery._fields}
+    one_way = np.sqrt(column['round_trip_efficiency']) * column['inverter_efficiency']
+    return LossParams(
+        capacity=column['capacity_kwh'],
+        charge_efficiency=one_way,
+        discharge_efficiency=one_way,
+        charge_limit=column['max_charge_kw'] * step_hours,
+        discharge_limit=column['max_discharge_kw'] * step_hours,
+        reserve=column['reserve_soc'] * column['capacity_kwh'],
+        retention=(1 - column['self_discharge_per_day']) ** (step_hours / 24),
+    )
+
+
+def broadcast_params(params, shape):
+    """Kennwerte auf die Form der Konfigurationen (z.B. nach Broadcast mit Einspeiselimits) bringen"""
+    return LossParams._make(np.ascontiguousarray(np.broadcast_to(p, shape), dtype=float) for p in params)
+
+
+def _lossy_numpy(pv, params, feed_limit, soc, discharge, period_codes, periods):
+    """Stundenschleife über alle Konfigurationen mit numpy (ohne numba)"""
+    capacity, eta_c, eta_d, charge_limit, discharge_limit, reserve, retention = params
+    delta = np.empty_like(soc)
+    flow = np.empty_like(soc)
+    total = np.zeros_like(soc)
+    rows = period_codes.T.tolist()  # je Stunde die Zeilen in ``periods``
+
+    for t, pv_t in enumerate(pv):
+        soc *= retention
+        np.subtract(pv_t, feed_limit, out=delta)
+
+        # Überschuss über dem Limit laden, begrenzt durch Ladeleistung und freien Platz
+        np.subtract(capacity, soc, out=flow)
+        flow /= eta_c
+        np.minimum(flow, charge_limit, out=flow)
+        np.minimum(flow, delta, out=flow)
+        np.maximum(flow, 0.0, out=flow)
+        flow *= eta_c
+        soc += flow
+
+        # Fehlende Leistung bis zum Limit entladen, begrenzt durch Entladeleistung und Reserve
+        np.subtract(soc, reserve, out=flow)
+        np.maximum(flow, 0.0, out=flow)
+        flow *= eta_d
+        np.minimum(flow, discharge_limit, out=flow)
+        np.negative(delta, out=delta)
+        np.minimum(flow, delta, out=flow)
+        np.maximum(flow, 0.0, out=flow)
+        total += flow
+        if discharge is not None:
+            discharge[t] = flow
+        for row in rows[t]:
+            periods[row] += flow
+        flow /= eta_d
+        soc -= flow
+
+    return total
+
+
+def _lossy_loop(pv, pv_row, capacity, eta_c, eta_d, charge_limit, discharge_limit, reserve,
+                retention, feed_limit, soc, discharge, keep_hourly, period_codes, periods):
+    """Dieselbe Rechnung als einfache Schleifen - Vorlage für den numba-Kern
+
+    Äußere Schleife über die Konfigurationen, innere über die Stunden, damit
+    der Ladestand im Register bleibt. ``pv`` hat eine Zeile je Profil,
+    ``pv_row`` ordnet jeder Konfiguration ihr Profil zu.
+    """
+    total = np.zeros(capacity.shape[0])
+    for i in range(capacity.shape[0]):
+        level = soc[i]
+        row = pv_row[i]
+        for t in range(pv.shape[1]):
+            level *= retention[i]
+            delta = pv[row, t] - feed_limit[i]
+            out = 0.0
+            if delta > 0.0:
+                charge = min(delta, charge_limit[i], (capacity[i] - level) / eta_c[i])
+                if charge > 0.0:
+                    level += charge * eta_c[i]
+            elif level > reserve[i]:
+                out = min(-delta, discharge_limit[i], (level - reserve[i]) * eta_d[i])
+                level -= out / eta_d[i]
+                total[i] += out
+            if keep_hourly:
+                discharge[t, i] = out
+            for k in range(period_codes.shape[0]):
+                periods[period_codes[k, t], i] += out
+        soc[i] = level
+    return total
+
+
+_lossy_compiled = None  # numba-Kern nach dem ersten Aufruf, False ohne numba
+
+
+def _compiled_kernel():
+    """numba-Kern oder None; numba wird erst beim ersten verlustbehafteten Durchlauf geladen"""
+    global _lossy_compiled
+    if _lossy_compiled is None:
+        try:
+            from numba import njit
+        except ImportError:  # optional: pip install .[fast]
+            _lossy_compiled = False
+        else:
+            _lossy_compiled = njit(cache=True, nogil=True)(_lossy_loop)
+    return _lossy_compiled or None
+
+
+def lossy_dispatch(pv_kw, params, feed_limit, soc_kwh=None, keep_hourly=False, period_codes=None,
+                   n_periods=0):
+    """Verlustbehaftete Speicher-Simulation für alle Konfigurationen
+
+    ``pv_kw`` ist ein gemeinsames Profil (Stunden) oder eines je
+    Konfiguration (Konfigurationen × Stunden). ``period_codes`` (Zuordnungen ×
+    Stunden) ordnet jeder Stunde Zeilen einer Summentabelle mit ``n_periods``
+    Zeilen zu, in die die Entladung im selben Durchlauf gebucht wird.
+
+    Liefert (entladene Energie je Konfiguration in kWh, stündliche Entladung
+    (Stunden × Konfigurationen) oder None, Ladestand am Ende, Entladung je
+    Zeitraum (Zeilen × Konfigurationen)). Ohne ``soc_kwh`` beginnt die
+    Batterie auf der Reserve.
+    """
+    pv = np.asarray(pv_kw, dtype=float)
+    n = params.capacity.shape[0]
+    if soc_kwh is None:
+        soc = params.reserve.copy()
+    else:
+        soc = np.array(np.broadcast_to(soc_kwh, (n,)), dtype=float)
+    hours = pv.shape[-1]
+    discharge = np.empty((hours, n)) if keep_hourly else None
+    if period_codes is None:
+        period_codes = np.empty((0, hours), dtype=np.int64)
+    period_codes = np.ascontiguousarray(period_codes, dtype=np.int64)
+    periods = np.zeros((n_periods, n))
+
+    kernel = _compiled_kernel()
+    if kernel is not None:
+        rows = np.atleast_2d(pv)
+        pv_row = np.zeros(n, dtype=np.int64) if pv.ndim == 1 else np.arange(n, dtype=np.int64)
+        total = kernel(np.ascontiguousarray(rows), pv_row, *params, feed_limit, soc,
+                                discharge if keep_hourly else np.empty((0, 0)), keep_hourly,
+                                period_codes, periods)
+    else:
+        steps = pv if pv.ndim == 1 else np.ascontiguousarray(pv.T)
+        total = _lossy_numpy(steps, params, feed_limit, soc, discharge, period_codes, periods)
+    return total, discharge, soc, periods
@@ -0,0 +1,290 @@
+"""Benchmarks der Hot Paths mit synthetischen PVGIS-Profilen (ohne Netzwerk)
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json      # Vergleich, Exit-Code 1 bei Regression
+
+Gemessen werden PVGIS-Cache (Abruf), Speicher-Simulation, Monatsaggregation,
+Amortisation und Rendering - skaliert über Profillänge, Anzahl
+Batteriekapazitäten und Anzahl Standorte.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import main
+from plotting import PREVIEW_DPI
+from pvgis_cache import PVGISCache, cache_key
+
+# Standard-Raster und verkürztes Raster (--quick)
+GRID = {'years': [1, 5, 20], 'capacities': [1, 3, 16], 'sites': [1, 8, 32],
+        'configurations': [1000, 100000], 'renders': [('png', PREVIEW_DPI), ('svg', PREVIEW_DPI), ('png', 300)]}
+QUICK_GRID = {'years': [1, 2], 'capacities': [1, 3], 'sites': [1, 4],
+              'configurations': [1000], 'renders': [('png', PREVIEW_DPI)]}
+
+STAGES = ('fetch', 'dispatch', 'aggregation', 'amortization', 'rendering')
+
+
+def synthetic_pvgis(years=1, peak_power_kwp=1.0, seed=0, start_year=2023, latitude=54.17):
+    """Stündliches Profil im Format von pvlib.iotools.get_pvgis_hourly (P in W)
+
+    Tages- und Jahresgang aus dem Sonnenstand, Bewölkung als zufälliger
+    Tagesfaktor. Zeitstempel wie bei PVGIS jeweils zur 10. Minute (UTC).
+    """
+    index = pd.date_range(f'{start_year}-01-01 00:10', f'{start_year + years - 1}-12-31 23:10',
+                          freq='h', tz='UTC')
+    rng = np.random.default_rng(seed)
+    day = index.dayofyear.to_numpy()
+    hour = index.hour.to_numpy() + index.minute.to_numpy() / 60
+
+    # Sonnenhöhe (vereinfacht, Ortszeit ~ UTC + 40 min)
+    declination = np.radians(23.44) * np.sin(2 * np.pi * (day - 81) / 365)
+    hour_angle = np.radians(15 * (hour + 0.65 - 12))
+    lat = np.radians(latitude)
+    elevation = np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    clear_sky = np.clip(elevation, 0, None) ** 1.2
+
+    clouds = np.repeat(rng.uniform(0.15, 1.0, len(index) // 24 + 1), 24)[:len(index)]
+    irradiance = 1000 * clear_sky * clouds
+    return pd.DataFrame({
+        'P': np.round(irradiance * peak_power_kwp * 0.85, 2),
+        'G(i)': np.round(irradiance, 2),
+        'H_sun': np.round(np.degrees(np.arcsin(np.clip(elevation, -1, 1))), 2),
+        'T2m': np.round(10 + 8 * np.sin(2 * np.pi * (day - 110) / 365) + rng.normal(0, 2, len(index)), 2),
+        'WS10m': np.round(rng.gamma(2.0, 2.0, len(index)), 2),
+        'Int': 0.0,
+    }, index=index)
+
+
+def _measure(func, repeat):
+    """Laufzeiten (s) von ``repeat`` Aufrufen"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _site_profiles(n_sites, years):
+    return [synthetic_pvgis(years, seed=site, latitude=47.5 + 7 * site / max(n_sites, 1))
+            for site in range(n_sites)]
+
+
+def _simulate_site(data, capacities):
+    """Alle Szenarien eines Standorts wie in main.run_scenarios simulieren"""
+    results = {}
+    for scenario_name, scenario_config in main.scenarios.items():
+        scaled = main.scale_system_data(data, scenario_config['peak_power'])
+        results[scenario_name] = dict(zip(main.battery_scenarios,
+                                          main.simulate_systems(scaled, capacities, main.max_feed_kw)))
+    return results
+
+
+def bench_fetch(grid, workdir):
+    """PVGIS-Cache: Speichern und Laden je Profillänge (ersetzt den Netzwerkabruf)"""
+    cache = PVGISCache(os.path.join(workdir, 'cache'))
+    for years in grid['years']:
+        data = synthetic_pvgis(years)
+        key = cache_key(main.latitude, main.longitude, 2023, 2022 + years, 'PVGIS-SARAH3',
+                        1.0, main.system_loss_percent, 35, 180)
+        yield 'fetch.store', {'years': years}, lambda: cache.store(key, data), len(data)
+        yield 'fetch.load', {'years': years}, lambda: cache.load(key), len(data)
+
+
+def bench_dispatch(grid, workdir):
+    """simulate_systems über Profillänge × Batteriekapazitäten (verlustfrei und mit Verlusten), und über Standorte"""
+    for years in grid['years']:
+        data = synthetic_pvgis(years)
+        for n_caps in grid['capacities']:
+            capacities = list(np.linspace(1.0, 10.0, n_caps))
+            yield ('dispatch.simulate_systems', {'years': years, 'capacities': n_caps},
+                   lambda: main.simulate_systems(data, capacities, main.max_feed_kw),
+                   len(data) * n_caps)
+            lossy = next(iter(main.battery_scenarios.values()))
+            batteries = [dict(lossy, capacity_kwh=c) for c in capacities]
+            yield ('dispatch.lossy', {'years': years, 'capacities': n_caps},
+                   lambda: main.simulate_systems(data, batteries, main.max_feed_kw),
+                   len(data) * n_caps)
+    capacities = list(main.battery_scenarios.values())
+    for n_sites in grid['sites']:
+        profiles = _site_profiles(n_sites, 1)
+        yield ('dispatch.sites', {'sites': n_sites},
+               lambda: [_simulate_site(data, capacities) for data in profiles],
+               sum(len(data) for data in profiles) * len(capacities) * len(main.scenarios))
+
+
+def bench_aggregation(grid, workdir):
+    """Monatssummen: fusionierte Zeitraum-Bins und pandas-resample zum Vergleich"""
+    from periods import MONTHLY, period_bins, reduce_periods
+
+    for years in grid['years']:
+        data = synthetic_pvgis(years)
+        pv = data['P'].to_numpy() / 1000
+        index = data.index
+        yield ('aggregation.period_bins', {'years': years},
+               lambda: reduce_periods(pv, period_bins(index, MONTHLY)), len(data))
+        yield ('aggregation.resample', {'years': years},
+               lambda: data['P'].resample(MONTHLY).sum(), len(data))
+        result = main.simulate_system(data, 4.096, main.max_feed_kw)
+        # Ergebnis ohne vorab berechnete Monatssummen, damit monthly wirklich rechnet
+        def monthly():
+            fresh = type(result)(result.index, result.values('P'), result.values('limited'),
+                                 result.values('buffered'))
+            return fresh.monthly, fresh.monthly_cum
+        yield 'aggregation.monthly', {'years': years}, monthly, len(data)
+
+
+def bench_amortization(grid, workdir):
+    """compute_amortization über die Anzahl Standorte, Zahlungsströme über die Anzahl Konfigurationen"""
+    capacities = list(main.battery_scenarios.values())
+    for n_sites in grid['sites']:
+        site_results = [_simulate_site(data, capacities) for data in _site_profiles(n_sites, 1)]
+        yield ('amortization.compute', {'sites': n_sites},
+               lambda: [main.compute_amortization(results) for results in site_results], n_sites)
+    model = main.get_cashflow_model()
+    rng = np.random.default_rng(0)
+    for n_configs in grid['configurations']:
+        investment = rng.uniform(500, 5000, n_configs)
+        annual_yield = rng.uniform(200, 4000, n_configs)
+        battery_kwh = rng.uniform(0, 8, n_configs)
+        yield ('amortization.cashflow', {'configurations': n_configs},
+               lambda: model.evaluate(investment, annual_yield, main.electricity_price, battery_kwh),
+               n_configs)
+
+
+def bench_rendering(grid, workdir):
+    """Analysegrafik je Format und Auflösung rendern (ohne Hash-Cache)"""
+    from plotting import GRID as FULL, RenderJob, _render, figure_data
+
+    results = _simulate_site(synthetic_pvgis(1), list(main.battery_scenarios.values()))
+    monthly_data, monthly_cum_data = main.aggregate_monthly(results)
+    linestyles = {name: config['linestyle'] for name, config in main.scenarios.items()}
+    data = figure_data(monthly_data, monthly_cum_data, main.compute_amortization(results),
+                       linestyles, main.electricity_price)
+    for fmt, dpi in grid['renders']:
+        job = RenderJob(data, os.path.join(workdir, f'analysis_{dpi}.{fmt}'), dpi, FULL)
+        yield 'rendering.figure', {'format': fmt, 'dpi': dpi}, lambda: _render(job), 1
+
+
+BENCHMARKS = {
+    'fetch': bench_fetch,
+    'dispatch': bench_dispatch,
+    'aggregation': bench_aggregation,
+    'amortization': bench_amortization,
+    'rendering': bench_rendering,
+}
+
+
+def run_benchmarks(stages=STAGES, grid=None, repeat=3, log=print):
+    """Alle Benchmarks der gewählten Stufen ausführen und als Dict (JSON-fähig) liefern"""
+    grid = grid or GRID
+    # Gemessen wird die Berechnung selbst, nicht der Stufen-Cache
+    previous = {name: getattr(main, name) for name in ('pipeline_cache_dir', 'pipeline_memory_entries')}
+    main.configure(pipeline_cache_dir='', pipeline_memory_entries=0)
+    records = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for stage in stages:
+                for name, params, func, units in BENCHMARKS[stage](grid, workdir):
+                    func()  # Aufwärmen (Imports, Caches)
+                    timings = _measure(func, repeat)
+                    best = min(timings)
+                    records.append({
+                        'name': name,
+                        'params': params,
+                        'repeat': repeat,
+                        'seconds_min': best,
+                        'seconds_median': statistics.median(timings),
+                        'units': units,
+                        'units_per_second': units / best if best > 0 else None,
+                    })
+                    log(f"{name:28s} {_format_params(params):28s} {best * 1000:10.2f} ms")
+    finally:
+        main.configure(**previous)
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'results': records,
+    }
+
+
+def _format_params(params):
+    return ' '.join(f'{key}={value}' for key, value in params.items())
+
+
+def _record_key(record):
+    return record['name'], tuple(sorted(record['params'].items()))
+
+
+def compare(current, baseline, tolerance=0.2):
+    """Mit gespeicherter Baseline vergleichen
+
+    Liefert eine Liste (Name, Parameter, Baseline-s, aktuell-s, Verhältnis)
+    für alle Messungen, die mehr als ``tolerance`` langsamer geworden sind.
+    """
+    reference = {_record_key(r): r for r in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        base = reference.get(_record_key(record))
+        if base is None or not base['seconds_min']:
+            continue
+        ratio = record['seconds_min'] / base['seconds_min']
+        if ratio > 1 + tolerance:
+            regressions.append((record['name'], record['params'], base['seconds_min'],
+                                record['seconds_min'], ratio))
+    return regressions
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks mit synthetischen PVGIS-Profilen")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"Kommagetrennte Auswahl aus {', '.join(STAGES)}")
+    parser.add_argument('--quick', action='store_true', help="Kleines Raster für schnelle Läufe")
+    parser.add_argument('--repeat', type=int, default=3, help="Messungen je Benchmark (Minimum zählt)")
+    parser.add_argument('--output', help="Ergebnisse als JSON speichern")
+    parser.add_argument('--baseline', help="JSON einer früheren Messung zum Vergleich")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Erlaubte Verlangsamung gegenüber der Baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unbekannte Stufe(n): {', '.join(sorted(unknown))}")
+
+    current = run_benchmarks(stages, QUICK_GRID if args.quick else GRID, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Ergebnisse gespeichert als '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} Regression(en) gegenüber '{args.baseline}':")
+            for name, params, before, after, ratio in regressions:
+                print(f"  {name} {_format_params(params)}: {before * 1000:.2f} ms -> "
+                      f"{after * 1000:.2f} ms ({ratio:.2f}x)")
+            return 1
+        print(f"\nKeine Regression gegenüber '{args.baseline}' (Toleranz {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,160 @@
+"""Mehrjährige Zahlungsströme für viele Konfigurationen auf einmal
+
+Je Konfiguration entsteht eine Zeile mit der Investition in Jahr 0 und den
+Nettoeinnahmen der Jahre 1..N (Ersparnis abzüglich Ersatz von Batterie und
+Wechselrichter). Preissteigerung, Degradation und Abzinsung kommen aus
+vorab berechneten Faktortabellen, sodass die Auswertung nur aus
+Array-Operationen über (Konfigurationen × Jahre) besteht.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+CashflowMetrics = namedtuple('CashflowMetrics', [
+    'npv', 'irr', 'payback_years', 'discounted_payback_years', 'simple_payback_years'])
+
+
+def replacement_years(lifetime_years, component_lifetime_years):
+    """Jahre (1..N-1), in denen ein Bauteil mit gegebener Lebensdauer ersetzt wird"""
+    if not component_lifetime_years:
+        return np.array([], dtype=int)
+    return np.arange(component_lifetime_years, lifetime_years, component_lifetime_years, dtype=int)
+
+
+def payback_years(cashflows):
+    """Jahr, in dem die kumulierten Zahlungen (Spalte 0 = Investition) null erreichen
+
+    Innerhalb des Jahres wird linear interpoliert; wird die Investition in
+    der Laufzeit nicht zurückverdient, ist das Ergebnis inf.
+    """
+    n = cashflows.shape[-1]
+    cumulative = np.cumsum(cashflows, axis=-1)
+    negative = cumulative < 0
+    # Erst nach dem letzten Jahr mit negativem Stand gilt die Anlage als amortisiert
+    last_negative = n - 1 - np.argmax(negative[..., ::-1], axis=-1)
+    paid = last_negative < n - 1
+    year = np.minimum(last_negative + 1, n - 1)
+    before = np.take_along_axis(cumulative, last_negative[..., np.newaxis], axis=-1)[..., 0]
+    in_year = np.take_along_axis(cashflows, year[..., np.newaxis], axis=-1)[..., 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = -before / in_year
+    payback = np.where(paid, last_negative + fraction, np.inf)
+    return np.where(negative.any(axis=-1), payback, 0.0)
+
+
+def irr(cashflows, low=-0.99, high=10.0, tol=1e-10, max_iterations=50):
+    """Interner Zinsfuß je Zeile (Jahre entlang der letzten Achse)
+
+    Newton-Verfahren für alle Zeilen gleichzeitig, abgesichert durch ein
+    Intervall [low, high], das bei jedem Schritt verkleinert wird. Gerechnet
+    wird nur noch mit Zeilen, die nicht konvergiert sind. Zeilen ohne
+    Vorzeichenwechsel des Kapitalwerts im Intervall liefern nan.
+    """
+    cashflows = np.asarray(cashflows, dtype=float)
+    shape = cashflows.shape[:-1]
+    flows = cashflows.reshape(-1, cashflows.shape[-1])
+
+    def npv_and_slope(rows, rate):
+        # Horner-Schema in x = 1 / (1 + rate), vom letzten Jahr rückwärts
+        x = 1.0 / (1.0 + rate)
+        npv = flows[rows, -1].copy()
+        slope = np.zeros_like(npv)
+        for column in range(flows.shape[1] - 2, -1, -1):
+            slope = slope * x + npv
+            npv = npv * x + flows[rows, column]
+        # d npv / d rate = d npv / dx · dx / d rate mit dx / d rate = -x²
+        return npv, -slope * x * x
+
+    everything = np.arange(flows.shape[0])
+    lo, hi = np.full(flows.shape[0], low), np.full(flows.shape[0], high)
+    sign_lo = np.sign(npv_and_slope(everything, lo)[0])
+    valid = sign_lo != np.sign(npv_and_slope(everything, hi)[0])
+
+    # Startwert: Verhältnis aus mittlerer Einnahme und Investition
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = flows[:, 1:].mean(axis=1) / -flows[:, 0]
+    rate = np.where(np.isfinite(rate), np.clip(rate, low, high), 0.0)
+    active = np.flatnonzero(valid)
+    for _ in range(max_iterations):
+        if active.size == 0:
+            break
+        current = rate[active]
+        npv, slope = npv_and_slope(active, current)
+        # Intervall verkleinern: Kapitalwert hat bei lo dasselbe Vorzeichen wie bei low
+        same = np.sign(npv) == sign_lo[active]
+        lo[active] = np.where(same, current, lo[active])
+        hi[active] = np.where(same, hi[active], current)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = current - npv / slope
+        inside = np.isfinite(newton) & (newton > lo[active]) & (newton < hi[active])
+        new_rate = np.where(inside, newton, (lo[active] + hi[active]) / 2)
+        rate[active] = new_rate
+        active = active[np.abs(new_rate - current) >= tol]
+    return np.where(valid, rate, np.nan).reshape(shape)
+
+
+class CashflowModel:
+    """Zahlungsströme über ``lifetime_years`` Jahre mit vorab berechneten Faktoren
+
+    Die Ersparnis im Jahr t ist Jahresertrag × Strompreis × (1 + Preissteigerung)^(t-1)
+    × (1 - Degradation)^(t-1). Die Degradation wirkt vereinfacht proportional
+    auf den Ertrag. Batterie und Wechselrichter werden nach ihrer Lebensdauer
+    zum heutigen Preis, angepasst um ``replacement_cost_change`` pro Jahr, ersetzt.
+    """
+
+    def __init__(self, lifetime_years=20, discount_rate=0.03, price_escalation=0.0,
+                 module_degradation=0.0, battery_lifetime_years=None, battery_cost_per_kwh=0.0,
+                 inverter_lifetime_years=None, inverter_cost=0.0, replacement_cost_change=0.0):
+        self.lifetime_years = lifetime_years
+        self.discount_rate = discount_rate
+        years = np.arange(1, lifetime_years + 1)
+
+        # Faktortabellen je Betriebsjahr (Index 0 = Jahr 1)
+        self.discount = (1 + discount_rate) ** -years.astype(float)
+        self.energy_factor = ((1 + price_escalation) * (1 - module_degradation)) ** (years - 1.0)
+        cost_factor = (1 + replacement_cost_change) ** years.astype(float)
+        self.battery_factor = np.zeros(lifetime_years)
+        self.battery_factor[replacement_years(lifetime_years, battery_lifetime_years) - 1] = 1.0
+        self.battery_factor *= battery_cost_per_kwh * cost_factor
+        self.inverter_costs = np.zeros(lifetime_years)
+        self.inverter_costs[replacement_years(lifetime_years, inverter_lifetime_years) - 1] = 1.0
+        self.inverter_costs *= inverter_cost * cost_factor
+
+    def cashflows(self, investment, annual_yield_kwh, electricity_price, battery_kwh=0.0):
+        """Zahlungsmatrix (Konfigurationen × Jahre 0..N); Eingaben werden gebroadcastet"""
+        investment, savings, battery_kwh = self._inputs(investment, annual_yield_kwh,
+                                                        electricity_price, battery_kwh)
+        return self._cashflows(investment, savings, battery_kwh)
+
+    @staticmethod
+    def _inputs(investment, annual_yield_kwh, electricity_price, battery_kwh):
+        return np.broadcast_arrays(
+            np.asarray(investment, dtype=float),
+            np.asarray(annual_yield_kwh, dtype=float) * np.asarray(electricity_price, dtype=float),
+            np.asarray(battery_kwh, dtype=float))
+
+    def _cashflows(self, investment, savings, battery_kwh):
+        flows = np.empty(investment.shape + (self.lifetime_years + 1,))
+        flows[..., 0] = -investment
+        flows[..., 1:] = (savings[..., np.newaxis] * self.energy_factor
+                          - battery_kwh[..., np.newaxis] * self.battery_factor
+                          - self.inverter_costs)
+        return flows
+
+    def evaluate(self, investment, annual_yield_kwh, electricity_price, battery_kwh=0.0):
+        """Kapitalwert, interner Zinsfuß und (abgezinste) Amortisationszeit je Konfiguration"""
+        investment, savings, battery_kwh = self._inputs(investment, annual_yield_kwh,
+                                                        electricity_price, battery_kwh)
+        flows = self._cashflows(investment, savings, battery_kwh)
+        discounted = flows.copy()
+        discounted[..., 1:] *= self.discount
+        # Statische Amortisation wie bisher: Investition / Ersparnis im ersten Jahr
+        with np.errstate(divide='ignore', invalid='ignore'):
+            simple = np.where(savings > 0, investment / savings, np.inf)
+        return CashflowMetrics(
+            npv=discounted.sum(axis=-1),
+            irr=irr(flows),
+            payback_years=payback_years(flows),
+            discounted_payback_years=payback_years(discounted),
+            simple_payback_years=simple,
+        )
@@ -0,0 +1,250 @@
+import numpy as np
+
+from battery import broadcast_params, lossy_dispatch, split_batteries
+from feed_limit import FeedLimitIndex
+from periods import reduce_periods
+
+
+def limit_feed(pv_kw, max_feed_kw):
+    """Einspeisung ohne Speicher: PV-Leistung auf das Einspeiselimit begrenzen"""
+    return np.minimum(np.asarray(pv_kw, dtype=float), max_feed_kw)
+
+
+def broadcast_configs(battery_capacities_kwh, max_feed_kw):
+    """Kapazitäten und Einspeiselimits zu gleich langen 1-D-Arrays broadcasten"""
+    capacity, feed_limit = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(battery_capacities_kwh, dtype=float)),
+        np.asarray(max_feed_kw, dtype=float)
+    )
+    return capacity.ravel(), feed_limit.ravel()
+
+
+def broadcast_batteries(batteries, max_feed_kw):
+    """Wie ``broadcast_configs``, aber Batterien dürfen Verlustparameter haben (``battery.Battery``)
+
+    Liefert (Kapazitäten, Einspeiselimits, LossParams oder None bei verlustfreien Batterien).
+    """
+    capacities, params = split_batteries(batteries)
+    capacity, feed_limit = broadcast_configs(capacities, max_feed_kw)
+    if params is not None:
+        params = broadcast_params(params, capacity.shape)
+    return capacity, feed_limit, params
+
+
+def dispatch_batch(pv_kw, battery_capacities_kwh, max_feed_kw):
+    """Speicher-Simulation für viele Batteriekapazitäten in einem Durchlauf
+
+    Kapazitäten und Einspeiselimits werden gegeneinander gebroadcastet. Das
+    Ergebnis ist ein 2-D-Array (Konfigurationen × Stunden) mit der gepufferten
+    Einspeisung in kW.
+    """
+    return dispatch_chunk(pv_kw, battery_capacities_kwh, max_feed_kw)[0]
+
+
+def dispatch_chunk(pv_kw, battery_capacities_kwh, max_feed_kw, soc_kwh=None):
+    """Wie ``dispatch_batch``, aber mit Anfangsladestand und Rückgabe des Endladestands
+
+    Damit lassen sich lange Zeitreihen abschnittsweise simulieren: der
+    zurückgegebene Ladestand wird als ``soc_kwh`` an den nächsten Abschnitt
+    übergeben. Liefert (gepufferte Einspeisung, Ladestand am Ende).
+    """
+    _, buffered, soc = dispatch_periods(pv_kw, battery_capacities_kwh, max_feed_kw, (),
+                                        soc_kwh=soc_kwh, keep_hourly=True)
+    return buffered, soc
+
+
+def dispatch_periods(pv_kw, battery_capacities_kwh, max_feed_kw, bins, soc_kwh=None,
+                     keep_hourly=False):
+    """Speicher-Simulation mit Zeitraumsummen im selben Durchlauf
+
+    ``bins`` ist eine Folge von ``PeriodBins`` (z.B. Monate, Tage, Wochen).
+    Die Entladung jeder Stunde wird direkt auf die Summe ihres Zeitraums
+    gebucht, stündliche Werte werden nur mit ``keep_hourly=True`` gehalten.
+
+    Liefert (Summen, gepufferte Einspeisung oder None, Ladestand am Ende).
+    Die Summen ordnen jeder Frequenz ein Dict mit 'unlimited' (Zeiträume)
+    sowie 'limited' und 'buffered' (Konfigurationen × Zeiträume) in kWh zu.
+    Batterien mit Verlustparametern laufen über ``battery.lossy_dispatch``.
+    """
+    pv = np.asarray(pv_kw, dtype=float)
+    capacity, feed_limit, params = broadcast_batteries(battery_capacities_kwh, max_feed_kw)
+
+    if params is not None:
+        # Alle Zeitraum-Bins in einer Summentabelle; der Kern bucht die Entladung direkt ein
+        offsets = np.cumsum([0] + [b.count for b in bins])
+        codes = np.array([b.codes + offset for b, offset in zip(bins, offsets)],
+                         dtype=np.int64).reshape(len(bins), pv.shape[0])
+        _, discharge, soc, periods = lossy_dispatch(pv, params, feed_limit, soc_kwh=soc_kwh,
+                                                    keep_hourly=keep_hourly, period_codes=codes,
+                                                    n_periods=offsets[-1])
+        accumulators = [(periods[a:b], None) for a, b in zip(offsets[:-1], offsets[1:])]
+    else:
+        soc, discharge, accumulators = _lossless_periods(pv, capacity, feed_limit, bins, soc_kwh,
+                                                         keep_hourly)
+
+    # Begrenzte Einspeisung je Zeitraum: nur einmal je unterschiedlichem Limit
+    limits, inverse = np.unique(feed_limit, return_inverse=True)
+    aggregates = {}
+    for b, (period_discharge, _) in zip(bins, accumulators):
+        limited = np.array([reduce_periods(np.minimum(pv, limit), b) for limit in limits])[inverse]
+        aggregates[b.freq] = {
+            'unlimited': reduce_periods(pv, b),
+            'limited': limited,
+            'buffered': limited + period_discharge.T,
+        }
+
+    buffered = np.minimum.outer(feed_limit, pv) + discharge.T if keep_hourly else None
+    return aggregates, buffered, soc
+
+
+def _lossless_periods(pv, capacity, feed_limit, bins, soc_kwh, keep_hourly):
+    """Verlustfreie Stundenschleife von ``dispatch_periods``
+
+    Liefert (Ladestand am Ende, stündliche Entladung oder None,
+    [(Entladung je Zeitraum × Konfiguration, Codes)] je Zeitraum-Bins).
+    """
+    # Speicher-Simulation: Ladestand = Überschuss aufsummiert, begrenzt auf [0, Kapazität]
+    if soc_kwh is None:
+        soc = np.zeros(capacity.shape)  # Batterie zu Beginn leer
+    else:
+        soc = np.array(np.broadcast_to(soc_kwh, capacity.shape), dtype=float)
+    new_soc = np.empty_like(soc)
+    step = np.empty_like(soc)
+    discharge = np.empty((pv.shape[0], capacity.shape[0])) if keep_hourly else None
+    accumulators = [(np.zeros((b.count, capacity.shape[0])), b.codes.tolist()) for b in bins]
+
+    for t, pv_t in enumerate(pv):
+        np.subtract(pv_t, feed_limit, out=new_soc)
+        new_soc += soc
+        np.clip(new_soc, 0.0, capacity, out=new_soc)
+        # Entladung = Rückgang des Ladestands (nur wenn PV unter dem Limit liegt)
+        if keep_hourly:
+            step = discharge[t]
+        np.subtract(soc, new_soc, out=step)
+        np.maximum(step, 0.0, out=step)
+        for period_discharge, codes in accumulators:
+            period_discharge[codes[t]] += step
+        soc, new_soc = new_soc, soc
+    return soc, discharge, accumulators
+
+
+def dispatch_totals(pv_kw, battery_capacities_kwh, max_feed_kw):
+    """Jahressumme der gepufferten Einspeisung (kWh) je Konfiguration
+
+    Wie ``dispatch_batch``, hält aber keine Stundenwerte im Speicher und eignet
+    sich daher für sehr viele Konfigurationen auf einmal. ``pv_kw`` ist
+    entweder ein gemeinsames Profil (Stunden) oder ein eigenes Profil je
+    Konfiguration (Konfigurationen × Stunden, z.B. verschiedene Standorte).
+    """
+    pv = np.asarray(pv_kw, dtype=float)
+    capacity, feed_limit, params = broadcast_batteries(battery_capacities_kwh, max_feed_kw)
+    if pv.ndim == 2:
+        capacity, feed_limit, _ = np.broadcast_arrays(capacity, feed_limit, pv[:, 0])
+        hours = np.ascontiguousarray(pv.T)  # eine Zeile je Stunde für die Schleife
+        limited = np.minimum(pv, feed_limit[:, np.newaxis]).sum(axis=1)
+    else:
+        hours = pv
+        limited = limited_totals(pv, feed_limit)
+    if params is not None:
+        params = broadcast_params(params, capacity.shape)
+        return limited + lossy_dispatch(pv, params, np.ascontiguousarray(feed_limit))[0]
+
+    soc = np.zeros(capacity.shape)
+    new_soc = np.empty_like(soc)
+    step = np.empty_like(soc)
+    discharged = np.zeros_like(soc)
+
+    for pv_t in hours:
+        np.subtract(pv_t, feed_limit, out=new_soc)
+        new_soc += soc
+        np.clip(new_soc, 0.0, capacity, out=new_soc)
+        np.subtract(soc, new_soc, out=step)
+        np.maximum(step, 0.0, out=step)
+        discharged += step
+        soc, new_soc = new_soc, soc
+
+    return limited + discharged
+
+
+def limited_totals(pv_kw, max_feed_kw):
+    """Jahressumme von min(PV, Limit) für viele Einspeiselimits über sortierte Präfixsummen"""
+    return FeedLimitIndex(np.asarray(pv_kw, dtype=float)).limited_yield(max_feed_kw)
+
+
+def _simplify(xs, ys, tol=1e-9):
+    """Doppelte Stützstellen und kollineare Zwischenpunkte entfernen"""
+    keep = np.concatenate(([True], np.diff(xs) > tol))
+    xs, ys = xs[keep], ys[keep]
+    if xs.shape[0] <= 2:
+        return xs, ys
+    slopes = np.diff(ys) / np.diff(xs)
+    bend = np.abs(np.diff(slopes)) > tol
+    keep = np.concatenate(([True], bend, [True]))
+    return xs[keep], ys[keep]
+
+
+def _add_pl(xa, ya, xb, yb):
+    """Zwei stückweise lineare Funktionen auf gemeinsamen Stützstellen addieren"""
+    xs = np.union1d(xa, xb)
+    return _simplify(xs, np.interp(xs, xa, ya) + np.interp(xs, xb, yb))
+
+
+def _charge(xs, ys, surplus):
+    """Ladestand-Funktion nach einer Überschussphase: min(soc + Überschuss, C)"""
+    g = ys + surplus
+    over = g - xs  # monoton fallend, da soc(C) nur Steigung 0 oder 1 hat
+    k = np.argmax(over <= 0)
+    if over[k] > 0:
+        return xs, xs.copy()  # Batterie für alle Kapazitäten voll
+    c = xs[k - 1] + over[k - 1] / (over[k - 1] - over[k]) * (xs[k] - xs[k - 1])
+    return _simplify(np.concatenate(([0.0, c], xs[k:])), np.concatenate(([0.0, c], g[k:])))
+
+
+def _discharge(xs, ys, needed):
+    """Ladestand-Funktion nach einer Defizitphase: max(soc - Bedarf, 0)"""
+    h = ys - needed  # monoton steigend
+    k = np.argmax(h > 0)
+    if h[k] <= 0:
+        return np.array([0.0, xs[-1]]), np.zeros(2)  # Batterie für alle Kapazitäten leer
+    c = xs[k - 1] - h[k - 1] / (h[k] - h[k - 1]) * (xs[k] - xs[k - 1])
+    return _simplify(np.concatenate(([0.0, c], xs[k:])), np.concatenate(([0.0, 0.0], h[k:])))
+
+
+def yield_capacity_curve(pv_kw, max_feed_kw, max_capacity_kwh):
+    """Exakter Jahresertrag als Funktion der Batteriekapazität in einem Durchlauf
+
+    Der Ladestand ist für jede Stunde eine stückweise lineare, monoton
+    steigende Funktion der Kapazität C mit Steigung 0 oder 1. Statt für jede
+    Kapazität neu zu simulieren, wird diese Funktion über Stützstellen
+    fortgeschrieben. Aufeinanderfolgende Stunden mit Überschuss bzw. Defizit
+    werden zu je einem Schritt zusammengefasst, da innerhalb einer solchen
+    Phase nur eine der beiden Grenzen greifen kann.
+
+    Liefert die Stützstellen (Kapazitäten, Jahresertrag in kWh) einer
+    stückweise linearen Kurve auf [0, max_capacity_kwh]; Zwischenwerte per
+    ``np.interp``.
+    """
+    pv = np.asarray(pv_kw, dtype=float)
+    base = limited_totals(pv, max_feed_kw)
+    if max_capacity_kwh <= 0:
+        return np.array([0.0]), np.array([base])
+
+    # Stunden zu Phasen gleichen Vorzeichens zusammenfassen
+    delta = pv - max_feed_kw
+    surplus = delta > 0
+    starts = np.flatnonzero(np.concatenate(([True], surplus[1:] != surplus[:-1])))
+    phase_sums = np.add.reduceat(delta, starts)
+
+    xs, ys = np.array([0.0, float(max_capacity_kwh)]), np.zeros(2)
+    dis_xs, dis_ys = xs.copy(), np.zeros(2)  # kumulierte Entladung je Kapazität
+    for amount in phase_sums:
+        if amount > 0:
+            xs, ys = _charge(xs, ys, amount)
+        elif amount < 0:
+            new_xs, new_ys = _discharge(xs, ys, -amount)
+            drop_xs = np.union1d(xs, new_xs)
+            drop_ys = np.interp(drop_xs, xs, ys) - np.interp(drop_xs, new_xs, new_ys)
+            dis_xs, dis_ys = _add_pl(dis_xs, dis_ys, drop_xs, drop_ys)
+            xs, ys = new_xs, new_ys
+
+    return dis_xs, base + dis_ys
@@ -0,0 +1,186 @@
+"""Spaltenweiser, komprimierter Export der Ergebnisse als Parquet-Datensätze
+
+Stundenwerte, Monatssummen und Amortisation aller Szenarien landen in
+Hive-partitionierten Verzeichnissen, die pyarrow.dataset, pandas, DuckDB
+oder Spark direkt lesen können:
+
+    <ziel>/hourly/site=54.17_9.38/year=2023/peak_power_kwp=2.0/part-0.parquet
+    <ziel>/monthly/site=.../year=.../peak_power_kwp=.../part-0.parquet
+    <ziel>/amortization/site=.../year=.../peak_power_kwp=.../part-0.parquet
+
+Geschrieben wird je Szenario und innerhalb eines Szenarios je Batterie als
+eigene Row Group, sodass nie mehr als eine Konfiguration als Tabelle im
+Speicher liegt. Große Tabellen (Flotte, Parameter-Sweep) schreibt
+``write_frame`` ebenfalls blockweise.
+
+pyarrow ist optional: ``pip install .[export]``.
+"""
+import os
+import tempfile
+from urllib.parse import quote
+
+import numpy as np
+
+from instrumentation import stage
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: pip install .[export]
+    pa = ds = pq = None
+
+DEFAULT_COMPRESSION = 'zstd'
+# Zeilen je Row Group für große Tabellen (write_frame)
+DEFAULT_ROW_GROUP_SIZE = 256 * 1024
+
+PART_NAME = 'part-0.parquet'
+
+# Spalten der Stundenwerte (kW) und ihre Quelle im SimulationResult
+HOURLY_COLUMNS = {'pv': 'P', 'limited': 'limited', 'buffered': 'buffered'}
+
+
+def site_name(latitude, longitude):
+    """Partitionswert eines Standorts, z.B. '54.17_9.38'"""
+    return f'{latitude:g}_{longitude:g}'
+
+
+def open_dataset(directory, dataset):
+    """Exportierten Datensatz ('hourly', 'monthly', 'amortization') mit typisierten Partitionen öffnen
+
+    Ohne Schema würde pyarrow ``peak_power_kwp`` als Text lesen.
+    """
+    partitioning = ds.partitioning(pa.schema([
+        ('site', pa.string()), ('year', pa.int32()), ('peak_power_kwp', pa.float64())]), flavor='hive')
+    return ds.dataset(os.path.join(directory, dataset), format='parquet', partitioning=partitioning)
+
+
+def _partition_path(directory, dataset, partition):
+    # Werte URI-kodiert wie von pyarrow für Hive-Partitionen erwartet
+    parts = [f'{key}={quote(str(value), safe="")}' for key, value in partition.items()]
+    return os.path.join(directory, dataset, *parts)
+
+
+class ParquetExport:
+    """Ergebnisse als Parquet-Datensätze schreiben, z.B. je Standort und Wetterjahr
+
+    ``partition`` (z.B. ``site=..., year=...``) gilt für alle geschriebenen
+    Dateien, die Methoden fügen ihre eigenen Partitionen hinzu. Jede Datei
+    wird zunächst unter einem temporären Namen geschrieben und dann atomar
+    an ihren Platz verschoben; ein erneuter Export ersetzt die Partition.
+    ``files`` und ``bytes_written`` beschreiben das Ergebnis.
+    """
+
+    def __init__(self, directory, compression=DEFAULT_COMPRESSION, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 **partition):
+        if pq is None:
+            raise RuntimeError("Parquet-Export benötigt pyarrow (pip install .[export])")
+        self.directory = directory
+        self.partition = partition
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.files = []
+        self.bytes_written = 0
+
+    def _writer_target(self, dataset, partition):
+        directory = _partition_path(self.directory, dataset, dict(self.partition, **partition))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        return tmp_path, os.path.join(directory, PART_NAME)
+
+    def _write_tables(self, dataset, partition, schema, tables):
+        """Tabellen nacheinander als Row Groups einer Datei schreiben (atomar)"""
+        tmp_path, path = self._writer_target(dataset, partition)
+        rows = 0
+        with stage('export', dataset=dataset) as s:
+            try:
+                with pq.ParquetWriter(tmp_path, schema, compression=self.compression) as writer:
+                    for table in tables:
+                        writer.write_table(table, row_group_size=self.row_group_size)
+                        rows += table.num_rows
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            size = os.path.getsize(path)
+            s.count(rows=rows, export_bytes=size)
+        self.files.append(path)
+        self.bytes_written += size
+        return path
+
+    def write_scenario(self, scenario_name, peak_power_kwp, battery_results, battery_kwh):
+        """Stundenwerte und Monatssummen eines Szenarios (alle Batterien)
+
+        ``battery_results`` ordnet jeder Batterie ihr ``SimulationResult`` zu,
+        ``battery_kwh`` jeder Batterie ihre Kapazität.
+        """
+        partition = {'peak_power_kwp': peak_power_kwp}
+        names = list(battery_results)
+        battery_type = pa.dictionary(pa.int32(), pa.string())
+
+        def labelled(name, length):
+            # Batterie als Dictionary-Spalte: je Zeile nur ein Index
+            indices = np.full(length, names.index(name), dtype=np.int32)
+            return {
+                'scenario': pa.array(np.full(length, scenario_name, dtype=object), pa.string()),
+                'battery': pa.DictionaryArray.from_arrays(indices, pa.array(names, pa.string())),
+                'battery_kwh': pa.array(np.full(length, float(battery_kwh[name]))),
+            }
+
+        def hourly():
+            for name, result in battery_results.items():
+                time = pa.array(result.index)
+                columns = labelled(name, len(time))
+                columns['time'] = time
+                for column, source in HOURLY_COLUMNS.items():
+                    columns[column] = pa.array(result.values(source))
+                yield pa.table(columns, schema=hourly_schema)
+
+        def monthly():
+            for name, result in battery_results.items():
+                sums = result.monthly
+                columns = labelled(name, len(sums))
+                columns['month'] = pa.array(sums.index)
+                for column in ('unlimited', 'limited', 'buffered'):
+                    columns[column] = pa.array(sums[column].to_numpy(dtype=float))
+                yield pa.table(columns, schema=monthly_schema)
+
+        first = next(iter(battery_results.values()))
+        value_type = pa.from_numpy_dtype(first.values('buffered').dtype)
+        hourly_schema = pa.schema([
+            ('scenario', pa.string()), ('battery', battery_type), ('battery_kwh', pa.float64()),
+            ('time', pa.array(first.index[:0]).type),
+        ] + [(column, value_type) for column in HOURLY_COLUMNS])
+        monthly_schema = pa.schema([
+            ('scenario', pa.string()), ('battery', battery_type), ('battery_kwh', pa.float64()),
+            ('month', pa.array(first.monthly.index[:0]).type),
+            ('unlimited', pa.float64()), ('limited', pa.float64()), ('buffered', pa.float64()),
+        ])
+        self._write_tables('hourly', partition, hourly_schema, hourly())
+        self._write_tables('monthly', partition, monthly_schema, monthly())
+
+    def write_amortization(self, scenario_name, peak_power_kwp, options, battery_kwh):
+        """Amortisation eines Szenarios: eine Zeile je Speicheroption
+
+        ``options`` ist der Eintrag des Szenarios aus ``main.compute_amortization``,
+        ``battery_kwh`` die Kapazität je Option.
+        """
+        names = list(options)
+        columns = {
+            'scenario': [scenario_name] * len(names),
+            'option': names,
+            'battery_kwh': [float(battery_kwh[name]) for name in names],
+        }
+        for key in next(iter(options.values())):
+            columns[key] = [float(options[name][key]) for name in names]
+        table = pa.table(columns)
+        self._write_tables('amortization', {'peak_power_kwp': peak_power_kwp}, table.schema, [table])
+
+    def write_frame(self, dataset, frame, **partition):
+        """Große Tabelle (z.B. Flotte oder Parameter-Sweep) blockweise als ein Datensatz schreiben"""
+        schema = pa.Schema.from_pandas(frame.iloc[:0], preserve_index=False)
+        chunks = (pa.Table.from_pandas(frame.iloc[start:start + self.row_group_size], schema=schema,
+                                       preserve_index=False)
+                  for start in range(0, len(frame), self.row_group_size))
+        return self._write_tables(dataset, partition, schema, chunks)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+
+class FeedLimitIndex:
+    """Sortierte Leistungs-Dauerlinie mit Präfixsummen für Einspeiselimit-Abfragen
+
+    Beantwortet "Ertrag mit Limit X" und "abgeregelte Energie bei Limit X"
+    ohne Speicher für beliebige X in O(log n), optional auch je Monat.
+    """
+
+    def __init__(self, pv_kw, index=None, dt_hours=1.0):
+        if index is None and isinstance(pv_kw, pd.Series):
+            index = pv_kw.index
+        values = np.asarray(pv_kw, dtype=float) * dt_hours
+        self.dt_hours = dt_hours
+        self._sorted, self._prefix = self._build(values)
+        self.total = self._prefix[-1]
+
+        self.months = None
+        if index is not None:
+            index = pd.DatetimeIndex(index)
+            codes = index.year * 12 + index.month - 1
+            self._month_codes, inverse = np.unique(codes.to_numpy(), return_inverse=True)
+            self.months = pd.DatetimeIndex([
+                pd.Timestamp(year=c // 12, month=c % 12 + 1, day=1) + pd.offsets.MonthEnd(0)
+                for c in self._month_codes
+            ], tz=index.tz)
+            # Je Monat eigene Dauerlinie, hintereinander in einem Array abgelegt
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(self._month_codes) + 1))
+            grouped = values[order]
+            self._monthly = [self._build(grouped[a:b]) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    @staticmethod
+    def _build(values):
+        ordered = np.sort(values)
+        return ordered, np.concatenate(([0.0], np.cumsum(ordered)))
+
+    def _limited(self, ordered, prefix, limits):
+        # Stunden unter dem Limit zählen voll, alle anderen mit dem Limit selbst
+        energy_limits = limits * self.dt_hours
+        below = np.searchsorted(ordered, energy_limits, side='right')
+        return prefix[below] + energy_limits * (ordered.shape[0] - below)
+
+    def duration_curve(self):
+        """Leistungs-Dauerlinie: Leistungswerte absteigend sortiert (kW)"""
+        return self._sorted[::-1] / self.dt_hours
+
+    def limited_yield(self, max_feed_kw):
+        """Jahresertrag in kWh mit Einspeiselimit (Skalar oder Array)"""
+        return self._limited(self._sorted, self._prefix, np.asarray(max_feed_kw, dtype=float))
+
+    def curtailed_energy(self, max_feed_kw):
+        """Durch das Einspeiselimit abgeregelte Energie in kWh"""
+        return self.total - self.limited_yield(max_feed_kw)
+
+    def monthly_limited_yield(self, max_feed_kw):
+        """Monatlicher Ertrag mit Limit (Zeilen: Monatsende, Spalten: Limits)"""
+        if self.months is None:
+            raise ValueError("Für Monatswerte muss ein Zeitindex angegeben werden")
+        limits = np.atleast_1d(np.asarray(max_feed_kw, dtype=float))
+        rows = [self._limited(ordered, prefix, limits) for ordered, prefix in self._monthly]
+        return pd.DataFrame(rows, index=self.months, columns=limits)
+
+    def monthly_curtailed_energy(self, max_feed_kw):
+        """Monatlich abgeregelte Energie (Zeilen: Monatsende, Spalten: Limits)"""
+        limited = self.monthly_limited_yield(max_feed_kw)
+        totals = np.array([prefix[-1] for _, prefix in self._monthly])
+        return limited.rsub(totals, axis=0)
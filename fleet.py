@@ -0,0 +1,242 @@
+"""Flottenauswertung: viele Standorte mit eigener Anlage und eigenem Tarif auf einmal
+
+    python fleet.py standorte.csv --output angebote.csv
+
+Die Standorttabelle braucht die Spalten ``latitude``, ``longitude`` und
+``peak_power_kwp``. Optional sind ``battery_kwh``, ``max_feed_kw``,
+``electricity_price``, ``investment`` (sonst aus der Preistabelle), ``year``,
+``loss``, ``surface_tilt`` und ``surface_azimuth``. Verlustparameter der
+Batterie stehen optional in den Spalten von ``BATTERY_COLUMNS`` (ohne Angabe
+verlustfrei). Ergebnis ist eine Zeile je Standort.
+"""
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from battery import Battery
+from cashflow import CashflowModel
+from dispatch import dispatch_totals
+from instrumentation import stage
+
+# Standardwerte für fehlende Spalten der Standorttabelle
+SITE_DEFAULTS = {
+    'battery_kwh': 0.0,
+    'max_feed_kw': 0.8,
+    'electricity_price': 0.36,
+    'year': 2023,
+    'loss': 15,
+    'surface_tilt': 35,
+    'surface_azimuth': 180,
+}
+REQUIRED_COLUMNS = ('latitude', 'longitude', 'peak_power_kwp')
+
+# Optionale Verlustparameter der Batterie (siehe battery.Battery); fehlende Werte wie dort
+BATTERY_COLUMNS = Battery._fields[1:]
+
+# Profilspalten, die einen gemeinsamen PVGIS-Abruf bestimmen
+PROFILE_COLUMNS = ('latitude', 'longitude', 'year', 'loss', 'surface_tilt', 'surface_azimuth')
+
+# Arbeitsspeicher je Standort und Stunde: Profil, transponierte Kopie und min(PV, Limit)
+BYTES_PER_SITE_HOUR = 3 * 8
+
+
+def prepare_sites(sites):
+    """Standorttabelle prüfen und fehlende Spalten mit Standardwerten füllen"""
+    missing = [column for column in REQUIRED_COLUMNS if column not in sites.columns]
+    if missing:
+        raise ValueError(f"Standorttabelle ohne Spalte(n): {', '.join(missing)}")
+    sites = sites.copy()
+    for column, default in SITE_DEFAULTS.items():
+        if column not in sites.columns:
+            sites[column] = default
+        else:
+            sites[column] = sites[column].fillna(default)
+    for column in BATTERY_COLUMNS:
+        if column in sites.columns:
+            sites[column] = sites[column].fillna(Battery._field_defaults[column])
+    return sites
+
+
+def site_batteries(sites):
+    """Batterie je Standort: Kapazitäten oder, mit Verlustspalten, eine ``battery.Battery`` je Standort"""
+    capacity = sites['battery_kwh'].to_numpy(dtype=float)
+    columns = [column for column in BATTERY_COLUMNS if column in sites.columns]
+    if not columns:
+        return capacity
+    values = sites[columns].to_numpy(dtype=float)
+    return [Battery(c, **dict(zip(columns, row))) for c, row in zip(capacity.tolist(), values.tolist())]
+
+
+def load_profiles(sites, fetcher):
+    """1 kWp-Referenzprofile (kW) je unterschiedlicher Lage/Ausrichtung abrufen
+
+    Liefert (Profile als Liste von Arrays, Profilnummer je Standort).
+    Standorte mit gleichen Profilparametern teilen sich einen Abruf.
+    """
+    from pvgis_fetch import FetchJob
+
+    keys = sites[list(PROFILE_COLUMNS)].apply(tuple, axis=1)
+    unique_keys = list(dict.fromkeys(keys))
+    profile_of = {key: i for i, key in enumerate(unique_keys)}
+    jobs = [FetchJob(latitude, longitude, int(year), peakpower=1.0, loss=loss,
+                     surface_tilt=tilt, surface_azimuth=azimuth)
+            for latitude, longitude, year, loss, tilt, azimuth in unique_keys]
+
+    profiles = []
+    for result in fetcher.fetch_ordered(jobs):
+        if result.error is not None:
+            raise result.error
+        profiles.append(result.data['P'].to_numpy(dtype=float) / 1000)
+    return profiles, keys.map(profile_of).to_numpy()
+
+
+def _evaluate_chunk(profiles, profile_index, peak_power_kwp, batteries, max_feed_kw):
+    """Jahreserträge für einen Block von Standorten (läuft auch im Worker-Prozess)"""
+    pv = np.stack([profiles[i] for i in profile_index]) * peak_power_kwp[:, np.newaxis]
+    unlimited = pv.sum(axis=1)
+    limited = np.minimum(pv, max_feed_kw[:, np.newaxis]).sum(axis=1)
+    buffered = dispatch_totals(pv, batteries, max_feed_kw)
+    return unlimited, limited, buffered
+
+
+def _chunks(profiles, profile_index, memory_budget_bytes, processes):
+    """Standorte in Blöcke gleicher Profillänge und begrenzter Größe aufteilen"""
+    lengths = np.array([len(profiles[i]) for i in profile_index])
+    for length in np.unique(lengths):
+        members = np.flatnonzero(lengths == length)
+        size = max(1, memory_budget_bytes // (int(length) * BYTES_PER_SITE_HOUR))
+        # Mindestens ein Block je Prozess, damit alle Kerne arbeiten
+        size = min(size, -(-len(members) // processes))
+        for start in range(0, len(members), size):
+            yield members[start:start + size]
+
+
+def simulate_fleet(sites, profiles, profile_index, processes=None, memory_budget_mb=512):
+    """Jahreserträge (kWh) aller Standorte: ohne Limit, mit Limit, mit Limit und Speicher
+
+    Die Standorte werden als (Standorte × Stunden)-Block simuliert. Blöcke
+    sind so groß, dass sie ``memory_budget_mb`` nicht überschreiten, und
+    werden auf ``processes`` Prozesse verteilt.
+    """
+    peak = sites['peak_power_kwp'].to_numpy(dtype=float)
+    batteries = site_batteries(sites)
+    feed = sites['max_feed_kw'].to_numpy(dtype=float)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    chunks = list(_chunks(profiles, profile_index, memory_budget_mb * 1024 * 1024, processes))
+    processes = max(1, min(processes, len(chunks)))
+
+    def arguments(members):
+        # Nur die im Block benötigten Profile an den Worker schicken
+        used, local_index = np.unique(profile_index[members], return_inverse=True)
+        battery = ([batteries[i] for i in members] if isinstance(batteries, list)
+                   else batteries[members])
+        return [profiles[i] for i in used], local_index, peak[members], battery, feed[members]
+
+    totals = np.zeros((3, len(sites)))
+    with stage('fleet_simulate') as s:
+        if processes == 1:
+            parts = (_evaluate_chunk(*arguments(members)) for members in chunks)
+            for members, part in zip(chunks, parts):
+                totals[:, members] = part
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(_evaluate_chunk, *arguments(members)) for members in chunks]
+                for members, future in zip(chunks, futures):
+                    totals[:, members] = future.result()
+        s.count(rows=sum(len(profiles[i]) for i in profile_index), sites=len(sites), chunks=len(chunks))
+    return totals
+
+
+def evaluate_fleet(sites, profiles=None, profile_index=None, price_model=None, fetcher=None,
+                   processes=None, memory_budget_mb=512, cashflow_model=None):
+    """Ertrag und Wirtschaftlichkeit je Standort als Tabelle (eine Zeile je Standort)
+
+    Ohne ``profiles`` werden die Referenzprofile über ``fetcher`` geladen.
+    Fehlt die Spalte ``investment``, kommt die Investition aus ``price_model``.
+    Kapitalwert, interner Zinsfuß und dynamische Amortisationszeit berechnet
+    ``cashflow_model`` (Standard: ``cashflow.CashflowModel()``).
+    """
+    sites = prepare_sites(sites)
+    if profiles is None:
+        profiles, profile_index = load_profiles(sites, fetcher)
+    unlimited, limited, buffered = simulate_fleet(sites, profiles, np.asarray(profile_index),
+                                                  processes=processes,
+                                                  memory_budget_mb=memory_budget_mb)
+
+    with stage('fleet_amortization'):
+        investment = sites.get('investment', pd.Series(np.nan, index=sites.index)).astype(float)
+        if investment.isna().any():
+            if price_model is None:
+                raise ValueError("Ohne Spalte 'investment' wird ein price_model benötigt")
+            quoted = price_model(sites['peak_power_kwp'].to_numpy(dtype=float),
+                                 sites['battery_kwh'].to_numpy(dtype=float))
+            investment = investment.fillna(pd.Series(quoted, index=sites.index))
+        investment = investment.to_numpy(dtype=float)
+
+        price = sites['electricity_price'].to_numpy(dtype=float)
+        savings = buffered * price
+        with np.errstate(divide='ignore', invalid='ignore'):
+            payback = np.where(savings > 0, investment / savings, np.inf)
+        if cashflow_model is None:
+            cashflow_model = CashflowModel()
+        metrics = cashflow_model.evaluate(investment, buffered, price,
+                                          sites['battery_kwh'].to_numpy(dtype=float))
+
+    result = sites.copy()
+    result['annual_pv_kwh'] = unlimited
+    result['annual_limited_kwh'] = limited
+    result['annual_yield_kwh'] = buffered
+    result['investment'] = investment
+    result['annual_savings'] = savings
+    result['payback_years'] = payback
+    result['npv'] = metrics.npv
+    result['irr'] = metrics.irr
+    result['discounted_payback_years'] = metrics.discounted_payback_years
+    return result
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Ertrag und Amortisation für eine Standorttabelle (CSV)")
+    parser.add_argument('sites', help="CSV mit einer Zeile je Standort")
+    parser.add_argument('--output', help="Ergebnis als CSV speichern (sonst Ausgabe auf stdout)")
+    parser.add_argument('--export', help="Ergebnis zusätzlich als Parquet in dieses Verzeichnis schreiben")
+    parser.add_argument('--processes', type=int, help="Anzahl Prozesse (Standard: alle Kerne)")
+    parser.add_argument('--memory-mb', type=int, default=512, help="Speicherbudget je Block in MB")
+    parser.add_argument('--workers', type=int, default=8, help="Parallele PVGIS-Abfragen")
+    parser.add_argument('--cache-dir', help="Verzeichnis des PVGIS-Caches")
+    parser.add_argument('--offline', action='store_true', default=None,
+                        help="Nur Cache verwenden, bei fehlendem Eintrag abbrechen")
+    args = parser.parse_args(argv)
+
+    import main
+    from pvgis_fetch import PVGISFetcher
+
+    overrides = {'pvgis_cache_dir': args.cache_dir, 'offline': args.offline}
+    main.configure(**{name: value for name, value in overrides.items() if value is not None})
+
+    sites = pd.read_csv(args.sites)
+    with PVGISFetcher(max_workers=args.workers, cache=main.get_pvgis_cache()) as fetcher:
+        result = evaluate_fleet(sites, price_model=main.get_price_model(), fetcher=fetcher,
+                                processes=args.processes, memory_budget_mb=args.memory_mb,
+                                cashflow_model=main.get_cashflow_model())
+    if args.export:
+        from export import ParquetExport
+
+        path = ParquetExport(args.export, compression=main.export_compression).write_frame('fleet', result)
+        print(f"{len(result)} Standorte gespeichert als '{path}'", file=sys.stderr)
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"{len(result)} Standorte gespeichert als '{args.output}'")
+    else:
+        result.to_csv(sys.stdout, index=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
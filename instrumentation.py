@@ -0,0 +1,220 @@
+"""Laufzeitmessung je Verarbeitungsstufe (Abruf, Simulation, Aggregation, ...)
+
+    import instrumentation
+    instrumentation.enable()
+    with instrumentation.stage('simulate', scenario='2.0 kWp') as s:
+        ...
+        s.count(rows=8760)
+    instrumentation.write_summary('stats.json')
+    instrumentation.write_trace('trace.json')   # chrome://tracing, Perfetto
+
+Ist die Messung ausgeschaltet (Standard), liefert ``stage`` ein gemeinsames
+Leerobjekt - es wird nichts gemessen oder gespeichert. Gemessen wird nur an
+Stufengrenzen, nie innerhalb der Stundenschleife.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class _NullStage:
+    """Platzhalter bei ausgeschalteter Messung"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def count(self, **counters):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """Eine gemessene Stufe: Wand- und CPU-Zeit, Zähler und Speicherspitze"""
+
+    def __init__(self, recorder, name, tags):
+        self.recorder = recorder
+        self.name = name
+        self.tags = tags
+        self.counters = {}
+        self.peak_memory = 0
+
+    def count(self, **counters):
+        """Zähler erhöhen, z.B. ``count(rows=8760, bytes=len(payload))``"""
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def __enter__(self):
+        stack = self.recorder._stack()
+        if stack:
+            # Tags der umgebenden Stufe (z.B. scenario) erben
+            self.tags = dict(stack[-1].tags, **self.tags)
+            if self.recorder.trace_memory:
+                stack[-1].peak_memory = max(stack[-1].peak_memory, tracemalloc.get_traced_memory()[1])
+        if self.recorder.trace_memory:
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter_ns()
+        self.cpu_start = time.thread_time_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_ns = time.perf_counter_ns() - self.start
+        self.cpu_ns = time.thread_time_ns() - self.cpu_start
+        stack = self.recorder._stack()
+        stack.pop()
+        if self.recorder.trace_memory:
+            self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1].peak_memory = max(stack[-1].peak_memory, self.peak_memory)
+            tracemalloc.reset_peak()
+        elif resource is not None:
+            # Ohne tracemalloc nur die Spitze des gesamten Prozesses (KiB unter Linux)
+            self.peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        self.error = exc_info[0].__name__ if exc_info[0] is not None else None
+        self.recorder._finish(self)
+        return False
+
+
+class Recorder:
+    """Sammelt abgeschlossene Stufen aller Threads"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.origin = time.perf_counter_ns()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _finish(self, stage):
+        with self._lock:
+            self.stages.append(stage)
+
+    def summary(self):
+        """Summen je Stufe sowie je Stufe und Szenario"""
+        def add(table, key, stage):
+            entry = table.setdefault(key, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                           'peak_memory_bytes': 0, 'errors': 0})
+            entry['calls'] += 1
+            entry['wall_s'] += stage.wall_ns / 1e9
+            entry['cpu_s'] += stage.cpu_ns / 1e9
+            entry['peak_memory_bytes'] = max(entry['peak_memory_bytes'], stage.peak_memory)
+            entry['errors'] += stage.error is not None
+            for name, value in stage.counters.items():
+                entry[name] = entry.get(name, 0) + value
+
+        with self._lock:
+            stages = list(self.stages)
+        by_stage = {}
+        by_scenario = {}
+        for stage in stages:
+            add(by_stage, stage.name, stage)
+            if 'scenario' in stage.tags:
+                add(by_scenario.setdefault(str(stage.tags['scenario']), {}), stage.name, stage)
+        return {
+            'trace_memory': self.trace_memory,
+            'stages': by_stage,
+            'scenarios': by_scenario,
+        }
+
+    def trace_events(self):
+        """Stufen als Trace-Event-Format ('X'-Events, Zeiten in Mikrosekunden)"""
+        pid = os.getpid()
+        with self._lock:
+            stages = sorted(self.stages, key=lambda s: s.start)
+        events = []
+        for stage in stages:
+            args = dict(stage.tags, cpu_ms=stage.cpu_ns / 1e6, peak_memory_bytes=stage.peak_memory)
+            args.update(stage.counters)
+            if stage.error is not None:
+                args['error'] = stage.error
+            events.append({
+                'name': stage.name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': stage.thread_id,
+                'ts': (stage.start - self.origin) / 1e3, 'dur': stage.wall_ns / 1e3,
+                'args': {key: _json_value(value) for key, value in args.items()},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _json_value(value):
+    return value if isinstance(value, (int, float, str, bool)) or value is None else str(value)
+
+
+_recorder = None
+
+
+def enable(trace_memory=False):
+    """Messung einschalten (verwirft bisherige Messwerte)
+
+    ``trace_memory`` misst die Speicherspitze je Stufe mit tracemalloc - genau,
+    aber spürbar langsamer. Ohne wird die Prozess-Spitze (ru_maxrss) notiert.
+    """
+    global _recorder
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _recorder = Recorder(trace_memory=trace_memory)
+    return _recorder
+
+
+def disable():
+    """Messung ausschalten und den Recorder mit den bisherigen Messwerten liefern"""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None and recorder.trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return recorder
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def stage(name, **tags):
+    """Kontextmanager für eine Stufe; bei ausgeschalteter Messung ein Leerobjekt"""
+    if _recorder is None:
+        return _NULL_STAGE
+    return Stage(_recorder, name, tags)
+
+
+def count(**counters):
+    """Zähler der innersten laufenden Stufe dieses Threads erhöhen"""
+    if _recorder is None:
+        return
+    stack = _recorder._stack()
+    if stack:
+        stack[-1].count(**counters)
+
+
+def summary():
+    return _recorder.summary() if _recorder is not None else {}
+
+
+def write_summary(path):
+    """JSON-Zusammenfassung je Stufe und Szenario schreiben"""
+    with open(path, 'w') as f:
+        json.dump(summary(), f, indent=2)
+
+
+def write_trace(path):
+    """Trace-Event-Datei schreiben (chrome://tracing, ui.perfetto.dev)"""
+    events = _recorder.trace_events() if _recorder is not None else {'traceEvents': []}
+    with open(path, 'w') as f:
+        json.dump(events, f)
@@ -1,6 +1,30 @@
-import pvlib
+"""Balkonkraftwerk-Simulation: PVGIS-Abruf, Speicher-Simulation und Amortisation
+
+Als Skript (``python main.py``) läuft die komplette Analyse wie bisher. Alle
+Schritte stehen auch als Funktionen zur Verfügung; pvlib wird nur für echte
+PVGIS-Abfragen und matplotlib nur zum Plotten geladen.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+from battery import capacity_of, interpolate_battery
+from cashflow import CashflowModel
+from dispatch import dispatch_periods, limit_feed
+from feed_limit import FeedLimitIndex
+import instrumentation
+from instrumentation import stage
+from optimize import OptimizationResult, optimize_configuration
+from periods import period_bins
+from pipeline import Pipeline, fingerprint
+from pricing import PriceModel
+from results import batch_results, pack_results, unpack_results
+from pvgis_cache import PVGISCache, cache_key
 
 # Standort Brunsbüttel (Norddeutschland)
 latitude = 54.17
@@ -10,6 +34,26 @@ system_loss_percent = 15
 max_feed_kw = 0.8
 electricity_price = 0.36
 
+# Zeiträume, die direkt in der Simulation summiert werden ('ME' Monat, 'W' Woche, 'D' Tag)
+aggregation_freqs = ['ME']
+
+# Alternative Einspeiselimits für die Was-wäre-wenn-Auswertung ohne Speicher (kW)
+feed_limit_whatif_kw = [0.6, 0.8, 2.0]
+
+# Lokaler Cache für PVGIS-Abfragen; im Offline-Modus führt ein Cache-Miss zum Abbruch
+pvgis_cache_dir = os.environ.get('PVGIS_CACHE_DIR', '.pvgis_cache')
+pvgis_cache_max_mb = 500
+offline = os.environ.get('PVGIS_OFFLINE', '') not in ('', '0')
+
+# Alle Anlagengrößen aus einem Referenzprofil ableiten - PVGIS skaliert linear mit der Peakleistung
+normalized_fetch = True
+reference_peak_kwp = 1.0
+validate_scaling = os.environ.get('PVGIS_VALIDATE_SCALING', '') not in ('', '0')
+
+# Abgelegte Zwischenergebnisse (Simulation, Optimierung); leer = nur im Speicher halten
+pipeline_cache_dir = os.environ.get('PIPELINE_CACHE_DIR', '.pipeline_cache')
+pipeline_memory_entries = 256
+
 # Verschiedene Anlagengrößen und Batteriekapazitäten definieren
 scenarios = {
     '1.0 kWp': {'peak_power': 1.0, 'linestyle': '--'},
@@ -18,565 +62,734 @@ scenarios = {
     '8.0 kWp': {'peak_power': 8.0, 'linestyle': '-.'}
 }
 
+# Batterien mit Verlusten (siehe battery.Battery); eine reine Zahl gilt als verlustfreie Kapazität
+_battery_losses = {
+    'round_trip_efficiency': 0.92,  # Laden + Entladen (LiFePO4)
+    'reserve_soc': 0.1,  # Tiefentladeschutz
+    'self_discharge_per_day': 0.001,
+    'inverter_efficiency': 0.96,  # Lade-/Mikrowechselrichter je Richtung
+}
 battery_scenarios = {
-    '2.048 kWh': 2.048,
-    '4.096 kWh': 4.096,
-    '8.192 kWh': 8.192
+    '2.048 kWh': dict(_battery_losses, capacity_kwh=2.048, max_charge_kw=1.0, max_discharge_kw=0.8),
+    '4.096 kWh': dict(_battery_losses, capacity_kwh=4.096, max_charge_kw=2.0, max_discharge_kw=0.8),
+    '8.192 kWh': dict(_battery_losses, capacity_kwh=8.192, max_charge_kw=2.4, max_discharge_kw=0.8)
 }
 
-def get_system_data(peak_power_kwp):
-    """Daten für ein System mit gegebener Peakleistung abrufen"""
-    data, _ = pvlib.iotools.get_pvgis_hourly(
+# Preise für verschiedene Konfigurationen (in €)
+prices = {
+    '1.0 kWp': {'no_storage': 500, 'storage_2kwh': 1100, 'storage_4kwh': 1700, 'storage_8kwh': 2500},
+    '2.0 kWp': {'no_storage': 700, 'storage_2kwh': 1390, 'storage_4kwh': 1990, 'storage_8kwh': 2990},
+    '4.0 kWp': {'no_storage': 1100, 'storage_2kwh': 1970, 'storage_4kwh': 2570, 'storage_8kwh': 3770},  # Extrapoliert
+    '8.0 kWp': {'no_storage': 1900, 'storage_2kwh': 3130, 'storage_4kwh': 3730, 'storage_8kwh': 4500}   # Extrapoliert
+}
+
+# Speicherkapazität je Preisspalte (kWh) - Grundlage für die Preisinterpolation
+storage_capacities = {'no_storage': 0.0, 'storage_2kwh': 2.048, 'storage_4kwh': 4.096, 'storage_8kwh': 8.192}
+
+# Optimierung über kontinuierliche Anlagengröße und Speicherkapazität
+optimization_objectives = ['payback', 'npv']
+discount_rate = 0.03
+lifetime_years = 20
+
+# Monte-Carlo: Wetterjahre aus der PVGIS-Historie, Strompreispfade und Alterung
+monte_carlo_years = list(range(2005, 2024))
+monte_carlo_samples = 10000
+price_growth = 0.02
+module_degradation = 0.005
+battery_fade = 0.02
+
+# Zahlungsströme: Preissteigerung (price_growth), Degradation und Ersatz von Batterie und Wechselrichter
+battery_lifetime_years = 12
+battery_replacement_cost_per_kwh = 300
+inverter_lifetime_years = 15
+inverter_replacement_cost = 150
+
+# Eigenverbrauch gegen Haushaltslastprofile (CSV: Zeitstempel + eine Spalte je Haushalt)
+load_profiles_path = None
+feed_in_tariff = 0.0
+
+# Ausgabe der Analysegrafik
+plot_output_path = 'balkonkraftwerk_analysis.png'
+plot_dpi = 300
+
+# Parquet-Export (pip install .[export]): Stundenwerte, Monatssummen und Amortisation
+export_dir = 'export'
+export_compression = 'zstd'
+
+_pvgis_cache = None
+_pipeline = None
+
+def configure(**settings):
+    """Modulweite Einstellungen überschreiben, z.B. configure(latitude=52.5, year=2022)"""
+    global _pvgis_cache, _pipeline
+    module = globals()
+    for name, value in settings.items():
+        if name.startswith('_') or name not in module or callable(module[name]):
+            raise KeyError(f"Unbekannte Einstellung: {name}")
+        module[name] = value
+    _pvgis_cache = None  # Cache mit ggf. neuen Einstellungen neu anlegen
+    # Zwischenergebnisse bleiben gültig - ihre Fingerabdrücke enthalten die Einstellungen
+    if 'pipeline_cache_dir' in settings or 'pipeline_memory_entries' in settings:
+        _pipeline = None
+
+def get_pvgis_cache():
+    """PVGIS-Cache mit den aktuellen Einstellungen (wird beim ersten Zugriff angelegt)"""
+    global _pvgis_cache
+    if _pvgis_cache is None:
+        _pvgis_cache = PVGISCache(pvgis_cache_dir, max_bytes=pvgis_cache_max_mb * 1024 * 1024, offline=offline)
+    return _pvgis_cache
+
+def get_pipeline():
+    """Stufen-Cache für Zwischenergebnisse (wird beim ersten Zugriff angelegt)"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = Pipeline(pipeline_cache_dir or None, max_entries=pipeline_memory_entries)
+    return _pipeline
+
+def get_price_model():
+    """Preismodell aus der aktuellen Preistabelle"""
+    return PriceModel.from_prices(prices, storage_capacities)
+
+def _pvgis_params(peak_power_kwp):
+    """Parameter der PVGIS-Abfrage für eine Peakleistung"""
+    return dict(
         latitude=latitude, longitude=longitude,
         start=year, end=year,
         raddatabase='PVGIS-SARAH3',
-        pvcalculation=True,
         peakpower=peak_power_kwp,
         loss=system_loss_percent,
         surface_tilt=35,
-        surface_azimuth=180,
-        outputformat='json'
+        surface_azimuth=180
     )
-    return data
 
-def simulate_system(data, battery_capacity_kwh, max_feed_kw):
-    """Simuliert ein System mit gegebenen Parametern"""
-    # Leistungsdaten extrahieren
-    df = data.copy()
-    df.index = pd.to_datetime(df.index)
-    df['P'] = df['P'] / 1000  # in kW
-    
-    # Speicher-Simulation
-    soc = 0.0  # Batterie zu Tagesbeginn leer
-    buffered_feed = []
-    limited_feed = []
-    
-    for pv in df['P']:
-        # Mit 800W Limit ohne Speicher
-        limited_feed.append(min(pv, max_feed_kw))
-        
-        # Mit Speicher
-        if pv >= max_feed_kw:
-            feed = max_feed_kw
-            surplus = pv - feed
-            soc = min(soc + surplus, battery_capacity_kwh)
-        else:
-            needed = max_feed_kw - pv
-            discharge = min(needed, soc)
-            feed = pv + discharge
-            soc -= discharge
-        soc = max(0, min(soc, battery_capacity_kwh))
-        buffered_feed.append(feed)
+def fetch_system_data(peak_power_kwp):
+    """PVGIS-Daten für genau diese Peakleistung abrufen (mit lokalem Cache)"""
+    params = _pvgis_params(peak_power_kwp)
     
-    df['unlimited'] = df['P']
-    df['limited'] = limited_feed
-    df['buffered'] = buffered_feed
-    
-    # Kumulative Berechnung
-    df['unlimited_cum'] = df['unlimited'].cumsum()
-    df['limited_cum'] = df['limited'].cumsum()
-    df['buffered_cum'] = df['buffered'].cumsum()
+    def fetch():
+        import pvlib  # nur bei echtem Netzwerkabruf laden
+        
+        with stage('pvgis_fetch', peak_power=peak_power_kwp) as s:
+            data, _ = pvlib.iotools.get_pvgis_hourly(
+                pvcalculation=True,
+                outputformat='json',
+                **params
+            )
+            s.count(rows=len(data), bytes=int(data.memory_usage(index=True).sum()))
+        return data
     
-    return df
+    return get_pvgis_cache().get_or_fetch(cache_key(**params), fetch)
 
-# Daten für alle Szenarien abrufen und simulieren
-results = {}
-linestyles = {}
+def scale_system_data(data, factor):
+    """PVGIS-Daten auf eine andere Peakleistung skalieren (nur P ist proportional)"""
+    scaled = data.copy()
+    scaled['P'] = scaled['P'] * factor
+    return scaled
 
-for scenario_name, scenario_config in scenarios.items():
-    print(f"Verarbeite {scenario_name}...")
-    data = get_system_data(scenario_config['peak_power'])
-    results[scenario_name] = {}
-    
-    for battery_name, battery_capacity in battery_scenarios.items():
-        print(f"  - mit {battery_name} Batterie")
-        results[scenario_name][battery_name] = simulate_system(data, battery_capacity, max_feed_kw)
-    
-    linestyles[scenario_name] = scenario_config['linestyle']
+def get_system_data(peak_power_kwp, normalized=None):
+    """Daten für ein System mit gegebener Peakleistung abrufen"""
+    if normalized is None:
+        normalized = normalized_fetch
+    with stage('get_system_data', peak_power=peak_power_kwp) as s:
+        if not normalized:
+            data = fetch_system_data(peak_power_kwp)
+        else:
+            reference = fetch_system_data(reference_peak_kwp)
+            data = scale_system_data(reference, peak_power_kwp / reference_peak_kwp)
+        s.count(rows=len(data))
+    return data
 
-# Monatsweise Aggregation für alle Szenarien
-monthly_data = {}
-monthly_cum_data = {}
+def system_data_key(peak_power_kwp, normalized=None):
+    """Fingerabdruck der Daten von ``get_system_data``, ohne sie abzurufen"""
+    if normalized is None:
+        normalized = normalized_fetch
+    if not normalized:
+        return fingerprint('fetch', cache_key(**_pvgis_params(peak_power_kwp)), 1.0)
+    return fingerprint('fetch', cache_key(**_pvgis_params(reference_peak_kwp)),
+                       peak_power_kwp / reference_peak_kwp)
+
+def validate_normalized_fetch(peak_power_kwp, rtol=0.005):
+    """Skaliertes Referenzprofil mit einer direkten PVGIS-Abfrage vergleichen
+
+    Liefert die relative Abweichung des Jahresertrags; überschreitet sie
+    ``rtol``, wird ein ValueError ausgelöst.
+    """
+    scaled = get_system_data(peak_power_kwp, normalized=True)['P']
+    direct = fetch_system_data(peak_power_kwp)['P']
+    deviation = abs(scaled.sum() - direct.sum()) / direct.sum()
+    if deviation > rtol:
+        raise ValueError(f"Skaliertes Profil für {peak_power_kwp} kWp weicht um "
+                         f"{deviation:.2%} von der direkten Abfrage ab")
+    return deviation
+
+def simulate_systems(data, battery_capacities_kwh, max_feed_kw, dtype=np.float64):
+    """Simuliert ein System für mehrere Batteriekapazitäten in einem Durchlauf"""
+    with stage('simulate') as s:
+        # Leistungsdaten extrahieren
+        index = pd.to_datetime(data.index)
+        pv = data['P'].to_numpy(dtype=float) / 1000  # in kW
+        
+        # 800W Limit ohne Speicher ist unabhängig von der Batterie - nur einmal berechnen
+        limited = limit_feed(pv, max_feed_kw)
+        
+        # Speicher-Simulation für alle Kapazitäten gleichzeitig, Zeitraumsummen im selben Durchlauf
+        bins = [period_bins(index, freq) for freq in aggregation_freqs]
+        aggregates, buffered, _ = dispatch_periods(pv, battery_capacities_kwh, max_feed_kw, bins,
+                                                   keep_hourly=True)
+        
+        # Ergebnisse teilen sich Zeitindex, PV und Limit; kumulierte Werte entstehen erst bei Bedarf
+        s.count(rows=buffered.size)
+        return batch_results(index, pv, limited, buffered, dtype=dtype, bins=bins, aggregates=aggregates)
 
-for scenario_name, battery_results in results.items():
-    monthly_data[scenario_name] = {}
-    monthly_cum_data[scenario_name] = {}
-    
-    for battery_name, df in battery_results.items():
-        monthly_data[scenario_name][battery_name] = df.resample("ME").sum()
-        monthly_cum_data[scenario_name][battery_name] = df.resample("ME").last()[['unlimited_cum', 'limited_cum', 'buffered_cum']]
+def simulate_system(data, battery_capacity_kwh, max_feed_kw):
+    """Simuliert ein System mit gegebenen Parametern"""
+    return simulate_systems(data, [battery_capacity_kwh], max_feed_kw)[0]
 
-# Preise für verschiedene Konfigurationen (in €)
-prices = {
-    '1.0 kWp': {'no_storage': 500, 'storage_2kwh': 1100, 'storage_4kwh': 1700, 'storage_8kwh': 2500},
-    '2.0 kWp': {'no_storage': 700, 'storage_2kwh': 1390, 'storage_4kwh': 1990, 'storage_8kwh': 2990},
-    '4.0 kWp': {'no_storage': 1100, 'storage_2kwh': 1970, 'storage_4kwh': 2570, 'storage_8kwh': 3770},  # Extrapoliert
-    '8.0 kWp': {'no_storage': 1900, 'storage_2kwh': 3130, 'storage_4kwh': 3730, 'storage_8kwh': 4500}   # Extrapoliert
-}
+def simulate_scenario(peak_power_kwp):
+    """Ergebnisse aller Batterien für eine Peakleistung - aus dem Stufen-Cache, falls unverändert
+    
+    Der Fingerabdruck umfasst die PVGIS-Abfrage, Batterien, Einspeiselimit und
+    Zeiträume; Strompreis und Preistabelle gehören nicht dazu. Die
+    Zeitraumsummen werden mit abgelegt, die Aggregation ist danach nur noch
+    ein Zugriff.
+    """
+    capacities = list(battery_scenarios.values())
+    key = fingerprint('simulate', system_data_key(peak_power_kwp), capacities, max_feed_kw,
+                      list(aggregation_freqs))
+    return get_pipeline().run(
+        'simulate', key,
+        lambda: simulate_systems(get_system_data(peak_power_kwp), capacities, max_feed_kw),
+        encode=lambda results: pack_results(results, aggregation_freqs),
+        decode=unpack_results,
+    )
 
-# Plot mit 4x4 Subplots für Haupt-Szenarien + Amortisation + Jährliche Ersparnisse
-fig, ((ax1, ax2, ax3, ax4), (ax5, ax6, ax7, ax8), (ax9, ax10, ax11, ax12), (ax13, ax14, ax15, ax16)) = plt.subplots(4, 4, figsize=(25, 20))
-
-# Farben für die PV-Systeme
-colors = ['C0', 'C1', 'C2']
-
-# ===== SPALTE 1: OHNE SPEICHER =====
-# Subplot 1: Monatliche Erträge ohne Speicher (nur 800W Limit)
-scenario_type_no_storage = 'limited'
-scenario_label_no_storage = '800W Limit'
-color_no_storage = 'C1'
-
-for scenario_name, battery_data in monthly_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly = battery_data['2.048 kWh']  # Batterie ist irrelevant für diese Szenarien
-    ax1.plot(monthly.index, monthly[scenario_type_no_storage], 
-            label=f"{scenario_name} - {scenario_label_no_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_no_storage)
-
-ax1.set_title("Monatliche Erträge - Ohne Speicher")
-ax1.set_ylabel("Energieertrag (kWh/Monat)")
-ax1.grid(True)
-ax1.legend(fontsize=8)
-
-# Subplot 5: Kumulative Erträge ohne Speicher (nur 800W Limit)
-for scenario_name, battery_data in monthly_cum_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly_cum = battery_data['2.048 kWh']
-    ax5.plot(monthly_cum.index, monthly_cum[f'{scenario_type_no_storage}_cum'], 
-            label=f"{scenario_name} - {scenario_label_no_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_no_storage)
-
-ax5.set_title("Kumulative Erträge - Ohne Speicher")
-ax5.set_ylabel("Kumulativer Energieertrag (kWh)")
-ax5.set_xlabel("Monat")
-ax5.grid(True)
-ax5.legend(fontsize=8)
-
-# ===== SPALTE 2: 2.048 kWh SPEICHER =====
-# Subplot 2: Monatliche Erträge mit 2.048 kWh Batterie (nur Speicher-Szenario)
-scenario_type_storage = 'buffered'
-scenario_label_storage = '800W + Speicher'
-color_storage = 'C2'
-
-for scenario_name, battery_data in monthly_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly = battery_data['2.048 kWh']
-    ax2.plot(monthly.index, monthly[scenario_type_storage], 
-            label=f"{scenario_name} - {scenario_label_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_storage)
-
-ax2.set_title("Monatliche Erträge - 2.048 kWh Speicher")
-ax2.set_ylabel("Energieertrag (kWh/Monat)")
-ax2.grid(True)
-ax2.legend(fontsize=8)
-
-# Subplot 6: Kumulative Erträge mit 2.048 kWh Batterie (nur Speicher-Szenario)
-for scenario_name, battery_data in monthly_cum_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly_cum = battery_data['2.048 kWh']
-    ax6.plot(monthly_cum.index, monthly_cum[f'{scenario_type_storage}_cum'], 
-            label=f"{scenario_name} - {scenario_label_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_storage)
-
-ax6.set_title("Kumulative Erträge - 2.048 kWh Speicher")
-ax6.set_ylabel("Kumulativer Energieertrag (kWh)")
-ax6.set_xlabel("Monat")
-ax6.grid(True)
-ax6.legend(fontsize=8)
-
-# ===== SPALTE 3: 4.096 kWh SPEICHER =====
-# Subplot 3: Monatliche Erträge mit 4.096 kWh Batterie (nur Speicher-Szenario)
-for scenario_name, battery_data in monthly_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly = battery_data['4.096 kWh']
-    ax3.plot(monthly.index, monthly[scenario_type_storage], 
-            label=f"{scenario_name} - {scenario_label_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_storage)
-
-ax3.set_title("Monatliche Erträge - 4.096 kWh Speicher")
-ax3.set_ylabel("Energieertrag (kWh/Monat)")
-ax3.grid(True)
-ax3.legend(fontsize=8)
-
-# Subplot 7: Kumulative Erträge mit 4.096 kWh Batterie (nur Speicher-Szenario)
-for scenario_name, battery_data in monthly_cum_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly_cum = battery_data['4.096 kWh']
-    ax7.plot(monthly_cum.index, monthly_cum[f'{scenario_type_storage}_cum'], 
-            label=f"{scenario_name} - {scenario_label_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_storage)
-
-ax7.set_title("Kumulative Erträge - 4.096 kWh Speicher")
-ax7.set_ylabel("Kumulativer Energieertrag (kWh)")
-ax7.set_xlabel("Monat")
-ax7.grid(True)
-ax7.legend(fontsize=8)
-
-# ===== SPALTE 4: 8.192 kWh SPEICHER =====
-# Subplot 4: Monatliche Erträge mit 8.192 kWh Batterie (nur Speicher-Szenario)
-for scenario_name, battery_data in monthly_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly = battery_data['8.192 kWh']
-    ax4.plot(monthly.index, monthly[scenario_type_storage], 
-            label=f"{scenario_name} - {scenario_label_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_storage)
-
-ax4.set_title("Monatliche Erträge - 8.192 kWh Speicher")
-ax4.set_ylabel("Energieertrag (kWh/Monat)")
-ax4.grid(True)
-ax4.legend(fontsize=8)
-
-# Subplot 8: Kumulative Erträge mit 8.192 kWh Batterie (nur Speicher-Szenario)
-for scenario_name, battery_data in monthly_cum_data.items():
-    linestyle = linestyles[scenario_name]
-    monthly_cum = battery_data['8.192 kWh']
-    ax8.plot(monthly_cum.index, monthly_cum[f'{scenario_type_storage}_cum'], 
-            label=f"{scenario_name} - {scenario_label_storage}", 
-            linewidth=2, linestyle=linestyle, color=color_storage)
-
-ax8.set_title("Kumulative Erträge - 8.192 kWh Speicher")
-ax8.set_ylabel("Kumulativer Energieertrag (kWh)")
-ax8.set_xlabel("Monat")
-ax8.grid(True)
-ax8.legend(fontsize=8)
-
-# ===== ANNOTATIONS =====
-# Annotations für ohne Speicher (ax5)
-annotation_color_no_storage = 'orange'
-annotation_offset_no_storage = 0
-x_offsets = [10, -50, -100, -150]  # Erweitert für 4 PV-Systeme
-
-for j, (scenario_name, battery_data) in enumerate(monthly_cum_data.items()):
-    monthly_cum = battery_data['2.048 kWh']
-    final_value = monthly_cum[f'{scenario_type_no_storage}_cum'].iloc[-1]
-    
-    ax5.annotate(f'{final_value:.1f} kWh', 
-                 xy=(monthly_cum.index[-1], final_value),
-                 xytext=(x_offsets[j], annotation_offset_no_storage), 
-                 textcoords='offset points',
-                 bbox=dict(boxstyle='round,pad=0.3', 
-                          facecolor=annotation_color_no_storage, 
-                          alpha=0.7 - j*0.1),
-                 fontsize=7, fontweight='bold')
-
-# Annotations für 2.048 kWh Speicher (ax6)
-annotation_color_storage = 'lightgreen'
-annotation_offset_storage = 0
-
-for j, (scenario_name, battery_data) in enumerate(monthly_cum_data.items()):
-    monthly_cum = battery_data['2.048 kWh']
-    final_value = monthly_cum[f'{scenario_type_storage}_cum'].iloc[-1]
-    
-    ax6.annotate(f'{final_value:.1f} kWh', 
-                 xy=(monthly_cum.index[-1], final_value),
-                 xytext=(x_offsets[j], annotation_offset_storage), 
-                 textcoords='offset points',
-                 bbox=dict(boxstyle='round,pad=0.3', 
-                          facecolor=annotation_color_storage, 
-                          alpha=0.7 - j*0.1),
-                 fontsize=7, fontweight='bold')
-
-# Annotations für 4.096 kWh Speicher (ax7)
-for j, (scenario_name, battery_data) in enumerate(monthly_cum_data.items()):
-    monthly_cum = battery_data['4.096 kWh']
-    final_value = monthly_cum[f'{scenario_type_storage}_cum'].iloc[-1]
-    
-    ax7.annotate(f'{final_value:.1f} kWh', 
-                 xy=(monthly_cum.index[-1], final_value),
-                 xytext=(x_offsets[j], annotation_offset_storage), 
-                 textcoords='offset points',
-                 bbox=dict(boxstyle='round,pad=0.3', 
-                          facecolor=annotation_color_storage, 
-                          alpha=0.7 - j*0.1),
-                 fontsize=7, fontweight='bold')
-
-# Annotations für 8.192 kWh Speicher (ax8)
-for j, (scenario_name, battery_data) in enumerate(monthly_cum_data.items()):
-    monthly_cum = battery_data['8.192 kWh']
-    final_value = monthly_cum[f'{scenario_type_storage}_cum'].iloc[-1]
-    
-    ax8.annotate(f'{final_value:.1f} kWh', 
-                 xy=(monthly_cum.index[-1], final_value),
-                 xytext=(x_offsets[j], annotation_offset_storage), 
-                 textcoords='offset points',
-                 bbox=dict(boxstyle='round,pad=0.3', 
-                          facecolor=annotation_color_storage, 
-                          alpha=0.7 - j*0.1),
-                 fontsize=7, fontweight='bold')
-
-# ===== AMORTISATIONSBERECHNUNG =====
-# Sammle Daten für Amortisationsberechnung
-amortization_data = {}
-
-for scenario_name, battery_results in results.items():
-    amortization_data[scenario_name] = {}
-    
-    # Ohne Speicher (800W Limit)
-    annual_yield_no_storage = battery_results['2.048 kWh']['limited'].sum()
-    annual_savings_no_storage = annual_yield_no_storage * electricity_price
-    investment_no_storage = prices[scenario_name]['no_storage']
-    amortization_no_storage = investment_no_storage / annual_savings_no_storage if annual_savings_no_storage > 0 else float('inf')
-    
-    # Mit 2.048 kWh Speicher
-    annual_yield_2kwh = battery_results['2.048 kWh']['buffered'].sum()
-    annual_savings_2kwh = annual_yield_2kwh * electricity_price
-    investment_2kwh = prices[scenario_name]['storage_2kwh']
-    amortization_2kwh = investment_2kwh / annual_savings_2kwh if annual_savings_2kwh > 0 else float('inf')
-    
-    # Mit 4.096 kWh Speicher
-    annual_yield_4kwh = battery_results['4.096 kWh']['buffered'].sum()
-    annual_savings_4kwh = annual_yield_4kwh * electricity_price
-    investment_4kwh = prices[scenario_name]['storage_4kwh']
-    amortization_4kwh = investment_4kwh / annual_savings_4kwh if annual_savings_4kwh > 0 else float('inf')
-    
-    # Mit 8.192 kWh Speicher
-    annual_yield_8kwh = battery_results['8.192 kWh']['buffered'].sum()
-    annual_savings_8kwh = annual_yield_8kwh * electricity_price
-    investment_8kwh = prices[scenario_name]['storage_8kwh']
-    amortization_8kwh = investment_8kwh / annual_savings_8kwh if annual_savings_8kwh > 0 else float('inf')
-    
-    amortization_data[scenario_name] = {
-        'no_storage': {'years': amortization_no_storage, 'investment': investment_no_storage, 'savings': annual_savings_no_storage},
-        'storage_2kwh': {'years': amortization_2kwh, 'investment': investment_2kwh, 'savings': annual_savings_2kwh},
-        'storage_4kwh': {'years': amortization_4kwh, 'investment': investment_4kwh, 'savings': annual_savings_4kwh},
-        'storage_8kwh': {'years': amortization_8kwh, 'investment': investment_8kwh, 'savings': annual_savings_8kwh}
-    }
+def run_scenarios(verbose=True):
+    """Daten für alle Szenarien abrufen und simulieren
 
-# Subplot 9: Amortisation ohne Speicher
-scenario_names = list(amortization_data.keys())
-amortization_years_no_storage = [amortization_data[name]['no_storage']['years'] for name in scenario_names]
-investments_no_storage = [amortization_data[name]['no_storage']['investment'] for name in scenario_names]
-
-bars9 = ax9.bar(scenario_names, amortization_years_no_storage, color='orange', alpha=0.7)
-ax9.set_title("Amortisationszeit - Ohne Speicher")
-ax9.set_ylabel("Jahre")
-ax9.set_ylim(0, max(amortization_years_no_storage) * 1.1)
-ax9.grid(True, alpha=0.3)
-
-# Annotationen mit Investitionskosten
-for i, (bar, investment) in enumerate(zip(bars9, investments_no_storage)):
-    height = bar.get_height()
-    ax9.annotate(f'{height:.1f} Jahre\n({investment}€)', 
-                xy=(bar.get_x() + bar.get_width()/2, height),
-                xytext=(0, 3), textcoords='offset points',
-                ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# Subplot 10: Amortisation mit 2.048 kWh Speicher
-amortization_years_2kwh = [amortization_data[name]['storage_2kwh']['years'] for name in scenario_names]
-investments_2kwh = [amortization_data[name]['storage_2kwh']['investment'] for name in scenario_names]
-
-bars10 = ax10.bar(scenario_names, amortization_years_2kwh, color='lightgreen', alpha=0.7)
-ax10.set_title("Amortisationszeit - 2.048 kWh Speicher")
-ax10.set_ylabel("Jahre")
-ax10.set_ylim(0, max(amortization_years_2kwh) * 1.1)
-ax10.grid(True, alpha=0.3)
-
-# Annotationen mit Investitionskosten
-for i, (bar, investment) in enumerate(zip(bars10, investments_2kwh)):
-    height = bar.get_height()
-    ax10.annotate(f'{height:.1f} Jahre\n({investment}€)', 
-                xy=(bar.get_x() + bar.get_width()/2, height),
-                xytext=(0, 3), textcoords='offset points',
-                ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# Subplot 11: Amortisation mit 4.096 kWh Speicher
-amortization_years_4kwh = [amortization_data[name]['storage_4kwh']['years'] for name in scenario_names]
-investments_4kwh = [amortization_data[name]['storage_4kwh']['investment'] for name in scenario_names]
-
-bars11 = ax11.bar(scenario_names, amortization_years_4kwh, color='darkgreen', alpha=0.7)
-ax11.set_title("Amortisationszeit - 4.096 kWh Speicher")
-ax11.set_ylabel("Jahre")
-ax11.set_ylim(0, max(amortization_years_4kwh) * 1.1)
-ax11.grid(True, alpha=0.3)
-
-# Annotationen mit Investitionskosten
-for i, (bar, investment) in enumerate(zip(bars11, investments_4kwh)):
-    height = bar.get_height()
-    ax11.annotate(f'{height:.1f} Jahre\n({investment}€)', 
-                xy=(bar.get_x() + bar.get_width()/2, height),
-                xytext=(0, 3), textcoords='offset points',
-                ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# Subplot 12: Amortisation mit 8.192 kWh Speicher
-amortization_years_8kwh = [amortization_data[name]['storage_8kwh']['years'] for name in scenario_names]
-investments_8kwh = [amortization_data[name]['storage_8kwh']['investment'] for name in scenario_names]
-
-bars12 = ax12.bar(scenario_names, amortization_years_8kwh, color='darkblue', alpha=0.7)
-ax12.set_title("Amortisationszeit - 8.192 kWh Speicher")
-ax12.set_ylabel("Jahre")
-ax12.set_ylim(0, max(amortization_years_8kwh) * 1.1)
-ax12.grid(True, alpha=0.3)
-
-# Annotationen mit Investitionskosten
-for i, (bar, investment) in enumerate(zip(bars12, investments_8kwh)):
-    height = bar.get_height()
-    ax12.annotate(f'{height:.1f} Jahre\n({investment}€)', 
-                xy=(bar.get_x() + bar.get_width()/2, height),
-                xytext=(0, 3), textcoords='offset points',
-                ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# ===== JÄHRLICHE ERSPARNISSE =====
-# Subplot 13: Jährliche Ersparnisse ohne Speicher
-annual_savings_no_storage = [amortization_data[name]['no_storage']['savings'] for name in scenario_names]
-
-bars13 = ax13.bar(scenario_names, annual_savings_no_storage, color='orange', alpha=0.7)
-ax13.set_title("Jährliche Ersparnisse - Ohne Speicher")
-ax13.set_ylabel("Ersparnisse (€/Jahr)")
-ax13.set_ylim(0, max(annual_savings_no_storage) * 1.1)
-ax13.grid(True, alpha=0.3)
-
-# Annotationen mit jährlichen Ersparnissen
-for i, bar in enumerate(bars13):
-    height = bar.get_height()
-    yield_kwh = annual_savings_no_storage[i] / electricity_price
-    ax13.annotate(f'{height:.0f}€/Jahr\n({yield_kwh:.0f} kWh)', 
-                 xy=(bar.get_x() + bar.get_width()/2, height),
-                 xytext=(0, 3), textcoords='offset points',
-                 ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# Subplot 14: Jährliche Ersparnisse mit 2.048 kWh Speicher
-annual_savings_2kwh = [amortization_data[name]['storage_2kwh']['savings'] for name in scenario_names]
-
-bars14 = ax14.bar(scenario_names, annual_savings_2kwh, color='lightgreen', alpha=0.7)
-ax14.set_title("Jährliche Ersparnisse - 2.048 kWh Speicher")
-ax14.set_ylabel("Ersparnisse (€/Jahr)")
-ax14.set_ylim(0, max(annual_savings_2kwh) * 1.1)
-ax14.grid(True, alpha=0.3)
-
-# Annotationen mit jährlichen Ersparnissen
-for i, bar in enumerate(bars14):
-    height = bar.get_height()
-    yield_kwh = annual_savings_2kwh[i] / electricity_price
-    ax14.annotate(f'{height:.0f}€/Jahr\n({yield_kwh:.0f} kWh)', 
-                 xy=(bar.get_x() + bar.get_width()/2, height),
-                 xytext=(0, 3), textcoords='offset points',
-                 ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# Subplot 15: Jährliche Ersparnisse mit 4.096 kWh Speicher
-annual_savings_4kwh = [amortization_data[name]['storage_4kwh']['savings'] for name in scenario_names]
-
-bars15 = ax15.bar(scenario_names, annual_savings_4kwh, color='darkgreen', alpha=0.7)
-ax15.set_title("Jährliche Ersparnisse - 4.096 kWh Speicher")
-ax15.set_ylabel("Ersparnisse (€/Jahr)")
-ax15.set_ylim(0, max(annual_savings_4kwh) * 1.1)
-ax15.grid(True, alpha=0.3)
-
-# Annotationen mit jährlichen Ersparnissen
-for i, bar in enumerate(bars15):
-    height = bar.get_height()
-    yield_kwh = annual_savings_4kwh[i] / electricity_price
-    ax15.annotate(f'{height:.0f}€/Jahr\n({yield_kwh:.0f} kWh)', 
-                 xy=(bar.get_x() + bar.get_width()/2, height),
-                 xytext=(0, 3), textcoords='offset points',
-                 ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-# Subplot 16: Jährliche Ersparnisse mit 8.192 kWh Speicher
-annual_savings_8kwh = [amortization_data[name]['storage_8kwh']['savings'] for name in scenario_names]
-
-bars16 = ax16.bar(scenario_names, annual_savings_8kwh, color='darkblue', alpha=0.7)
-ax16.set_title("Jährliche Ersparnisse - 8.192 kWh Speicher")
-ax16.set_ylabel("Ersparnisse (€/Jahr)")
-ax16.set_ylim(0, max(annual_savings_8kwh) * 1.1)
-ax16.grid(True, alpha=0.3)
-
-# Annotationen mit jährlichen Ersparnissen
-for i, bar in enumerate(bars16):
-    height = bar.get_height()
-    yield_kwh = annual_savings_8kwh[i] / electricity_price
-    ax16.annotate(f'{height:.0f}€/Jahr\n({yield_kwh:.0f} kWh)', 
-                 xy=(bar.get_x() + bar.get_width()/2, height),
-                 xytext=(0, 3), textcoords='offset points',
-                 ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-plt.tight_layout()
-
-# Plot speichern
-plt.savefig('balkonkraftwerk_analysis.png', dpi=300, bbox_inches='tight')
-print("Plot gespeichert als 'balkonkraftwerk_analysis.png'")
-
-plt.show()
-
-# Jahreserträge und Amortisation anzeigen
-for scenario_name, battery_results in results.items():
-    print(f"\n=== {scenario_name} System ===")
-    
-    for battery_name, df in battery_results.items():
-        total_unlimited = df['unlimited'].sum()
-        total_limited = df['limited'].sum()
-        total_buffered = df['buffered'].sum()
+    Liefert (Ergebnisse je Szenario und Batterie, Linienstile je Szenario).
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    results = {}
+    linestyles = {}
+    
+    for scenario_name, scenario_config in scenarios.items():
+        log(f"Verarbeite {scenario_name}...")
+        with stage('scenario', scenario=scenario_name):
+            if validate_scaling and scenario_config['peak_power'] != reference_peak_kwp:
+                deviation = validate_normalized_fetch(scenario_config['peak_power'])
+                log(f"  Skalierung geprüft: {deviation:.3%} Abweichung zur direkten Abfrage")
+            
+            log(f"  - mit {', '.join(battery_scenarios)} Batterie")
+            battery_frames = simulate_scenario(scenario_config['peak_power'])
+            results[scenario_name] = dict(zip(battery_scenarios, battery_frames))
         
-        print(f"\n--- {battery_name} Batterie ---")
-        print("Jahresertrag ohne Limit:       ", round(total_unlimited, 2), "kWh")
-        print("Jahresertrag mit 800W Limit:   ", round(total_limited, 2), "kWh")
-        print("Jahresertrag mit 800W + Akku:  ", round(total_buffered, 2), "kWh")
-        print("Puffer-Mehrertrag:             ", round(total_buffered - total_limited, 2), "kWh")
+        linestyles[scenario_name] = scenario_config['linestyle']
+    
+    return results, linestyles
+
+def aggregate_monthly(results):
+    """Monatssummen und Monatsendwerte für alle Szenarien"""
+    monthly_data = {}
+    monthly_cum_data = {}
+    
+    for scenario_name, battery_results in results.items():
+        monthly_data[scenario_name] = {}
+        monthly_cum_data[scenario_name] = {}
         
-        # Zusätzliche Batterie-Effizienz Analyse
-        if battery_name == '4.096 kWh':
-            # Vergleich mit 2.048 kWh Batterie
-            df_small = battery_results['2.048 kWh']
-            total_buffered_small = df_small['buffered'].sum()
-            additional_yield = total_buffered - total_buffered_small
-            print(f"Zusätzlicher Ertrag vs 2.048 kWh: {round(additional_yield, 2)} kWh")
-            print(f"Effizienz-Steigerung:           {round(additional_yield/total_buffered_small*100, 1)}%")
+        with stage('aggregation', scenario=scenario_name) as s:
+            for battery_name, result in battery_results.items():
+                monthly_data[scenario_name][battery_name] = result.monthly
+                monthly_cum_data[scenario_name][battery_name] = result.monthly_cum
+                s.count(rows=len(result.monthly))
+    
+    return monthly_data, monthly_cum_data
+
+def get_cashflow_model():
+    """Zahlungsstrom-Modell mit den aktuellen Einstellungen"""
+    return CashflowModel(lifetime_years, discount_rate, price_escalation=price_growth,
+                         module_degradation=module_degradation,
+                         battery_lifetime_years=battery_lifetime_years,
+                         battery_cost_per_kwh=battery_replacement_cost_per_kwh,
+                         inverter_lifetime_years=inverter_lifetime_years,
+                         inverter_cost=inverter_replacement_cost)
+
+def battery_for_capacity(capacity_kwh):
+    """Batterie mit Verlusten für eine beliebige Kapazität, zwischen den Szenarien interpoliert"""
+    return interpolate_battery(list(battery_scenarios.values()), capacity_kwh)
+
+def _option_yield(battery_results, option):
+    """Jahresertrag (kWh) einer Preisspalte: ohne Speicher begrenzt, sonst gepuffert"""
+    capacity = storage_capacities[option]
+    if capacity == 0:
+        return next(iter(battery_results.values())).total('limited')
+    battery_name = next(name for name, battery in battery_scenarios.items()
+                        if capacity_of(battery) == capacity)
+    return battery_results[battery_name].total('buffered')
+
+def compute_amortization(results):
+    """Investition, Ersparnis, Amortisationszeit und Kapitalwert je Szenario und Speicher
+    
+    Alle Szenarien und Speicher werden als eine Zahlungsmatrix ausgewertet.
+    'years' ist wie bisher die statische Amortisationszeit (Investition /
+    Ersparnis), 'payback' und 'discounted_payback' die Amortisation aus den
+    mehrjährigen Zahlungsströmen ohne bzw. mit Abzinsung.
+    """
+    scenario_names = list(results)
+    options = list(storage_capacities)
+    
+    with stage('amortization') as s:
+        annual_yield = np.array([[_option_yield(results[name], option) for option in options]
+                                 for name in scenario_names])
+        investment = np.array([[prices[name][option] for option in options] for name in scenario_names],
+                              dtype=float)
+        battery_kwh = np.array([storage_capacities[option] for option in options])
+        model = get_cashflow_model()
+        # Nur im Speicher: die Auswertung selbst dauert wenige Millisekunden
+        key = fingerprint('amortize', annual_yield, investment, battery_kwh, electricity_price, vars(model))
+        metrics = get_pipeline().run(
+            'amortize', key, lambda: model.evaluate(investment, annual_yield, electricity_price, battery_kwh))
+        s.count(configurations=investment.size)
+    
+    amortization_data = {}
+    for i, scenario_name in enumerate(scenario_names):
+        amortization_data[scenario_name] = {
+            option: {
+                'years': float(metrics.simple_payback_years[i, j]),
+                'investment': prices[scenario_name][option],
+                'savings': float(annual_yield[i, j] * electricity_price),
+                'payback': float(metrics.payback_years[i, j]),
+                'discounted_payback': float(metrics.discounted_payback_years[i, j]),
+                'npv': float(metrics.npv[i, j]),
+                'irr': float(metrics.irr[i, j]),
+            }
+            for j, option in enumerate(options)
+        }
+    return amortization_data
+
+def find_optimal_configurations(objectives=None):
+    """Optimale Konfiguration je Optimierungsziel statt fester Szenarien"""
+    price_model = get_price_model()
+    reference_key = system_data_key(reference_peak_kwp)
+    optima = {}
+    for objective in objectives or optimization_objectives:
+        with stage('optimization', objective=objective) as s:
+            def optimize():
+                reference_pv_kw = get_system_data(reference_peak_kwp)['P'].to_numpy() / 1000 / reference_peak_kwp
+                best = optimize_configuration(
+                    reference_pv_kw, price_model, electricity_price, max_feed_kw,
+                    peak_range=(price_model.peak_powers_kwp[0], price_model.peak_powers_kwp[-1]),
+                    max_battery_kwh=price_model.battery_capacities_kwh[-1],
+                    objective=objective, discount_rate=discount_rate, lifetime_years=lifetime_years,
+                    battery_model=battery_for_capacity
+                )
+                s.count(simulations=best.evaluations)
+                return best
+            
+            key = fingerprint('optimize', reference_key, prices, storage_capacities, battery_scenarios,
+                              electricity_price, max_feed_kw, objective, discount_rate, lifetime_years)
+            optima[objective] = get_pipeline().run(
+                'optimize', key, optimize,
+                encode=lambda best: {name: np.asarray(value) for name, value in best._asdict().items()},
+                decode=lambda values: OptimizationResult(**{name: values[name].item()
+                                                            for name in OptimizationResult._fields}),
+            )
+    return optima
+
+def run_monte_carlo(n_samples=None, seed=None):
+    """Verteilung von Amortisationszeit und Kapitalwert für alle Szenarien × Batterien"""
+    from montecarlo import configurations, monte_carlo, summarize_samples, weather_year_profiles
+    from pvgis_fetch import PVGISFetcher
+    
+    with stage('pvgis_history', years=len(monte_carlo_years)):
+        with PVGISFetcher(cache=get_pvgis_cache()) as fetcher:
+            profiles = weather_year_profiles(fetcher, latitude, longitude, monte_carlo_years,
+                                             loss=system_loss_percent)
+    
+    peaks = [config['peak_power'] for config in scenarios.values()]
+    batteries = [0.0] + list(battery_scenarios.values())
+    configs = configurations(peaks, [capacity_of(battery) for battery in batteries])
+    investment = get_price_model()(configs['peak_power_kwp'], configs['battery_kwh'])
+    with stage('monte_carlo') as s:
+        # Verlustparameter je Konfiguration, in der Reihenfolge von configurations (Peakleistung außen)
+        samples = monte_carlo(profiles, configs, investment, max_feed_kw, electricity_price,
+                              n_samples=n_samples or monte_carlo_samples, lifetime_years=lifetime_years,
+                              discount_rate=discount_rate, price_growth=price_growth,
+                              degradation=module_degradation, battery_fade=battery_fade, seed=seed,
+                              batteries=batteries * len(peaks))
+        s.count(samples=samples.npv.size)
+    return summarize_samples(samples)
+
+def run_self_consumption(load_path=None, energy=False):
+    """Eigenverbrauch und Ersparnis je Szenario und Speicher über alle Lastprofile
+    
+    Liefert eine Zeile je Szenario und Speicher mit Medianen und Perzentilen
+    der Ersparnis über die Haushalte. Die Batterie je Preisspalte hat die
+    Verluste der Szenarien (``battery_for_capacity``).
+    """
+    from selfconsumption import read_load_profiles, simulate_self_consumption, summarize_flows
+    
+    loads = read_load_profiles(load_path or load_profiles_path, energy=energy)
+    load_kw = loads.to_numpy().T
+    rows = []
+    for scenario_name, config in scenarios.items():
+        pv = get_system_data(config['peak_power'])['P'].to_numpy(dtype=float) / 1000
+        for option, capacity in storage_capacities.items():
+            with stage('scenario', scenario=scenario_name):
+                battery = battery_for_capacity(capacity) if capacity > 0 else 0.0
+                flows = simulate_self_consumption(pv, load_kw, battery, max_feed_kw)
+            table = summarize_flows(flows, electricity_price, feed_in_tariff)
+            rows.append({
+                'scenario': scenario_name,
+                'battery_kwh': capacity,
+                'investment': prices[scenario_name][option],
+                'households': len(table),
+                'self_consumed_kwh': float((table['direct'] + table['discharged']).median()),
+                'exported_kwh': float(table['exported'].median()),
+                'self_consumption_rate': float(table['self_consumption_rate'].median()),
+                'autarky_rate': float(table['autarky_rate'].median()),
+                'savings_p10': float(table['savings'].quantile(0.1)),
+                'savings_p50': float(table['savings'].median()),
+                'savings_p90': float(table['savings'].quantile(0.9)),
+            })
+    return pd.DataFrame(rows)
+
+def run_export(directory=None, compression=None):
+    """Alle Szenarien als partitionierte Parquet-Datensätze schreiben - Szenario für Szenario
+    
+    Jedes Szenario wird simuliert (bzw. aus dem Stufen-Cache geholt),
+    geschrieben und wieder freigegeben. Liefert den ``export.ParquetExport``
+    mit den geschriebenen Dateien.
+    """
+    from export import ParquetExport, site_name
+    
+    exporter = ParquetExport(directory or export_dir, compression=compression or export_compression,
+                             site=site_name(latitude, longitude), year=year)
+    battery_kwh = {name: capacity_of(battery) for name, battery in battery_scenarios.items()}
+    for scenario_name, config in scenarios.items():
+        with stage('scenario', scenario=scenario_name):
+            battery_results = dict(zip(battery_scenarios, simulate_scenario(config['peak_power'])))
+            exporter.write_scenario(scenario_name, config['peak_power'], battery_results, battery_kwh)
+            amortization = compute_amortization({scenario_name: battery_results})[scenario_name]
+            exporter.write_amortization(scenario_name, config['peak_power'], amortization,
+                                        storage_capacities)
+    return exporter
+
+def plot_results(results, linestyles, amortization_data, output_path=None, dpi=None, show=False,
+                 split_columns=False, processes=None, force=False, verbose=True):
+    """Analysegrafik erstellen (matplotlib wird erst hier geladen)
+    
+    Liefert die Pfade der Grafiken; mit ``verbose`` wird je Grafik gemeldet,
+    ob sie neu gerendert wurde oder aktuell war.
+    """
+    from plotting import plot_analysis
+    
+    monthly_data, monthly_cum_data = aggregate_monthly(results)
+    with stage('plotting') as s:
+        figures = plot_analysis(monthly_data, monthly_cum_data, amortization_data, linestyles, electricity_price,
+                                output_path=output_path or plot_output_path, dpi=dpi or plot_dpi, show=show,
+                                split_columns=split_columns, processes=processes, force=force)
+        s.count(figures=len(figures), rendered=sum(rendered for _, rendered in figures))
+    if verbose:
+        for path, rendered in figures:
+            if rendered:
+                print(f"Plot gespeichert als '{path}'")
+            else:
+                print(f"Plot '{path}' ist aktuell")
+    return [path for path, _ in figures]
+
+def print_yield_report(results):
+    """Jahreserträge je Szenario und Batterie in der Konsole ausgeben"""
+    for scenario_name, battery_results in results.items():
+        print(f"\n=== {scenario_name} System ===")
+
+        for battery_name, result in battery_results.items():
+            total_unlimited = result.total('unlimited')
+            total_limited = result.total('limited')
+            total_buffered = result.total('buffered')
+
+            print(f"\n--- {battery_name} Batterie ---")
+            print("Jahresertrag ohne Limit:       ", round(total_unlimited, 2), "kWh")
+            print("Jahresertrag mit 800W Limit:   ", round(total_limited, 2), "kWh")
+            print("Jahresertrag mit 800W + Akku:  ", round(total_buffered, 2), "kWh")
+            print("Puffer-Mehrertrag:             ", round(total_buffered - total_limited, 2), "kWh")
+
+            # Zusätzliche Batterie-Effizienz Analyse
+            if battery_name == '4.096 kWh':
+                # Vergleich mit 2.048 kWh Batterie
+                total_buffered_small = battery_results['2.048 kWh'].total('buffered')
+                additional_yield = total_buffered - total_buffered_small
+                print(f"Zusätzlicher Ertrag vs 2.048 kWh: {round(additional_yield, 2)} kWh")
+                print(f"Effizienz-Steigerung:           {round(additional_yield/total_buffered_small*100, 1)}%")
+
+            if battery_name == '8.192 kWh':
+                # Vergleich mit 4.096 kWh Batterie
+                total_buffered_medium = battery_results['4.096 kWh'].total('buffered')
+                additional_yield = total_buffered - total_buffered_medium
+                print(f"Zusätzlicher Ertrag vs 4.096 kWh: {round(additional_yield, 2)} kWh")
+                print(f"Effizienz-Steigerung:           {round(additional_yield/total_buffered_medium*100, 1)}%")
+
+def print_feed_limit_report(results):
+    """Was-wäre-wenn: andere Einspeiselimits ohne Speicher"""
+    print(f"\n{'='*60}")
+    print("EINSPEISELIMIT-VARIANTEN (ohne Speicher)")
+    print(f"{'='*60}")
+
+    for scenario_name, battery_results in results.items():
+        feed_index = FeedLimitIndex(next(iter(battery_results.values()))['P'])
+        limited_yields = feed_index.limited_yield(feed_limit_whatif_kw)
+        curtailed = feed_index.curtailed_energy(feed_limit_whatif_kw)
+        print(f"\n=== {scenario_name} System ===")
+        for limit_kw, limited_kwh, curtailed_kwh in zip(feed_limit_whatif_kw, limited_yields, curtailed):
+            print(f"  {limit_kw * 1000:.0f}W Limit: {limited_kwh:.2f} kWh Ertrag, {curtailed_kwh:.2f} kWh abgeregelt")
+
+def _storage_label(option):
+    """Bezeichnung einer Preisspalte, z.B. 2.048 kWh Speicher"""
+    capacity = storage_capacities[option]
+    return f"{capacity:.3f} kWh Speicher" if capacity else "Ohne Speicher"
+
+def print_amortization_report(amortization_data):
+    """Amortisationsanalyse in der Konsole ausgeben"""
+    print(f"\n{'='*60}")
+    print("AMORTISATIONSANALYSE")
+    print(f"Strompreis: {electricity_price:.2f} €/kWh")
+    print(f"{'='*60}")
+
+    for scenario_name, options in amortization_data.items():
+        print(f"\n=== {scenario_name} System ===")
+
+        for option, data in options.items():
+            label = _storage_label(option)
+            print(f"{label}:" if option == 'no_storage' else f"Mit {label}:")
+            print(f"  Investition: {data['investment']}€")
+            print(f"  Jährliche Ersparnis: {data['savings']:.2f}€")
+            print(f"  Amortisationszeit: {data['years']:.1f} Jahre")
+            irr = f"{data['irr']:.1%}" if math.isfinite(data['irr']) else "-"
+            print(f"  Über {lifetime_years} Jahre: Kapitalwert {data['npv']:.0f}€, Rendite {irr}, "
+                  f"dynamische Amortisation {data['discounted_payback']:.1f} Jahre")
+
+        # Vergleichsanalyse
+        best_option = min([(_storage_label(option), data['years']) for option, data in options.items()],
+                          key=lambda x: x[1])
+
+        print(f"  → Beste Option: {best_option[0]} ({best_option[1]:.1f} Jahre)")
+
+    print(f"\n{'='*60}")
+    print("EXTRAPOLIERTE PREISE für größere Systeme:")
+    print("4.0 kWp: Ohne Speicher: 1100€ | Mit 2 kWh: 1970€ | Mit 4 kWh: 2570€ | Mit 8 kWh: 3770€")
+    print("8.0 kWp: Ohne Speicher: 1900€ | Mit 2 kWh: 3130€ | Mit 4 kWh: 3730€ | Mit 8 kWh: 4500€")
+    print(f"{'='*60}")
+
+def print_optimization_report(optima):
+    """Optimale Konfigurationen in der Konsole ausgeben"""
+    objective_labels = {'payback': 'kürzeste Amortisation', 'npv': f'höchster Kapitalwert ({lifetime_years} Jahre, {discount_rate:.0%})'}
+    
+    print("OPTIMALE KONFIGURATION:")
+    for objective, best in optima.items():
+        print(f"{objective_labels[objective]}: {best.peak_power_kwp:.2f} kWp mit {best.battery_kwh:.2f} kWh Speicher "
+              f"({best.investment:.0f}€, {best.payback_years:.1f} Jahre, Kapitalwert {best.npv:.0f}€, "
+              f"{best.evaluations} Simulationen)")
+    print(f"{'='*60}")
+
+def _json_number(value):
+    """inf/nan sind kein gültiges JSON - als null ausgeben"""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def summarize(results=None, amortization_data=None, optima=None):
+    """Ergebnisse als JSON-fähiges Dict"""
+    summary = {
+        'site': {'latitude': latitude, 'longitude': longitude, 'year': year},
+        'max_feed_kw': max_feed_kw,
+        'electricity_price': electricity_price,
+    }
+    if results is not None:
+        summary['yields_kwh'] = {
+            scenario_name: {
+                battery_name: {name: _json_number(result.total(name)) for name in ('unlimited', 'limited', 'buffered')}
+                for battery_name, result in battery_results.items()
+            }
+            for scenario_name, battery_results in results.items()
+        }
+    if amortization_data is not None:
+        summary['amortization'] = {
+            scenario_name: {
+                option: {key: _json_number(value) for key, value in values.items()}
+                for option, values in options.items()
+            }
+            for scenario_name, options in amortization_data.items()
+        }
+    if optima is not None:
+        summary['optimum'] = {
+            objective: {key: _json_number(value) for key, value in best._asdict().items()}
+            for objective, best in optima.items()
+        }
+    return summary
+
+def build_parser():
+    """Kommandozeile: run (Standard), fetch, simulate, amortize, optimize, montecarlo, selfconsumption, export"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--latitude', type=float, help="Breitengrad des Standorts")
+    common.add_argument('--longitude', type=float, help="Längengrad des Standorts")
+    common.add_argument('--year', type=int, help="Wetterjahr für PVGIS")
+    common.add_argument('--max-feed-kw', type=float, help="Einspeiselimit in kW")
+    common.add_argument('--electricity-price', type=float, help="Strompreis in €/kWh")
+    common.add_argument('--cache-dir', help="Verzeichnis des PVGIS-Caches")
+    common.add_argument('--offline', action='store_true', default=None,
+                        help="Nur Cache verwenden, bei fehlendem Eintrag abbrechen")
+    common.add_argument('--json', action='store_true', help="Ergebnis als JSON auf stdout ausgeben")
+    common.add_argument('--stats', help="Laufzeiten je Stufe und Szenario als JSON speichern")
+    common.add_argument('--trace', help="Trace-Event-Datei speichern (chrome://tracing, Perfetto)")
+    common.add_argument('--trace-memory', action='store_true',
+                        help="Speicherspitze je Stufe mit tracemalloc messen (langsamer)")
+    
+    parser = argparse.ArgumentParser(description="Balkonkraftwerk-Simulation und Wirtschaftlichkeitsanalyse")
+    commands = parser.add_subparsers(dest='command')
+    
+    run = commands.add_parser('run', parents=[common], help="Komplette Analyse mit Grafik")
+    run.add_argument('--no-plot', action='store_true',
+                     help="Keine Grafik erstellen (matplotlib wird nicht geladen; gilt auch mit --json)")
+    run.add_argument('--no-show', action='store_true', help="Grafik nur speichern, nicht anzeigen")
+    run.add_argument('--output', help="Dateiname der Grafik")
+    run.add_argument('--dpi', type=int, help="Auflösung der Grafik")
+    run.add_argument('--preview', action='store_true', help="Schnelle Vorschau mit niedriger Auflösung")
+    run.add_argument('--split', action='store_true', help="Zusätzlich eine Grafik je Speicheroption")
+    run.add_argument('--jobs', type=int, help="Anzahl Render-Prozesse (Standard: alle Kerne)")
+    run.add_argument('--force', action='store_true', help="Auch unveränderte Grafiken neu rendern")
+    
+    commands.add_parser('fetch', parents=[common], help="PVGIS-Daten abrufen und im Cache ablegen")
+    commands.add_parser('simulate', parents=[common], help="Jahreserträge aller Szenarien")
+    commands.add_parser('amortize', parents=[common], help="Amortisationsanalyse")
+    optimize = commands.add_parser('optimize', parents=[common], help="Optimale Konfiguration suchen")
+    optimize.add_argument('--objective', choices=['payback', 'npv'], action='append',
+                          help="Optimierungsziel (mehrfach möglich)")
+    montecarlo = commands.add_parser('montecarlo', parents=[common],
+                                     help="Verteilung von Amortisation und Kapitalwert")
+    montecarlo.add_argument('--samples', type=int, help="Anzahl Stichproben")
+    montecarlo.add_argument('--seed', type=int, help="Startwert des Zufallsgenerators")
+    selfconsumption = commands.add_parser('selfconsumption', parents=[common],
+                                          help="Eigenverbrauch gegen Haushaltslastprofile")
+    selfconsumption.add_argument('--loads', help="CSV mit Lastprofilen (kW, eine Spalte je Haushalt)")
+    selfconsumption.add_argument('--energy', action='store_true',
+                                 help="Werte der CSV sind kWh je Intervall statt kW")
+    selfconsumption.add_argument('--feed-in-tariff', type=float, help="Einspeisevergütung in €/kWh")
+    export = commands.add_parser('export', parents=[common],
+                                 help="Stundenwerte, Monatssummen und Amortisation als Parquet")
+    export.add_argument('--output-dir', help="Zielverzeichnis (Standard: export)")
+    export.add_argument('--compression', help="Parquet-Kompression (Standard: zstd)")
+    return parser
+
+def main(argv=None):
+    """Einstiegspunkt der Kommandozeile"""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv.insert(0, 'run')  # ohne Unterbefehl wie bisher die komplette Analyse
+    args = build_parser().parse_args(argv)
+    
+    overrides = {
+        'latitude': args.latitude, 'longitude': args.longitude, 'year': args.year,
+        'max_feed_kw': args.max_feed_kw, 'electricity_price': args.electricity_price,
+        'pvgis_cache_dir': args.cache_dir, 'offline': args.offline,
+    }
+    configure(**{name: value for name, value in overrides.items() if value is not None})
+    
+    if not (args.stats or args.trace):
+        return _run_command(args)
+    instrumentation.enable(trace_memory=args.trace_memory)
+    try:
+        return _run_command(args)
+    finally:
+        if args.stats:
+            instrumentation.write_summary(args.stats)
+        if args.trace:
+            instrumentation.write_trace(args.trace)
+        instrumentation.disable()
+
+def _run_command(args):
+    verbose = not args.json
+    
+    if args.command == 'fetch':
+        summary = {name: _json_number(get_system_data(config['peak_power'])['P'].sum() / 1000)
+                   for name, config in scenarios.items()}
+        if args.json:
+            print(json.dumps({'annual_pv_kwh': summary}, indent=2))
+        else:
+            for name, energy in summary.items():
+                print(f"{name}: {energy:.2f} kWh PV-Jahresertrag (im Cache)")
+        return 0
+    
+    if args.command == 'montecarlo':
+        summary = run_monte_carlo(args.samples, args.seed)
+        if args.json:
+            print(summary.to_json(orient='records', indent=2))
+        else:
+            print(f"MONTE-CARLO ({args.samples or monte_carlo_samples} Stichproben, "
+                  f"Wetterjahre {monte_carlo_years[0]}-{monte_carlo_years[-1]}):")
+            print(summary.round(2).to_string(index=False))
+        return 0
+    
+    if args.command == 'selfconsumption':
+        if args.feed_in_tariff is not None:
+            configure(feed_in_tariff=args.feed_in_tariff)
+        if not (args.loads or load_profiles_path):
+            print("Keine Lastprofile angegeben (--loads)", file=sys.stderr)
+            return 2
+        summary = run_self_consumption(args.loads, energy=args.energy)
+        if args.json:
+            print(summary.to_json(orient='records', indent=2))
+        else:
+            print(f"EIGENVERBRAUCH ({summary['households'].iloc[0]} Haushalte, Median bzw. Perzentile):")
+            print(summary.round(2).to_string(index=False))
+        return 0
+    
+    if args.command == 'export':
+        exporter = run_export(args.output_dir, args.compression)
+        if args.json:
+            print(json.dumps({'files': exporter.files, 'bytes': exporter.bytes_written}, indent=2))
+        else:
+            print(f"{len(exporter.files)} Dateien ({exporter.bytes_written / 1024 / 1024:.1f} MB) "
+                  f"gespeichert in '{exporter.directory}'")
+        return 0
+    
+    if args.command == 'optimize':
+        optima = find_optimal_configurations(args.objective)
+        if args.json:
+            print(json.dumps(summarize(optima=optima), indent=2))
+        else:
+            print_optimization_report(optima)
+        return 0
+    
+    results, linestyles = run_scenarios(verbose=verbose)
+    if args.command == 'simulate':
+        if args.json:
+            print(json.dumps(summarize(results), indent=2))
+        else:
+            print_yield_report(results)
+        return 0
+    
+    amortization_data = compute_amortization(results)
+    if args.command == 'amortize':
+        if args.json:
+            print(json.dumps(summarize(results, amortization_data), indent=2))
+        else:
+            print_amortization_report(amortization_data)
+        return 0
+    
+    # run: komplette Analyse; mit --json ohne Grafik (kein matplotlib, kein Fenster)
+    if not (args.no_plot or args.json):
+        from plotting import PREVIEW_DPI
         
-        if battery_name == '8.192 kWh':
-            # Vergleich mit 4.096 kWh Batterie
-            df_medium = battery_results['4.096 kWh']
-            total_buffered_medium = df_medium['buffered'].sum()
-            additional_yield = total_buffered - total_buffered_medium
-            print(f"Zusätzlicher Ertrag vs 4.096 kWh: {round(additional_yield, 2)} kWh")
-            print(f"Effizienz-Steigerung:           {round(additional_yield/total_buffered_medium*100, 1)}%")
-
-# Amortisationsanalyse in der Konsole
-print(f"\n{'='*60}")
-print("AMORTISATIONSANALYSE")
-print(f"Strompreis: {electricity_price:.2f} €/kWh")
-print(f"{'='*60}")
-
-for scenario_name in amortization_data.keys():
-    print(f"\n=== {scenario_name} System ===")
-    
-    # Ohne Speicher
-    data_no_storage = amortization_data[scenario_name]['no_storage']
-    print(f"Ohne Speicher:")
-    print(f"  Investition: {data_no_storage['investment']}€")
-    print(f"  Jährliche Ersparnis: {data_no_storage['savings']:.2f}€")
-    print(f"  Amortisationszeit: {data_no_storage['years']:.1f} Jahre")
-    
-    # Mit 2.048 kWh Speicher
-    data_2kwh = amortization_data[scenario_name]['storage_2kwh']
-    print(f"Mit 2.048 kWh Speicher:")
-    print(f"  Investition: {data_2kwh['investment']}€")
-    print(f"  Jährliche Ersparnis: {data_2kwh['savings']:.2f}€")
-    print(f"  Amortisationszeit: {data_2kwh['years']:.1f} Jahre")
-    
-    # Mit 4.096 kWh Speicher
-    data_4kwh = amortization_data[scenario_name]['storage_4kwh']
-    print(f"Mit 4.096 kWh Speicher:")
-    print(f"  Investition: {data_4kwh['investment']}€")
-    print(f"  Jährliche Ersparnis: {data_4kwh['savings']:.2f}€")
-    print(f"  Amortisationszeit: {data_4kwh['years']:.1f} Jahre")
-    
-    # Mit 8.192 kWh Speicher
-    data_8kwh = amortization_data[scenario_name]['storage_8kwh']
-    print(f"Mit 8.192 kWh Speicher:")
-    print(f"  Investition: {data_8kwh['investment']}€")
-    print(f"  Jährliche Ersparnis: {data_8kwh['savings']:.2f}€")
-    print(f"  Amortisationszeit: {data_8kwh['years']:.1f} Jahre")
-    
-    # Vergleichsanalyse
-    best_option = min([
-        ('Ohne Speicher', data_no_storage['years']),
-        ('2.048 kWh Speicher', data_2kwh['years']),
-        ('4.096 kWh Speicher', data_4kwh['years']),
-        ('8.192 kWh Speicher', data_8kwh['years'])
-    ], key=lambda x: x[1])
-    
-    print(f"  → Beste Option: {best_option[0]} ({best_option[1]:.1f} Jahre)")
-
-print(f"\n{'='*60}")
-print("EXTRAPOLIERTE PREISE für größere Systeme:")
-print("4.0 kWp: Ohne Speicher: 1100€ | Mit 2 kWh: 1970€ | Mit 4 kWh: 2570€ | Mit 8 kWh: 3770€")
-print("8.0 kWp: Ohne Speicher: 1900€ | Mit 2 kWh: 3130€ | Mit 4 kWh: 3730€ | Mit 8 kWh: 4500€")
-print(f"{'='*60}")
+        plot_results(results, linestyles, amortization_data, output_path=args.output,
+                     dpi=PREVIEW_DPI if args.preview else args.dpi, show=not args.no_show,
+                     split_columns=args.split, processes=args.jobs, force=args.force, verbose=verbose)
+    optima = find_optimal_configurations()
+    if args.json:
+        print(json.dumps(summarize(results, amortization_data, optima), indent=2))
+    else:
+        print_yield_report(results)
+        print_feed_limit_report(results)
+        print_amortization_report(amortization_data)
+        print_optimization_report(optima)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Monte-Carlo-Verteilung von Amortisationszeit und Kapitalwert
+
+Statt eines Wetterjahres und eines festen Strompreises werden je Stichprobe
+für jedes Betriebsjahr ein Wetterjahr aus der PVGIS-Historie, ein
+Strompreispfad, eine Moduldegradation und ein Kapazitätsverlust der Batterie
+gezogen. Alle Stichproben werden als Arrays (Stichproben × Jahre ×
+Konfigurationen) ausgewertet.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from battery import battery_spec, is_lossless, scale_battery
+from dispatch import dispatch_totals
+
+# Stützstellen für PV-Leistung (Degradation) und Batteriekapazität (Alterung) relativ zum Neuzustand
+PV_FACTORS = np.linspace(0.7, 1.0, 7)
+CAPACITY_FACTORS = np.linspace(0.5, 1.0, 6)
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+MonteCarloSamples = namedtuple('MonteCarloSamples', ['configurations', 'payback_years', 'npv'])
+
+
+def configurations(peak_powers_kwp, battery_capacities_kwh):
+    """Alle Kombinationen aus Peakleistung und Batteriekapazität als Tabelle"""
+    peaks, batteries = np.meshgrid(np.asarray(peak_powers_kwp, dtype=float),
+                                   np.asarray(battery_capacities_kwh, dtype=float), indexing='ij')
+    return pd.DataFrame({'peak_power_kwp': peaks.ravel(), 'battery_kwh': batteries.ravel()})
+
+
+def yield_table(reference_profiles_kw, peak_powers_kwp, battery_capacities_kwh, max_feed_kw,
+                pv_factors=PV_FACTORS, capacity_factors=CAPACITY_FACTORS, batteries=None):
+    """Jahreserträge (kWh) je Wetterjahr, Konfiguration, PV-Faktor und Kapazitätsfaktor
+
+    ``reference_profiles_kw`` sind 1 kWp-Profile, eins je Wetterjahr. Wegen
+    der Linearität gilt ertrag(f·k·pv, C, L) = f·k · ertrag(pv, C/(f·k), L/(f·k));
+    je Wetterjahr genügt daher ein Simulationsdurchlauf für alle Stützstellen.
+    ``batteries`` gibt je Konfiguration die Verlustparameter (``battery.Battery``),
+    die Kapazität kommt weiterhin aus ``battery_capacities_kwh``.
+    Liefert ein Array (Wetterjahre, Konfigurationen, PV-Faktoren, Kapazitätsfaktoren).
+    """
+    peak = np.asarray(peak_powers_kwp, dtype=float)[:, np.newaxis, np.newaxis]
+    battery = np.asarray(battery_capacities_kwh, dtype=float)[:, np.newaxis, np.newaxis]
+    scale = peak * np.asarray(pv_factors, dtype=float)[np.newaxis, :, np.newaxis]
+    capacity = battery * np.asarray(capacity_factors, dtype=float)[np.newaxis, np.newaxis, :]
+    capacity, scale = np.broadcast_arrays(capacity, scale)
+
+    specs = (capacity / scale).ravel()
+    if batteries is not None and not all(is_lossless(battery) for battery in batteries):
+        config = np.broadcast_to(np.arange(len(batteries))[:, np.newaxis, np.newaxis], scale.shape)
+        specs = [scale_battery(battery_spec(batteries[k])._replace(capacity_kwh=c), f)
+                 for k, c, f in zip(config.ravel(), capacity.ravel(), scale.ravel())]
+    tables = [dispatch_totals(profile, specs, (max_feed_kw / scale).ravel())
+              .reshape(scale.shape) * scale
+              for profile in reference_profiles_kw]
+    return np.array(tables)
+
+
+def _interp_weights(grid, values):
+    """Index und Gewicht für lineare Interpolation auf einem aufsteigenden Raster"""
+    values = np.clip(values, grid[0], grid[-1])
+    i = np.clip(np.searchsorted(grid, values, side='right') - 1, 0, len(grid) - 2)
+    return i, (values - grid[i]) / (grid[i + 1] - grid[i])
+
+
+def sample_yields(table, weather, pv_factor, capacity_factor, pv_factors=PV_FACTORS,
+                  capacity_factors=CAPACITY_FACTORS):
+    """Erträge für gezogene Wetterjahre und Alterungszustände (bilinear interpoliert)
+
+    ``weather``, ``pv_factor`` und ``capacity_factor`` haben die Form
+    (Stichproben, Jahre); das Ergebnis (Stichproben, Jahre, Konfigurationen).
+    """
+    i, wi = _interp_weights(pv_factors, pv_factor)
+    j, wj = _interp_weights(capacity_factors, capacity_factor)
+    # table[w, :, i, j] für alle Stichproben auf einmal -> (Stichproben, Jahre, Konfigurationen)
+    t = np.moveaxis(table, 1, -1)
+    wi, wj = wi[..., np.newaxis], wj[..., np.newaxis]
+    return ((1 - wi) * (1 - wj) * t[weather, i, j] + wi * (1 - wj) * t[weather, i + 1, j]
+            + (1 - wi) * wj * t[weather, i, j + 1] + wi * wj * t[weather, i + 1, j + 1])
+
+
+def price_paths(rng, n_samples, lifetime_years, electricity_price, growth=0.02, growth_std=0.01,
+                volatility=0.05):
+    """Strompreis je Stichprobe und Jahr (€/kWh) als geometrischer Zufallspfad
+
+    Die jährliche Teuerung jeder Stichprobe wird aus N(growth, growth_std)
+    gezogen, dazu kommen jährliche Schwankungen mit ``volatility``.
+    """
+    drift = rng.normal(growth, growth_std, (n_samples, 1))
+    shocks = rng.normal(0.0, volatility, (n_samples, lifetime_years))
+    log_growth = np.cumsum(np.log1p(drift) + shocks - volatility ** 2 / 2, axis=1)
+    # Im ersten Jahr gilt der heutige Preis
+    log_growth = np.concatenate((np.zeros((n_samples, 1)), log_growth[:, :-1]), axis=1)
+    return electricity_price * np.exp(log_growth)
+
+
+def payback_from_savings(investment, savings):
+    """Amortisationszeit aus jährlichen Ersparnissen (Stichproben, Jahre, Konfigurationen)
+
+    Innerhalb des Jahres, in dem die kumulierte Ersparnis die Investition
+    übersteigt, wird linear interpoliert; ohne Amortisation ist das Ergebnis inf.
+    """
+    cumulative = np.cumsum(savings, axis=1)
+    reached = cumulative >= investment
+    year = np.argmax(reached, axis=1)  # erstes Jahr mit Amortisation (0-basiert)
+    paid = reached.any(axis=1)
+    before = np.take_along_axis(cumulative, year[:, np.newaxis], axis=1)[:, 0] - \
+        np.take_along_axis(savings, year[:, np.newaxis], axis=1)[:, 0]
+    in_year = np.take_along_axis(savings, year[:, np.newaxis], axis=1)[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (investment - before) / in_year
+    return np.where(paid, year + fraction, np.inf)
+
+
+def monte_carlo(reference_profiles_kw, configs, investment, max_feed_kw, electricity_price,
+                n_samples=10000, lifetime_years=20, discount_rate=0.03,
+                price_growth=0.02, price_growth_std=0.01, price_volatility=0.05,
+                degradation=0.005, degradation_std=0.002,
+                battery_fade=0.02, battery_fade_std=0.005, seed=None, table=None, batteries=None):
+    """Stichproben von Amortisationszeit und Kapitalwert je Konfiguration
+
+    ``configs`` ist eine Tabelle mit ``peak_power_kwp`` und ``battery_kwh``
+    (z.B. aus ``configurations``), ``investment`` die Investition je
+    Konfiguration. Degradation und Batteriealterung sind jährliche Raten je
+    Stichprobe aus einer Normalverteilung. ``batteries`` sind optional die
+    Verlustparameter je Konfiguration (siehe ``yield_table``). Eine vorab
+    berechnete ``yield_table`` kann für weitere Läufe wiederverwendet werden.
+    """
+    rng = np.random.default_rng(seed)
+    if table is None:
+        table = yield_table(reference_profiles_kw, configs['peak_power_kwp'], configs['battery_kwh'],
+                            max_feed_kw, batteries=batteries)
+    investment = np.asarray(investment, dtype=float)
+    years = np.arange(lifetime_years)
+
+    weather = rng.integers(0, table.shape[0], (n_samples, lifetime_years))
+    module_rate = np.clip(rng.normal(degradation, degradation_std, (n_samples, 1)), 0.0, None)
+    fade_rate = np.clip(rng.normal(battery_fade, battery_fade_std, (n_samples, 1)), 0.0, None)
+    pv_factor = (1 - module_rate) ** years
+    capacity_factor = (1 - fade_rate) ** years
+
+    annual_yield = sample_yields(table, weather, pv_factor, capacity_factor)
+    prices = price_paths(rng, n_samples, lifetime_years, electricity_price,
+                         price_growth, price_growth_std, price_volatility)
+    savings = annual_yield * prices[..., np.newaxis]
+
+    discount = (1 + discount_rate) ** -(years + 1.0)
+    npv = np.einsum('syc,y->sc', savings, discount) - investment
+    payback = payback_from_savings(investment, savings)
+    return MonteCarloSamples(configs.reset_index(drop=True), payback, npv)
+
+
+def summarize_samples(samples, percentiles=PERCENTILES):
+    """Perzentile von Amortisationszeit und Kapitalwert je Konfiguration"""
+    summary = samples.configurations.copy()
+    for p in percentiles:
+        summary[f'payback_p{p}'] = np.percentile(samples.payback_years, p, axis=0)
+    for p in percentiles:
+        summary[f'npv_p{p}'] = np.percentile(samples.npv, p, axis=0)
+    summary['payback_within_lifetime'] = np.isfinite(samples.payback_years).mean(axis=0)
+    summary['npv_positive'] = (samples.npv > 0).mean(axis=0)
+    return summary
+
+
+def weather_year_profiles(fetcher, latitude, longitude, years, **job_kwargs):
+    """1 kWp-Profile (kW) für mehrere Wetterjahre aus PVGIS (z.B. 2005-2023)"""
+    from stream import iter_pvgis_years
+
+    return [data['P'].to_numpy(dtype=float) / 1000
+            for data in iter_pvgis_years(fetcher, latitude, longitude, years, peakpower=1.0, **job_kwargs)]
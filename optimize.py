@@ -0,0 +1,131 @@
+from collections import namedtuple
+
+import numpy as np
+
+from battery import scale_batteries
+from dispatch import dispatch_totals, yield_capacity_curve
+
+GOLDEN = (np.sqrt(5) - 1) / 2
+
+OptimizationResult = namedtuple('OptimizationResult', [
+    'peak_power_kwp', 'battery_kwh', 'annual_yield_kwh', 'investment',
+    'annual_savings', 'payback_years', 'npv', 'evaluations'])
+
+
+def annuity_factor(discount_rate, lifetime_years):
+    """Barwertfaktor einer konstanten jährlichen Zahlung"""
+    if discount_rate == 0:
+        return float(lifetime_years)
+    return (1 - (1 + discount_rate) ** -lifetime_years) / discount_rate
+
+
+class ConfigurationOptimizer:
+    """Sucht die Kombination aus Peakleistung und Batteriekapazität mit der besten Wirtschaftlichkeit
+
+    Für eine feste Peakleistung ist der Jahresertrag über die Batteriekapazität
+    exakt als stückweise lineare Kurve bekannt (``yield_capacity_curve``), die
+    Investition ist es über ``price_model`` ebenfalls. Amortisationszeit und
+    Kapitalwert sind auf jedem linearen Abschnitt monoton, das Optimum liegt
+    also auf einer Stützstelle - die Batterieachse ist damit mit einer
+    Simulation erledigt. Über die Peakleistung wird per Goldenem Schnitt
+    gesucht.
+
+    ``battery_model`` ordnet einer Kapazität eine Batterie mit Verlusten zu
+    (z.B. ``battery.interpolate_battery``). Für sie gilt die exakte Kurve
+    nicht; der Ertrag wird dann auf ``capacity_points`` Kapazitäten (plus den
+    Stützstellen der Preistabelle) in einem Durchlauf simuliert.
+    """
+
+    def __init__(self, reference_pv_kw, price_model, electricity_price, max_feed_kw,
+                 objective='payback', discount_rate=0.03, lifetime_years=20, battery_model=None,
+                 capacity_points=33):
+        if objective not in ('payback', 'npv'):
+            raise ValueError(f"Unbekanntes Optimierungsziel: {objective}")
+        self.pv = np.asarray(reference_pv_kw, dtype=float)
+        self.price_model = price_model
+        self.electricity_price = electricity_price
+        self.max_feed_kw = max_feed_kw
+        self.objective = objective
+        self.annuity = annuity_factor(discount_rate, lifetime_years)
+        self.battery_model = battery_model
+        self.capacity_points = capacity_points
+        self.evaluations = 0
+        self._cache = {}
+
+    def best_for_peak(self, peak_power_kwp, max_battery_kwh):
+        """Beste Batteriekapazität für eine feste Peakleistung (exakt)"""
+        key = (float(peak_power_kwp), float(max_battery_kwh))
+        if key in self._cache:
+            return self._cache[key]
+        self.evaluations += 1
+
+        # Linearität: Profil mit k skalieren = Limit und Batterie durch k teilen
+        k = peak_power_kwp
+        table_axis = getattr(self.price_model, 'battery_capacities_kwh', np.array([]))
+        table_axis = table_axis[(table_axis >= 0) & (table_axis <= max_battery_kwh)]
+        if self.battery_model is None:
+            xs, ys = yield_capacity_curve(self.pv, self.max_feed_kw / k, max_battery_kwh / k)
+            capacities, yields = xs * k, ys * k
+            # Knicke der Preistabelle sind ebenfalls Kandidaten
+            candidates = np.union1d(capacities, table_axis)
+            annual_yield = np.interp(candidates, capacities, yields)
+        else:
+            candidates = np.union1d(np.linspace(0.0, max_battery_kwh, self.capacity_points), table_axis)
+            batteries = scale_batteries([self.battery_model(c) for c in candidates], k)
+            annual_yield = dispatch_totals(self.pv, batteries, self.max_feed_kw / k) * k
+        investment = np.asarray(self.price_model(k, candidates), dtype=float)
+        savings = annual_yield * self.electricity_price
+        with np.errstate(divide='ignore'):
+            payback = np.where(savings > 0, investment / savings, np.inf)
+        npv = savings * self.annuity - investment
+
+        i = int(np.argmin(payback)) if self.objective == 'payback' else int(np.argmax(npv))
+        result = OptimizationResult(float(k), float(candidates[i]), float(annual_yield[i]),
+                                    float(investment[i]), float(savings[i]),
+                                    float(payback[i]), float(npv[i]), None)
+        self._cache[key] = result
+        return result
+
+    def _score(self, result):
+        # Kleiner ist besser
+        return result.payback_years if self.objective == 'payback' else -result.npv
+
+    def optimize(self, peak_range, max_battery_kwh, coarse_points=6, tol_kwp=0.01):
+        """Optimale Konfiguration im Bereich ``peak_range`` (kWp) und [0, max_battery_kwh]
+
+        Ein grobes Raster klammert das Optimum ein, danach verfeinert der
+        Goldene Schnitt bis auf ``tol_kwp``.
+        """
+        low, high = peak_range
+        grid = np.linspace(low, high, coarse_points)
+        scores = [self._score(self.best_for_peak(k, max_battery_kwh)) for k in grid]
+        i = int(np.argmin(scores))
+        a, b = grid[max(i - 1, 0)], grid[min(i + 1, coarse_points - 1)]
+
+        c, d = b - GOLDEN * (b - a), a + GOLDEN * (b - a)
+        fc = self._score(self.best_for_peak(c, max_battery_kwh))
+        fd = self._score(self.best_for_peak(d, max_battery_kwh))
+        while b - a > tol_kwp:
+            if fc <= fd:
+                b, d, fd = d, c, fc
+                c = b - GOLDEN * (b - a)
+                fc = self._score(self.best_for_peak(c, max_battery_kwh))
+            else:
+                a, c, fc = c, d, fd
+                d = a + GOLDEN * (b - a)
+                fd = self._score(self.best_for_peak(d, max_battery_kwh))
+
+        best = min(self._cache.values(), key=self._score)
+        return best._replace(evaluations=self.evaluations)
+
+
+def optimize_configuration(reference_pv_kw, price_model, electricity_price, max_feed_kw,
+                           peak_range, max_battery_kwh, objective='payback',
+                           discount_rate=0.03, lifetime_years=20, battery_model=None):
+    """Kurzform: Optimierer erzeugen und beste Konfiguration liefern"""
+    optimizer = ConfigurationOptimizer(reference_pv_kw, price_model, electricity_price,
+                                       max_feed_kw, objective=objective,
+                                       discount_rate=discount_rate,
+                                       lifetime_years=lifetime_years,
+                                       battery_model=battery_model)
+    return optimizer.optimize(peak_range, max_battery_kwh)
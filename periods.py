@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Zeiträume, wie sie auch pandas.resample verwendet (Monats-, Tages-, Wochenende)
+MONTHLY = 'ME'
+DAILY = 'D'
+WEEKLY = 'W'
+
+
+class PeriodBins(namedtuple('PeriodBins', ['freq', 'codes', 'labels'])):
+    """Vorberechnete Zuordnung Stunde -> Zeitraum für schnelle Summen per bincount"""
+
+    @property
+    def count(self):
+        return len(self.labels)
+
+
+def period_bins(index, freq=MONTHLY):
+    """Zuordnung der Zeitstempel zu Zeiträumen (Beschriftung wie bei ``resample(freq)``)"""
+    index = pd.DatetimeIndex(index)
+    counts = pd.Series(np.ones(len(index), dtype=np.int64), index=index).resample(freq).count()
+    if not index.is_monotonic_increasing:
+        raise ValueError("Zeitindex muss aufsteigend sortiert sein")
+    codes = np.repeat(np.arange(len(counts)), counts.to_numpy())
+    return PeriodBins(freq, codes, counts.index)
+
+
+def reduce_periods(values, bins):
+    """Summen je Zeitraum entlang der letzten Achse (1-D oder 2-D)"""
+    values = np.asarray(values)
+    if values.ndim == 1:
+        return np.bincount(bins.codes, weights=values, minlength=bins.count)
+    rows = values.reshape(-1, values.shape[-1])
+    sums = [np.bincount(bins.codes, weights=row, minlength=bins.count) for row in rows]
+    return np.array(sums).reshape(values.shape[:-1] + (bins.count,))
@@ -0,0 +1,141 @@
+"""Inkrementelle Neuberechnung der Analyse über Fingerabdrücke je Stufe
+
+Die Analyse läuft in Stufen (Abruf → Simulation → Aggregation → Amortisation
+→ Grafik). Jede Stufe bekommt einen Fingerabdruck aus genau den Eingaben,
+von denen sie abhängt, einschließlich der Fingerabdrücke vorheriger Stufen.
+Ergebnisse werden im Speicher gehalten und - sofern die Stufe eine Kodierung
+als Arrays hat - als .npz abgelegt. Ändert sich nur der Strompreis oder die
+Preistabelle, bleiben Abruf und Simulation gültig; neu berechnet werden nur
+die Stufen dahinter.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import stage
+
+# Bei Änderungen an Simulation oder Ablageformat erhöhen, damit alte Ergebnisse nicht mehr passen
+PIPELINE_VERSION = 1
+
+
+def update_hash(h, obj):
+    """Verschachtelte Dicts, Listen, Arrays und einfache Werte in einen Hash einfließen lassen"""
+    if isinstance(obj, dict):
+        for key in sorted(obj):
+            h.update(repr(key).encode())
+            update_hash(h, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        h.update(b'[%d' % len(obj))
+        for item in obj:
+            update_hash(h, item)
+        h.update(b']')
+    elif isinstance(obj, np.ndarray) and obj.dtype != object:
+        h.update(str(obj.dtype).encode() + repr(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    else:
+        h.update(repr(obj).encode())
+
+
+def fingerprint(*parts):
+    """SHA-256 über die Eingaben einer Stufe"""
+    h = hashlib.sha256()
+    update_hash(h, (PIPELINE_VERSION,) + parts)
+    return h.hexdigest()
+
+
+class ResultStore:
+    """Abgelegte Zwischenergebnisse: eine .npz-Datei je Stufe und Fingerabdruck
+
+    Ein Ergebnis ist ein Dict aus Arrays und JSON-fähigen Werten; letztere
+    landen gemeinsam in einem Metadaten-Eintrag.
+    """
+
+    suffix = '.npz'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, step, key):
+        return os.path.join(self.directory, step, key + self.suffix)
+
+    def load(self, step, key):
+        """Ergebnis laden oder None, falls nicht vorhanden"""
+        path = self._path(step, key)
+        try:
+            with stage('pipeline_load', step=step) as s, np.load(path, allow_pickle=False) as archive:
+                values = {name: archive[name] for name in archive.files if name != '__meta__'}
+                values.update(json.loads(archive['__meta__'].tobytes().decode('utf-8')))
+                s.count(cache_bytes=os.path.getsize(path))
+        except FileNotFoundError:
+            return None
+        return values
+
+    def store(self, step, key, values):
+        """Ergebnis atomar ablegen"""
+        arrays = {name: value for name, value in values.items() if isinstance(value, np.ndarray)}
+        meta = {name: value for name, value in values.items() if name not in arrays}
+        arrays['__meta__'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+        directory = os.path.join(self.directory, step)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self._path(step, key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class Pipeline:
+    """Stufenergebnisse nach Fingerabdruck: erst Speicher, dann Ablage, sonst neu berechnen
+
+    ``stats`` zählt je Stufe, wie oft das Ergebnis aus dem Speicher
+    ('memory'), aus der Ablage ('disk') kam oder berechnet wurde ('computed').
+    Im Speicher werden höchstens ``max_entries`` Ergebnisse gehalten.
+    """
+
+    def __init__(self, store_dir=None, max_entries=256):
+        self.store = ResultStore(store_dir) if store_dir else None
+        self.max_entries = max_entries
+        self.stats = {}
+        self._memory = OrderedDict()
+
+    def run(self, step, key, compute, encode=None, decode=None):
+        """Ergebnis der Stufe ``step`` für den Fingerabdruck ``key``
+
+        ``compute()`` berechnet das Ergebnis. Nur Stufen mit ``encode``
+        (Ergebnis -> Dict aus Arrays) und ``decode`` werden abgelegt; günstige
+        Stufen bleiben nur im Speicher.
+        """
+        counts = self.stats.setdefault(step, {'memory': 0, 'disk': 0, 'computed': 0})
+        if (step, key) in self._memory:
+            self._memory.move_to_end((step, key))
+            counts['memory'] += 1
+            return self._memory[(step, key)]
+
+        values = None
+        if self.store is not None and decode is not None:
+            values = self.store.load(step, key)
+        if values is not None:
+            result = decode(values)
+            counts['disk'] += 1
+        else:
+            result = compute()
+            counts['computed'] += 1
+            if self.store is not None and encode is not None:
+                self.store.store(step, key, encode(result))
+
+        self._memory[(step, key)] = result
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        return result
+
+    def clear(self):
+        """Ergebnisse im Speicher verwerfen (die Ablage bleibt erhalten)"""
+        self._memory.clear()
@@ -0,0 +1,240 @@
+import hashlib
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline import update_hash
+
+# Bei Änderungen an der Darstellung erhöhen, damit vorhandene Grafiken neu gerendert werden
+RENDER_VERSION = 1
+
+# Auflösung für schnelle Vorschauen (Standard für die Analyse sind 300 dpi)
+PREVIEW_DPI = 60
+
+# Layouts: komplette 4x4-Matrix oder eine Spalte (eine Speicheroption) je Grafik
+GRID = 'grid'
+COLUMN = 'column'
+FIGSIZES = {GRID: (25, 20), COLUMN: (6.5, 20)}
+
+# Eine Spalte der Analysegrafik: Monatserträge, kumulierte Erträge, Amortisation, Ersparnisse
+StorageColumn = namedtuple('StorageColumn', [
+    'key', 'battery', 'quantity', 'title', 'line_label', 'line_color',
+    'annotation_color', 'bar_color'])
+
+STORAGE_COLUMNS = (
+    # Batterie ist ohne Speicher irrelevant - Limit-Reihe aus dem 2.048 kWh-Ergebnis
+    StorageColumn('no_storage', '2.048 kWh', 'limited', 'Ohne Speicher', '800W Limit',
+                  'C1', 'orange', 'orange'),
+    StorageColumn('storage_2kwh', '2.048 kWh', 'buffered', '2.048 kWh Speicher', '800W + Speicher',
+                  'C2', 'lightgreen', 'lightgreen'),
+    StorageColumn('storage_4kwh', '4.096 kWh', 'buffered', '4.096 kWh Speicher', '800W + Speicher',
+                  'C2', 'lightgreen', 'darkgreen'),
+    StorageColumn('storage_8kwh', '8.192 kWh', 'buffered', '8.192 kWh Speicher', '800W + Speicher',
+                  'C2', 'lightgreen', 'darkblue'),
+)
+
+# Horizontaler Versatz der Endwert-Beschriftungen je PV-System (Punkte)
+ANNOTATION_X_OFFSETS = [10, -50, -100, -150]
+
+RenderJob = namedtuple('RenderJob', ['data', 'output_path', 'dpi', 'layout'])
+
+
+def figure_data(monthly_data, monthly_cum_data, amortization_data, linestyles, electricity_price):
+    """Alle Werte der Analysegrafik als einfache, picklebare Struktur (ohne DataFrames)
+
+    Nur diese Daten gehen in den Inhalts-Hash und an die Render-Prozesse.
+    """
+    scenario_names = list(amortization_data.keys())
+    columns = []
+    for column in STORAGE_COLUMNS:
+        lines = []
+        for scenario_name, battery_data in monthly_data.items():
+            monthly = battery_data[column.battery]
+            monthly_cum = monthly_cum_data[scenario_name][column.battery]
+            # Zeitstempel als datetime64 (UTC), damit der Hash nicht von Objekt-Arrays abhängt
+            lines.append((scenario_name, linestyles[scenario_name],
+                          monthly.index.to_numpy(dtype='datetime64[ns]'),
+                          monthly[column.quantity].to_numpy(dtype=float),
+                          monthly_cum.index.to_numpy(dtype='datetime64[ns]'),
+                          monthly_cum[f'{column.quantity}_cum'].to_numpy(dtype=float)))
+        options = [amortization_data[name][column.key] for name in scenario_names]
+        columns.append({
+            'spec': tuple(column),
+            'lines': lines,
+            'names': scenario_names,
+            'years': [o['years'] for o in options],
+            'investment': [o['investment'] for o in options],
+            'savings': [o['savings'] for o in options],
+        })
+    return {'electricity_price': electricity_price, 'columns': columns}
+
+
+def content_hash(job):
+    """SHA-256 über Grafikdaten, Layout, Auflösung und Ausgabeformat"""
+    import matplotlib
+
+    h = hashlib.sha256()
+    update_hash(h, (RENDER_VERSION, matplotlib.__version__, job.layout, job.dpi,
+                     os.path.splitext(job.output_path)[1].lower(), job.data))
+    return h.hexdigest()
+
+
+def _hash_path(output_path):
+    """Versteckte Datei neben der Grafik mit dem Hash ihres Inhalts"""
+    directory, name = os.path.split(output_path)
+    return os.path.join(directory, f'.{name}.sha256')
+
+
+def is_up_to_date(job, digest=None):
+    """Gibt es die Grafik schon und passt sie zu den aktuellen Daten?"""
+    if not os.path.exists(job.output_path):
+        return False
+    try:
+        with open(_hash_path(job.output_path)) as f:
+            stored = f.read().strip()
+    except OSError:
+        return False
+    return stored == (digest or content_hash(job))
+
+
+def _annotate_bars(ax, bars, labels):
+    for bar, label in zip(bars, labels):
+        ax.annotate(label,
+                    xy=(bar.get_x() + bar.get_width()/2, bar.get_height()),
+                    xytext=(0, 3), textcoords='offset points',
+                    ha='center', va='bottom', fontsize=8, fontweight='bold')
+
+
+def draw_column(axes, column, electricity_price):
+    """Eine Speicheroption in vier Achsen zeichnen (von oben nach unten)"""
+    spec = StorageColumn(*column['spec'])
+    ax_monthly, ax_cum, ax_amortization, ax_savings = axes
+
+    # Monatliche und kumulative Erträge
+    for j, (scenario_name, linestyle, x, monthly, x_cum, cum) in enumerate(column['lines']):
+        label = f"{scenario_name} - {spec.line_label}"
+        ax_monthly.plot(x, monthly, label=label, linewidth=2, linestyle=linestyle, color=spec.line_color)
+        ax_cum.plot(x_cum, cum, label=label, linewidth=2, linestyle=linestyle, color=spec.line_color)
+
+        # Endwert als Beschriftung am letzten Monat
+        ax_cum.annotate(f'{cum[-1]:.1f} kWh',
+                        xy=(x_cum[-1], cum[-1]),
+                        xytext=(ANNOTATION_X_OFFSETS[j], 0),
+                        textcoords='offset points',
+                        bbox=dict(boxstyle='round,pad=0.3',
+                                  facecolor=spec.annotation_color,
+                                  alpha=0.7 - j*0.1),
+                        fontsize=7, fontweight='bold')
+
+    ax_monthly.set_title(f"Monatliche Erträge - {spec.title}")
+    ax_monthly.set_ylabel("Energieertrag (kWh/Monat)")
+    ax_monthly.grid(True)
+    ax_monthly.legend(fontsize=8)
+
+    ax_cum.set_title(f"Kumulative Erträge - {spec.title}")
+    ax_cum.set_ylabel("Kumulativer Energieertrag (kWh)")
+    ax_cum.set_xlabel("Monat")
+    ax_cum.grid(True)
+    ax_cum.legend(fontsize=8)
+
+    # Amortisation mit Investitionskosten
+    names, years = column['names'], column['years']
+    bars = ax_amortization.bar(names, years, color=spec.bar_color, alpha=0.7)
+    ax_amortization.set_title(f"Amortisationszeit - {spec.title}")
+    ax_amortization.set_ylabel("Jahre")
+    ax_amortization.set_ylim(0, max(years) * 1.1)
+    ax_amortization.grid(True, alpha=0.3)
+    _annotate_bars(ax_amortization, bars,
+                   [f'{bar.get_height():.1f} Jahre\n({investment}€)'
+                    for bar, investment in zip(bars, column['investment'])])
+
+    # Jährliche Ersparnisse mit zugehörigem Ertrag
+    savings = column['savings']
+    bars = ax_savings.bar(names, savings, color=spec.bar_color, alpha=0.7)
+    ax_savings.set_title(f"Jährliche Ersparnisse - {spec.title}")
+    ax_savings.set_ylabel("Ersparnisse (€/Jahr)")
+    ax_savings.set_ylim(0, max(savings) * 1.1)
+    ax_savings.grid(True, alpha=0.3)
+    _annotate_bars(ax_savings, bars,
+                   [f'{bar.get_height():.0f}€/Jahr\n({value / electricity_price:.0f} kWh)'
+                    for bar, value in zip(bars, savings)])
+
+
+def draw_figure(fig, data):
+    """Analysegrafik in eine leere Figure zeichnen"""
+    columns = data['columns']
+    axes = fig.subplots(4, len(columns), squeeze=False)
+    for i, column in enumerate(columns):
+        draw_column(axes[:, i], column, data['electricity_price'])
+    fig.tight_layout()
+
+
+def _render(job, digest=None):
+    """Eine Grafik ohne pyplot (kein GUI-Backend, keine globalen Zustände) rendern"""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=FIGSIZES[job.layout])
+    draw_figure(fig, job.data)
+    fig.savefig(job.output_path, dpi=job.dpi, bbox_inches='tight')
+    with open(_hash_path(job.output_path), 'w') as f:
+        f.write(digest or content_hash(job))
+    return job.output_path
+
+
+def render_figures(jobs, processes=None, force=False):
+    """Mehrere Grafiken parallel in Worker-Prozessen rendern
+
+    Grafiken, deren Datei zum Inhalts-Hash der Daten passt, werden
+    übersprungen. Liefert je Job (Pfad, neu gerendert?).
+    """
+    jobs = list(jobs)
+    digests = [content_hash(job) for job in jobs]
+    todo = [i for i, (job, digest) in enumerate(zip(jobs, digests))
+            if force or not is_up_to_date(job, digest)]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(todo)))
+
+    if processes == 1:
+        for i in todo:
+            _render(jobs[i], digests[i])
+    elif todo:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            list(executor.map(_render, [jobs[i] for i in todo], [digests[i] for i in todo]))
+
+    rendered = set(todo)
+    return [(job.output_path, i in rendered) for i, job in enumerate(jobs)]
+
+
+def column_path(output_path, column):
+    """Dateiname der Einzelgrafik einer Speicheroption, z.B. analyse_storage_2kwh.png"""
+    stem, ext = os.path.splitext(output_path)
+    return f'{stem}_{StorageColumn(*column["spec"]).key}{ext}'
+
+
+def plot_analysis(monthly_data, monthly_cum_data, amortization_data, linestyles, electricity_price,
+                  output_path='balkonkraftwerk_analysis.png', dpi=300, show=False,
+                  split_columns=False, processes=None, force=False):
+    """Erstellt die 4x4-Analysegrafik und speichert sie unter ``output_path``
+
+    Das Format folgt der Dateiendung (z.B. ``.svg``). Mit ``split_columns``
+    entsteht zusätzlich je Speicheroption eine eigene Grafik. Unveränderte
+    Grafiken werden nicht neu gerendert; ``show`` öffnet die Grafik im
+    interaktiven Fenster. Liefert je Grafik (Pfad, neu gerendert?).
+    """
+    data = figure_data(monthly_data, monthly_cum_data, amortization_data, linestyles, electricity_price)
+    jobs = [RenderJob(data, output_path, dpi, GRID)]
+    if split_columns:
+        jobs += [RenderJob(dict(data, columns=[column]), column_path(output_path, column), dpi, COLUMN)
+                 for column in data['columns']]
+
+    figures = render_figures(jobs, processes=processes, force=force)
+
+    if show:
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=FIGSIZES[GRID])
+        draw_figure(fig, data)
+        plt.show()
+    return figures
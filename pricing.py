@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def _interp_index(axis, values):
+    """Segmentindex und Gewicht für lineare Interpolation mit Extrapolation an den Rändern"""
+    i = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+    weight = (values - axis[i]) / (axis[i + 1] - axis[i])
+    return i, weight
+
+
+class PriceModel:
+    """Investitionskosten als Funktion von Peakleistung und Batteriekapazität
+
+    Interpoliert bilinear in einer Preistabelle (Zeilen: kWp, Spalten: kWh).
+    Außerhalb der Tabelle wird linear extrapoliert.
+    """
+
+    def __init__(self, peak_powers_kwp, battery_capacities_kwh, table):
+        self.peak_powers_kwp = np.asarray(peak_powers_kwp, dtype=float)
+        self.battery_capacities_kwh = np.asarray(battery_capacities_kwh, dtype=float)
+        self.table = np.asarray(table, dtype=float)
+        if self.table.shape != (len(self.peak_powers_kwp), len(self.battery_capacities_kwh)):
+            raise ValueError("Preistabelle passt nicht zu den Achsen")
+        if len(self.peak_powers_kwp) < 2 or len(self.battery_capacities_kwh) < 2:
+            raise ValueError("Preistabelle braucht mindestens zwei Stützstellen je Achse")
+
+    @classmethod
+    def from_prices(cls, prices, storage_capacities):
+        """Aus dem ``prices``-Dict von main.py erzeugen
+
+        ``prices`` ist nach '<kWp> kWp' und Speicher-Schlüssel verschachtelt,
+        ``storage_capacities`` ordnet jedem Speicher-Schlüssel seine Kapazität
+        in kWh zu (z.B. {'no_storage': 0.0, 'storage_2kwh': 2.048}).
+        """
+        peak_powers = sorted(prices, key=lambda name: float(name.split()[0]))
+        storages = sorted(storage_capacities, key=storage_capacities.get)
+        table = [[prices[peak][storage] for storage in storages] for peak in peak_powers]
+        return cls([float(name.split()[0]) for name in peak_powers],
+                   [storage_capacities[storage] for storage in storages], table)
+
+    def __call__(self, peak_power_kwp, battery_capacity_kwh):
+        """Investitionskosten in € (Arrays werden gegeneinander gebroadcastet)"""
+        peak, battery = np.broadcast_arrays(np.asarray(peak_power_kwp, dtype=float),
+                                            np.asarray(battery_capacity_kwh, dtype=float))
+        i, wi = _interp_index(self.peak_powers_kwp, peak)
+        j, wj = _interp_index(self.battery_capacities_kwh, battery)
+        t = self.table
+        return ((1 - wi) * (1 - wj) * t[i, j] + wi * (1 - wj) * t[i + 1, j]
+                + (1 - wi) * wj * t[i, j + 1] + wi * wj * t[i + 1, j + 1])
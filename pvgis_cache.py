@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+# Version des Cache-Formats - bei Änderungen erhöhen, damit alte Einträge nicht mehr passen
+CACHE_FORMAT_VERSION = 1
+
+
+class CacheMissError(LookupError):
+    """Eintrag nicht im Cache vorhanden und Netzwerkzugriff nicht erlaubt"""
+
+
+def cache_key(latitude, longitude, start, end, raddatabase, peakpower, loss,
+              surface_tilt, surface_azimuth):
+    """Inhaltsadresse (SHA-256) für eine PVGIS-Abfrage"""
+    params = {
+        'version': CACHE_FORMAT_VERSION,
+        'latitude': float(latitude),
+        'longitude': float(longitude),
+        'start': int(start),
+        'end': int(end),
+        'raddatabase': str(raddatabase),
+        'peakpower': float(peakpower),
+        'loss': float(loss),
+        'surface_tilt': float(surface_tilt),
+        'surface_azimuth': float(surface_azimuth),
+    }
+    payload = json.dumps(params, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+class PVGISCache:
+    """Lokaler Cache für stündliche PVGIS-Daten
+
+    Jeder Eintrag ist eine komprimierte .npz-Datei mit einer Spalte pro Array
+    und dem Zeitindex als int64-Nanosekunden. Übersteigt die Gesamtgröße
+    ``max_bytes``, werden die am längsten nicht genutzten Einträge gelöscht.
+    """
+
+    suffix = '.npz'
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024, offline=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def load(self, key):
+        """Eintrag laden oder None, falls nicht vorhanden"""
+        path = self._path(key)
+        try:
+            with stage('cache_load') as s, np.load(path, allow_pickle=False) as archive:
+                meta = json.loads(archive['__meta__'].tobytes().decode('utf-8'))
+                columns = {name: archive[f'col_{i}'] for i, name in enumerate(meta['columns'])}
+                index = pd.DatetimeIndex(archive['__index__'].astype('datetime64[ns]'),
+                                         name=meta['index_name'])
+                s.count(rows=len(index), cache_bytes=os.path.getsize(path))
+        except FileNotFoundError:
+            return None
+        if meta['tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(meta['tz'])
+        # Zugriffszeit aktualisieren, damit die Verdrängung LRU-artig arbeitet
+        os.utime(path)
+        return pd.DataFrame(columns, index=index)
+
+    def store(self, key, df):
+        """DataFrame spaltenweise ablegen und ggf. alte Einträge verdrängen"""
+        index = pd.DatetimeIndex(df.index)
+        tz = str(index.tz) if index.tz is not None else None
+        if tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        meta = {'columns': [str(c) for c in df.columns], 'tz': tz, 'index_name': df.index.name}
+        arrays = {f'col_{i}': df[c].to_numpy() for i, c in enumerate(df.columns)}
+        arrays['__index__'] = index.values.astype('datetime64[ns]').view('int64')
+        arrays['__meta__'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+        # Atomar schreiben, damit parallele Läufe nie halbe Dateien sehen
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Älteste Einträge löschen, bis die Größenbeschränkung eingehalten ist"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get_or_fetch(self, key, fetch):
+        """Eintrag aus dem Cache holen oder über ``fetch()`` laden und speichern"""
+        df = self.load(key)
+        if df is not None:
+            return df
+        if self.offline:
+            raise CacheMissError(f"PVGIS-Daten nicht im Cache ({key[:12]}...) und Offline-Modus aktiv")
+        df = fetch()
+        self.store(key, df)
+        return df
@@ -0,0 +1,225 @@
+import io
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from instrumentation import stage
+from pvgis_cache import CacheMissError, cache_key
+
+PVGIS_URL = 'https://re.jrc.ec.europa.eu/api/'
+
+# HTTP-Status, bei denen sich ein erneuter Versuch lohnt (429 = PVGIS-Ratenlimit)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class FetchJob(namedtuple('FetchJob', [
+        'latitude', 'longitude', 'year', 'peakpower', 'loss',
+        'surface_tilt', 'surface_azimuth', 'raddatabase'])):
+    """Eine PVGIS-Abfrage: Standort, Jahr und Ausrichtung"""
+
+    def __new__(cls, latitude, longitude, year, peakpower=1.0, loss=15,
+                surface_tilt=35, surface_azimuth=180, raddatabase='PVGIS-SARAH3'):
+        return super().__new__(cls, latitude, longitude, year, peakpower, loss,
+                               surface_tilt, surface_azimuth, raddatabase)
+
+    def cache_key(self):
+        """Gleicher Schlüssel wie bei get_system_data, damit beide Wege den Cache teilen"""
+        return cache_key(latitude=self.latitude, longitude=self.longitude,
+                         start=self.year, end=self.year,
+                         raddatabase=self.raddatabase, peakpower=self.peakpower,
+                         loss=self.loss, surface_tilt=self.surface_tilt,
+                         surface_azimuth=self.surface_azimuth)
+
+    def request_params(self):
+        """Query-Parameter für den PVGIS-Endpunkt 'seriescalc' (wie pvlib)"""
+        return {
+            'lat': self.latitude, 'lon': self.longitude, 'outputformat': 'json',
+            'angle': self.surface_tilt, 'aspect': self.surface_azimuth - 180,
+            'pvcalculation': 1, 'pvtechchoice': 'crystSi', 'mountingplace': 'free',
+            'trackingtype': 0, 'components': 1, 'usehorizon': 1,
+            'optimalangles': 0, 'optimalinclination': 0, 'loss': self.loss,
+            'raddatabase': self.raddatabase, 'startyear': self.year,
+            'endyear': self.year, 'peakpower': self.peakpower,
+        }
+
+
+FetchResult = namedtuple('FetchResult', ['job', 'data', 'error', 'from_cache'])
+
+
+class PVGISRequestError(RuntimeError):
+    """PVGIS hat die Anfrage dauerhaft abgelehnt oder alle Versuche sind gescheitert"""
+
+
+class RateLimiter:
+    """Token-Bucket: höchstens ``rate`` Anfragen pro Sekunde über alle Threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        """Alle Threads für eine Weile ausbremsen (z.B. nach HTTP 429)"""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+def _retry_after(response, default):
+    """Wartezeit aus dem Retry-After-Header lesen (nur Sekundenangabe)"""
+    try:
+        return max(float(response.headers.get('Retry-After', default)), 0.0)
+    except ValueError:
+        return default
+
+
+class PVGISFetcher:
+    """Nebenläufiger PVGIS-Abruf mit Connection-Pool, Ratenlimit und Wiederholungen
+
+    PVGIS erlaubt ca. 30 Anfragen pro Sekunde und IP und antwortet darüber
+    mit HTTP 429. Ergebnisse werden über ``fetch_many`` in der Reihenfolge
+    ihres Eintreffens geliefert.
+    """
+
+    def __init__(self, max_workers=8, rate_limit=25.0, retries=5, backoff=0.5,
+                 max_backoff=30.0, timeout=30, url=PVGIS_URL, cache=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.url = url
+        self.cache = cache
+        self.rate_limiter = RateLimiter(rate_limit)
+
+        self._requests = requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, job):
+        """Eine Abfrage mit exponentiellem Backoff ausführen und Rohtext liefern"""
+        last_error = None
+        for attempt in range(self.retries + 1):
+            delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+            self.rate_limiter.wait()
+            try:
+                res = self.session.get(self.url + 'seriescalc',
+                                       params=job.request_params(), timeout=self.timeout)
+            except (self._requests.ConnectionError, self._requests.Timeout) as e:
+                last_error = e
+            else:
+                if res.ok:
+                    return res.text
+                if res.status_code not in RETRY_STATUS:
+                    # PVGIS liefert bei 400 eine JSON-Fehlermeldung
+                    try:
+                        message = res.json()['message']
+                    except Exception:
+                        message = f"HTTP {res.status_code}"
+                    raise PVGISRequestError(message)
+                last_error = PVGISRequestError(f"HTTP {res.status_code}")
+                if res.status_code == 429:
+                    delay = min(_retry_after(res, delay), self.max_backoff)
+                    self.rate_limiter.pause(delay)
+            if attempt < self.retries:
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        raise PVGISRequestError(f"PVGIS-Abfrage nach {self.retries + 1} Versuchen "
+                                f"fehlgeschlagen: {last_error}")
+
+    def fetch(self, job):
+        """Eine Abfrage ausführen und als DataFrame (wie pvlib) liefern"""
+        from pvlib.iotools import read_pvgis_hourly
+
+        with stage('pvgis_fetch', latitude=job.latitude, longitude=job.longitude, year=job.year) as s:
+            text = self._request(job)
+            data, _ = read_pvgis_hourly(io.StringIO(text), pvgis_format='json')
+            s.count(rows=len(data), bytes=len(text.encode('utf-8')))
+        return data
+
+    def _run(self, job):
+        try:
+            if self.cache is not None:
+                key = job.cache_key()
+                data = self.cache.load(key)
+                if data is not None:
+                    return FetchResult(job, data, None, True)
+                if self.cache.offline:
+                    raise CacheMissError(f"PVGIS-Daten für {job} nicht im Cache und Offline-Modus aktiv")
+                data = self.fetch(job)
+                self.cache.store(key, data)
+            else:
+                data = self.fetch(job)
+        except Exception as e:
+            return FetchResult(job, None, e, False)
+        return FetchResult(job, data, None, False)
+
+    def fetch_many(self, jobs):
+        """Alle Abfragen nebenläufig ausführen und FetchResults liefern, sobald sie fertig sind
+
+        Es sind höchstens ``2 * max_workers`` Abfragen gleichzeitig eingeplant,
+        sodass auch Tausende Jobs nur begrenzt Speicher belegen. Fehler werden
+        nicht ausgelöst, sondern im Feld ``error`` zurückgegeben.
+        """
+        jobs = iter(jobs)
+        max_pending = 2 * self.max_workers
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = set()
+            for job in jobs:
+                pending.add(executor.submit(self._run, job))
+                if len(pending) >= max_pending:
+                    break
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for job in jobs:
+                        pending.add(executor.submit(self._run, job))
+                        break
+                    yield future.result()
+
+    def fetch_ordered(self, jobs, prefetch=None):
+        """Wie ``fetch_many``, aber in der Reihenfolge der Jobs (z.B. Jahr für Jahr)
+
+        Es werden höchstens ``prefetch`` (Standard: ``max_workers``) Jobs im
+        Voraus geladen, damit ein langsamer Verbraucher den Speicher nicht füllt.
+        """
+        jobs = iter(jobs)
+        prefetch = prefetch or self.max_workers
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque(executor.submit(self._run, job) for job in islice(jobs, prefetch))
+            while pending:
+                result = pending.popleft().result()
+                for job in islice(jobs, 1):
+                    pending.append(executor.submit(self._run, job))
+                yield result
+
+
+def fetch_many(jobs, **kwargs):
+    """Kurzform: PVGISFetcher erzeugen und alle Jobs abrufen"""
+    with PVGISFetcher(**kwargs) as fetcher:
+        yield from fetcher.fetch_many(jobs)
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from periods import MONTHLY, period_bins, reduce_periods
+
+# Spalten eines Simulationsergebnisses; 'unlimited' ist dasselbe Array wie 'P'
+COLUMNS = ('P', 'unlimited', 'limited', 'buffered')
+CUM_COLUMNS = ('unlimited_cum', 'limited_cum', 'buffered_cum')
+
+
+class SimulationResult:
+    """Simulationsergebnis einer Konfiguration auf Basis zusammenhängender Arrays
+
+    Ergebnisse desselben Profils teilen sich Zeitindex, PV-Leistung und die
+    begrenzte Einspeisung; je Batterie kommt nur die gepufferte Einspeisung
+    hinzu. Kumulierte Reihen, Monatssummen und Monatsendwerte werden erst beim
+    ersten Zugriff berechnet und dann vorgehalten. Zeitraumsummen, die schon
+    die Simulation geliefert hat (``aggregates``: freq -> (Beschriftung,
+    Summen je Spalte)), werden direkt übernommen. Spaltenzugriff per
+    ``result['buffered']`` liefert wie beim früheren DataFrame eine Series.
+    """
+
+    def __init__(self, index, pv_kw, limited, buffered, aggregates=None):
+        self.index = index
+        self._arrays = {'P': pv_kw, 'unlimited': pv_kw, 'limited': limited, 'buffered': buffered}
+        self._cum = {}
+        self._aggregates = dict(aggregates or {})
+        self._periods = {}
+
+    @property
+    def columns(self):
+        return list(COLUMNS + CUM_COLUMNS)
+
+    def values(self, name):
+        """Rohes Array einer Spalte (auch kumulierte Spalten)"""
+        if name in self._arrays:
+            return self._arrays[name]
+        if name in CUM_COLUMNS:
+            if name not in self._cum:
+                base = self._arrays[name[:-len('_cum')]]
+                self._cum[name] = np.cumsum(base, dtype=base.dtype)
+            return self._cum[name]
+        raise KeyError(name)
+
+    def __getitem__(self, name):
+        return pd.Series(self.values(name), index=self.index, name=name, copy=False)
+
+    def total(self, name):
+        """Summe einer Spalte über den gesamten Zeitraum (kWh)"""
+        return float(self.values(name).sum(dtype=np.float64))
+
+    def to_frame(self):
+        """Alle Spalten als DataFrame (wie früher von simulate_system geliefert)"""
+        return pd.DataFrame({name: self.values(name) for name in self.columns}, index=self.index)
+
+    def period_sums(self, freq=MONTHLY):
+        """Summen je Zeitraum ('ME' Monat, 'W' Woche, 'D' Tag) der Leistungsspalten"""
+        if freq not in self._periods:
+            if freq in self._aggregates:
+                labels, sums = self._aggregates[freq]
+            else:
+                bins = period_bins(self.index, freq)
+                labels = bins.labels
+                sums = {name: reduce_periods(self._arrays[name], bins) for name in COLUMNS}
+            self._periods[freq] = pd.DataFrame(sums, index=labels, columns=list(COLUMNS))
+        return self._periods[freq]
+
+    def period_end_cum(self, freq=MONTHLY):
+        """Kumulierte Werte jeweils zum Ende eines Zeitraums"""
+        key = freq + '_cum'
+        if key not in self._periods:
+            sums = self.period_sums(freq)[['unlimited', 'limited', 'buffered']]
+            self._periods[key] = sums.cumsum().add_suffix('_cum')
+        return self._periods[key]
+
+    @property
+    def monthly(self):
+        """Monatssummen der Leistungsspalten"""
+        return self.period_sums(MONTHLY)
+
+    @property
+    def monthly_cum(self):
+        """Kumulierte Werte zum Monatsende"""
+        return self.period_end_cum(MONTHLY)
+
+    @property
+    def nbytes(self):
+        """Speicherbedarf der eigenen und geteilten Arrays (ohne Zwischenspeicher)"""
+        arrays = {id(a): a for a in self._arrays.values()}
+        return sum(a.nbytes for a in arrays.values())
+
+
+def batch_results(index, pv_kw, limited, buffered, dtype=np.float64, bins=(), aggregates=None):
+    """Eine SimulationResult je Zeile von ``buffered``; PV und Limit werden geteilt
+
+    ``bins`` und ``aggregates`` sind die Zeiträume und Summen aus
+    ``dispatch_periods`` für dieselben Konfigurationen.
+    """
+    pv = np.ascontiguousarray(pv_kw, dtype=dtype)
+    limited = np.ascontiguousarray(limited, dtype=dtype)
+    buffered = np.ascontiguousarray(buffered, dtype=dtype)
+    results = []
+    for i, row in enumerate(buffered):
+        row_aggregates = {}
+        for b in bins:
+            sums = aggregates[b.freq]
+            row_aggregates[b.freq] = (b.labels, {
+                'P': sums['unlimited'], 'unlimited': sums['unlimited'],
+                'limited': sums['limited'][i], 'buffered': sums['buffered'][i],
+            })
+        results.append(SimulationResult(index, pv, limited, row, aggregates=row_aggregates))
+    return results
+
+
+def pack_results(results, freqs=()):
+    """Ergebnisse eines Profils (aus ``batch_results``) als Dict aus Arrays zum Ablegen
+
+    Zeitindex als int64-Nanosekunden (UTC), dazu die Zeitraumsummen der
+    Frequenzen ``freqs``, damit sie nach dem Laden nicht neu berechnet werden.
+    """
+    first = results[0]
+    index = pd.DatetimeIndex(first.index)
+    tz = str(index.tz) if index.tz is not None else None
+    if tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    packed = {
+        'index': index.values.astype('datetime64[ns]').view('int64'),
+        'tz': tz,
+        'freqs': list(freqs),
+        'P': first.values('P'),
+        'limited': first.values('limited'),
+        'buffered': np.stack([result.values('buffered') for result in results]),
+    }
+    for freq in freqs:
+        sums = [result.period_sums(freq) for result in results]
+        packed[f'{freq}_unlimited'] = sums[0]['unlimited'].to_numpy()
+        packed[f'{freq}_limited'] = np.stack([s['limited'].to_numpy() for s in sums])
+        packed[f'{freq}_buffered'] = np.stack([s['buffered'].to_numpy() for s in sums])
+    return packed
+
+
+def unpack_results(packed):
+    """Gegenstück zu ``pack_results``: Liste von SimulationResult"""
+    index = pd.DatetimeIndex(packed['index'].astype('datetime64[ns]'))
+    if packed['tz'] is not None:
+        index = index.tz_localize('UTC').tz_convert(packed['tz'])
+    bins = [period_bins(index, freq) for freq in packed['freqs']]
+    aggregates = {freq: {name: packed[f'{freq}_{name}'] for name in ('unlimited', 'limited', 'buffered')}
+                  for freq in packed['freqs']}
+    return batch_results(index, packed['P'], packed['limited'], packed['buffered'], bins=bins,
+                         aggregates=aggregates)
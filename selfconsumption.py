@@ -0,0 +1,212 @@
+"""Eigenverbrauch gegen Haushaltslastprofile: ein PV-Profil, viele Haushalte
+
+Die Ersparnis ``Jahresertrag × Strompreis`` setzt voraus, dass jede
+eingespeiste kWh Netzstrom ersetzt. Hier wird die Einspeisung stattdessen
+gegen stündliche oder viertelstündliche Lastprofile (Standardlastprofile,
+Smart-Meter-Exporte) simuliert und in Direktverbrauch, Verbrauch aus dem
+Speicher, Netzeinspeisung und Abregelung aufgeteilt. Alle Lastprofile
+laufen gemeinsam in einem Durchlauf über die Zeitschritte.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from battery import broadcast_params, split_batteries
+from instrumentation import stage
+
+# Jahressummen (kWh) je Lastprofil
+SelfConsumption = namedtuple('SelfConsumption', [
+    'pv', 'load', 'direct', 'charged', 'discharged', 'exported', 'curtailed', 'grid_import'])
+
+# Lastprofile je Block: (Zeitschritte × Profile) wird für die Schleife transponiert kopiert
+DEFAULT_CHUNK_SIZE = 1024
+
+
+def read_load_profiles(path, energy=False):
+    """Lastprofile aus einer CSV: Zeitstempel in der ersten Spalte, eine Spalte je Haushalt
+
+    Werte in kW; mit ``energy=True`` sind es kWh je Intervall (typisch für
+    Smart-Meter-Exporte) und werden in mittlere Leistung umgerechnet.
+    """
+    frame = pd.read_csv(path, index_col=0, parse_dates=True).astype(float)
+    if energy:
+        step_hours = (frame.index[1] - frame.index[0]) / pd.Timedelta(hours=1)
+        frame = frame / step_hours
+    return frame
+
+
+def scale_to_annual(load_kw, annual_kwh, steps_per_hour=1):
+    """Lastprofile (Profile × Zeitschritte) auf einen Jahresverbrauch je Profil skalieren
+
+    Standardlastprofile sind meist auf 1000 kWh normiert; ``annual_kwh`` ist
+    ein Wert oder ein Wert je Profil.
+    """
+    load = np.atleast_2d(np.asarray(load_kw, dtype=float))
+    current = load.sum(axis=1) / steps_per_hour
+    return load * (np.asarray(annual_kwh, dtype=float) / current)[..., np.newaxis]
+
+
+def _steps_per_hour(pv_hours, load_steps):
+    if load_steps % pv_hours:
+        raise ValueError(f"Lastprofil mit {load_steps} Zeitschritten passt nicht zu {pv_hours} PV-Stunden")
+    return load_steps // pv_hours
+
+
+def simulate_self_consumption(pv_kw, load_kw, battery, max_feed_kw, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Energieflüsse (kWh) einer Anlage für viele Lastprofile in einem Durchlauf
+
+    ``pv_kw`` ist das stündliche PV-Profil, ``load_kw`` ein Lastprofil
+    (Zeitschritte) oder viele (Profile × Zeitschritte) in gleicher zeitlicher
+    Reihenfolge; Viertelstundenwerte sind erlaubt, die PV-Leistung gilt dann
+    die ganze Stunde. ``battery`` ist eine Kapazität oder eine Batterie mit
+    Verlusten (``battery.Battery``), eine für alle oder eine je Profil.
+
+    Je Zeitschritt deckt PV zuerst die Last (bis zum Einspeiselimit), der
+    Überschuss lädt die Batterie, der Rest wird eingespeist, soweit das Limit
+    reicht, sonst abgeregelt. Fehlt danach Leistung für die Last, entlädt die
+    Batterie - ebenfalls nur bis zum Limit. Liegt die Last immer über dem
+    Limit, entspricht das genau der Speicher-Simulation in ``dispatch``.
+    ``charged`` ist die in die Batterie geladene PV-Energie vor den Verlusten.
+    """
+    pv = np.asarray(pv_kw, dtype=float)
+    load = np.atleast_2d(np.asarray(load_kw, dtype=float))
+    steps_per_hour = _steps_per_hour(pv.shape[0], load.shape[1])
+    step_hours = 1.0 / steps_per_hour
+    capacities, params = split_batteries(battery, step_hours)
+    capacity = np.broadcast_to(np.asarray(capacities, dtype=float), load.shape[:1])
+    if params is not None:
+        params = broadcast_params(params, load.shape[:1])
+
+    # PV-Energie und Limit je Zeitschritt (für alle Profile gleich)
+    pv_step = np.repeat(pv * step_hours, steps_per_hour)
+    limit = max_feed_kw * step_hours
+    direct_pv = np.minimum(pv_step, limit)
+
+    totals = np.zeros((5, load.shape[0]))  # direct, charged, discharged, exported, curtailed
+    with stage('self_consumption') as s:
+        for start in range(0, load.shape[0], chunk_size):
+            chunk = slice(start, start + chunk_size)
+            if params is None:
+                totals[:, chunk] = _dispatch_chunk(pv_step, direct_pv, limit,
+                                                   load[chunk] * step_hours, capacity[chunk])
+            else:
+                totals[:, chunk] = _lossy_chunk(pv_step, direct_pv, limit, load[chunk] * step_hours,
+                                                [p[chunk] for p in params])
+        s.count(rows=load.size, profiles=load.shape[0])
+
+    direct, charged, discharged, exported, curtailed = totals
+    load_total = load.sum(axis=1) * step_hours
+    return SelfConsumption(
+        pv=np.full(load.shape[0], pv_step.sum()),
+        load=load_total,
+        direct=direct,
+        charged=charged,
+        discharged=discharged,
+        exported=exported,
+        curtailed=curtailed,
+        grid_import=load_total - direct - discharged,
+    )
+
+
+def _dispatch_chunk(pv_step, direct_pv, limit, load_kwh, capacity):
+    """Zeitschleife für einen Block von Lastprofilen (Energien je Zeitschritt in kWh)"""
+    steps = np.ascontiguousarray(load_kwh.T)  # eine Zeile je Zeitschritt für die Schleife
+    n = capacity.shape[0]
+    soc = np.zeros(n)  # Batterie zu Beginn leer
+    direct, spare, flow, headroom = (np.empty(n) for _ in range(4))
+    totals = np.zeros((5, n))
+    direct_total, charged, discharged, exported, curtailed = totals
+
+    for t, load_t in enumerate(steps):
+        # PV deckt zuerst die Last, höchstens bis zum Einspeiselimit
+        np.minimum(load_t, direct_pv[t], out=direct)
+        direct_total += direct
+        np.subtract(pv_step[t], direct, out=spare)
+        np.subtract(limit, direct, out=headroom)
+
+        # Überschuss lädt die Batterie
+        np.subtract(capacity, soc, out=flow)
+        np.minimum(flow, spare, out=flow)
+        soc += flow
+        charged += flow
+        spare -= flow
+
+        # Rest einspeisen, soweit das Limit reicht, sonst abregeln
+        np.minimum(spare, headroom, out=flow)
+        exported += flow
+        spare -= flow
+        curtailed += spare
+
+        # Fehlende Last aus der Batterie, ebenfalls bis zum Limit
+        np.subtract(load_t, direct, out=flow)
+        np.minimum(flow, headroom, out=flow)
+        np.minimum(flow, soc, out=flow)
+        soc -= flow
+        discharged += flow
+
+    return totals
+
+
+def _lossy_chunk(pv_step, direct_pv, limit, load_kwh, params):
+    """Wie ``_dispatch_chunk``, mit Wirkungsgrad, Lade-/Entladeleistung, Reserve und Selbstentladung"""
+    capacity, eta_c, eta_d, charge_limit, discharge_limit, reserve, retention = params
+    steps = np.ascontiguousarray(load_kwh.T)
+    n = capacity.shape[0]
+    soc = reserve.copy()  # Batterie zu Beginn auf der Reserve
+    direct, spare, flow, headroom = (np.empty(n) for _ in range(4))
+    totals = np.zeros((5, n))
+    direct_total, charged, discharged, exported, curtailed = totals
+
+    for t, load_t in enumerate(steps):
+        soc *= retention
+        np.minimum(load_t, direct_pv[t], out=direct)
+        direct_total += direct
+        np.subtract(pv_step[t], direct, out=spare)
+        np.subtract(limit, direct, out=headroom)
+
+        # Überschuss lädt die Batterie, begrenzt durch Ladeleistung und freien Platz
+        np.subtract(capacity, soc, out=flow)
+        flow /= eta_c
+        np.minimum(flow, charge_limit, out=flow)
+        np.minimum(flow, spare, out=flow)
+        np.maximum(flow, 0.0, out=flow)
+        charged += flow
+        spare -= flow
+        flow *= eta_c
+        soc += flow
+
+        np.minimum(spare, headroom, out=flow)
+        exported += flow
+        spare -= flow
+        curtailed += spare
+
+        # Fehlende Last aus der Batterie bis zum Limit, begrenzt durch Entladeleistung und Reserve
+        np.subtract(load_t, direct, out=flow)
+        np.minimum(flow, headroom, out=flow)
+        np.minimum(flow, discharge_limit, out=flow)
+        np.subtract(soc, reserve, out=spare)
+        np.maximum(spare, 0.0, out=spare)
+        spare *= eta_d
+        np.minimum(flow, spare, out=flow)
+        discharged += flow
+        flow /= eta_d
+        soc -= flow
+
+    return totals
+
+
+def savings(flows, electricity_price, feed_in_tariff=0.0):
+    """Jährliche Ersparnis (€) je Lastprofil: Eigenverbrauch zum Strompreis, Einspeisung zur Vergütung"""
+    return (flows.direct + flows.discharged) * electricity_price + flows.exported * feed_in_tariff
+
+
+def summarize_flows(flows, electricity_price, feed_in_tariff=0.0):
+    """Energieflüsse je Lastprofil als Tabelle mit Eigenverbrauchs- und Autarkiequote"""
+    table = pd.DataFrame(flows._asdict())
+    self_consumed = flows.direct + flows.discharged
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table['self_consumption_rate'] = self_consumed / flows.pv
+        table['autarky_rate'] = self_consumed / flows.load
+    table['savings'] = savings(flows, electricity_price, feed_in_tariff)
+    return table
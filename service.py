@@ -0,0 +1,387 @@
+"""Angebotsdienst: Ertrag, Ersparnis und Amortisation per HTTP mit warmen Caches
+
+    python service.py --port 8080 --workers 4
+
+    GET  /quote?latitude=54.17&longitude=9.38&peak_power_kwp=2&battery_kwh=2.048
+    POST /quote      {"latitude": 54.17, ...} oder eine Liste solcher Anfragen
+    GET  /metrics    Latenzen (p50/p99), Cache-Treffer, gebündelte Simulationen
+    GET  /health
+
+Parameter wie in ``fleet.py``: Pflicht sind ``latitude``, ``longitude`` und
+``peak_power_kwp``, die übrigen haben Standardwerte. 1 kWp-Profile und
+Jahreserträge bleiben in LRU-Caches im Speicher. Gleichzeitige Anfragen für
+dasselbe Profil werden zu einer Speicher-Simulation für alle angefragten
+Konfigurationen gebündelt.
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from battery import Battery, scale_batteries
+from dispatch import dispatch_totals, limited_totals
+from fleet import BATTERY_COLUMNS, PROFILE_COLUMNS, REQUIRED_COLUMNS, SITE_DEFAULTS
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error', 502: 'Bad Gateway'}
+
+# Ganzzahlige Anfrageparameter; alle übrigen sind Gleitkommazahlen
+INTEGER_PARAMS = ('year',)
+QUOTE_PARAMS = REQUIRED_COLUMNS + tuple(SITE_DEFAULTS) + BATTERY_COLUMNS + ('investment',)
+
+
+class LRUCache:
+    """Einfacher LRU-Cache mit Trefferzählung (nur aus der Event-Loop benutzen)"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses}
+
+
+class LatencyMetrics:
+    """Antwortzeiten der letzten ``window`` Anfragen je Endpunkt"""
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.count = 0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self._samples.append(seconds)
+
+    def snapshot(self):
+        if not self._samples:
+            return {'count': self.count}
+        p50, p99 = np.percentile(np.fromiter(self._samples, dtype=float), [50, 99]) * 1000
+        return {'count': self.count, 'p50_ms': p50, 'p99_ms': p99,
+                'max_ms': max(self._samples) * 1000}
+
+
+def parse_quote(params):
+    """Anfrageparameter prüfen, in Zahlen umwandeln und mit Standardwerten ergänzen"""
+    unknown = sorted(set(params) - set(QUOTE_PARAMS))
+    if unknown:
+        raise ValueError(f"Unbekannte Parameter: {', '.join(unknown)}")
+    missing = [name for name in REQUIRED_COLUMNS if params.get(name) is None]
+    if missing:
+        raise ValueError(f"Fehlende Parameter: {', '.join(missing)}")
+    quote = dict(SITE_DEFAULTS, investment=None, **dict.fromkeys(BATTERY_COLUMNS))
+    for name, value in params.items():
+        if value is not None:
+            quote[name] = int(value) if name in INTEGER_PARAMS else float(value)
+    if quote['peak_power_kwp'] <= 0:
+        raise ValueError("peak_power_kwp muss größer als 0 sein")
+    return quote
+
+
+def quote_battery(quote):
+    """Batterie einer Anfrage: Kapazität oder, mit Verlustparametern, ``battery.Battery``"""
+    losses = {name: quote[name] for name in BATTERY_COLUMNS if quote[name] is not None}
+    if not losses:
+        return quote['battery_kwh']
+    return Battery(quote['battery_kwh'], **losses)
+
+
+def batch_yields(profile_kw, configs):
+    """Jahreserträge (ohne Limit, mit Limit, mit Limit und Speicher) für viele Konfigurationen
+
+    ``configs`` sind (Peakleistung, Batterie, Einspeiselimit), die Batterie
+    als Kapazität oder ``battery.Battery``. Gerechnet wird auf dem
+    1 kWp-Profil mit Batterie und Limit je kWp; wegen der Linearität wird das
+    Ergebnis nur mit der Peakleistung multipliziert. Alle Konfigurationen
+    laufen in einer Speicher-Simulation.
+    """
+    peaks, batteries, feeds = zip(*configs)
+    peak = np.array(peaks, dtype=float)
+    feed = np.array(feeds, dtype=float)
+    unlimited = profile_kw.sum() * peak
+    limited = limited_totals(profile_kw, feed / peak) * peak
+    buffered = dispatch_totals(profile_kw, scale_batteries(list(batteries), peak), feed / peak) * peak
+    return np.column_stack((unlimited, limited, buffered))
+
+
+def _finite(value):
+    """inf/nan sind kein gültiges JSON - als null ausgeben"""
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+class QuoteService:
+    """Beantwortet Angebotsanfragen aus warmen Caches und bündelt Simulationen je Profil
+
+    ``fetcher`` liefert die 1 kWp-Profile (``PVGISFetcher``), ``price_model``
+    die Investition, falls die Anfrage keine nennt, ``cashflow_model``
+    Kapitalwert und dynamische Amortisation. Höchstens ``workers``
+    Simulationen laufen gleichzeitig. Anfragen, die innerhalb von
+    ``batch_window`` Sekunden für dasselbe Profil eintreffen, werden gemeinsam
+    simuliert.
+    """
+
+    def __init__(self, fetcher, price_model, cashflow_model=None, workers=4, profile_cache_size=256,
+                 result_cache_size=100000, batch_window=0.002):
+        self.fetcher = fetcher
+        self.price_model = price_model
+        self.cashflow_model = cashflow_model
+        self.workers = workers
+        self.batch_window = batch_window
+        self.profiles = LRUCache(profile_cache_size)
+        self.results = LRUCache(result_cache_size)
+        self.latency = {}
+        self.batches = 0
+        self.batched_configs = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._semaphore = None
+        self._profile_fetches = {}  # Profil -> laufender Abruf
+        self._pending = {}  # Profil -> {Konfiguration: Future}
+        self._flushes = set()  # laufende Bündel-Simulationen (Referenz bis zum Ende halten)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _profile(self, key):
+        """1 kWp-Profil (kW) aus dem Cache; gleichzeitige Abrufe desselben Profils werden geteilt"""
+        profile = self.profiles.get(key)
+        if profile is not None:
+            return profile
+        if key not in self._profile_fetches:
+            self._profile_fetches[key] = asyncio.ensure_future(self._fetch_profile(key))
+        return await asyncio.shield(self._profile_fetches[key])
+
+    async def _fetch_profile(self, key):
+        from pvgis_fetch import FetchJob
+
+        latitude, longitude, year, loss, tilt, azimuth = key
+        job = FetchJob(latitude, longitude, year, peakpower=1.0, loss=loss,
+                       surface_tilt=tilt, surface_azimuth=azimuth)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: next(self.fetcher.fetch_ordered([job])))
+            if result.error is not None:
+                raise result.error
+            profile = result.data['P'].to_numpy(dtype=float) / 1000
+            self.profiles.put(key, profile)
+            return profile
+        finally:
+            del self._profile_fetches[key]
+
+    async def _yields(self, profile_key, config):
+        """Jahreserträge einer Konfiguration - aus dem Cache oder mit anderen Anfragen gebündelt"""
+        cached = self.results.get((profile_key, config))
+        if cached is not None:
+            return cached, True
+        profile = await self._profile(profile_key)
+
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(profile_key)
+        if batch is None:
+            batch = self._pending[profile_key] = {}
+            loop.call_later(self.batch_window, self._start_flush, profile_key, profile)
+        if config not in batch:
+            batch[config] = loop.create_future()
+        return await asyncio.shield(batch[config]), False
+
+    def _start_flush(self, profile_key, profile):
+        # Ohne Referenz könnte der Task vor dem Ende eingesammelt werden
+        task = asyncio.ensure_future(self._flush(profile_key, profile))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, profile_key, profile):
+        """Alle gesammelten Konfigurationen eines Profils in einer Simulation rechnen"""
+        batch = self._pending.pop(profile_key)
+        configs = list(batch)
+        try:
+            async with self._semaphore:
+                totals = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, batch_yields, profile, configs)
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.batched_configs += len(configs)
+        for config, values in zip(configs, totals):
+            self.results.put((profile_key, config), values)
+            batch[config].set_result(values)
+
+    async def quote(self, params):
+        """Ertrag, Investition, Ersparnis und Amortisation für eine Anfrage"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        quote = parse_quote(params)
+        profile_key = tuple(quote[name] for name in PROFILE_COLUMNS)
+        config = (quote['peak_power_kwp'], quote_battery(quote), quote['max_feed_kw'])
+        (unlimited, limited, buffered), cached = await self._yields(profile_key, config)
+
+        investment = quote['investment']
+        if investment is None:
+            investment = float(self.price_model(quote['peak_power_kwp'], quote['battery_kwh']))
+        savings = buffered * quote['electricity_price']
+        response = dict(quote, investment=investment, annual_pv_kwh=unlimited,
+                        annual_limited_kwh=limited, annual_yield_kwh=buffered, annual_savings=savings,
+                        payback_years=investment / savings if savings > 0 else math.inf, cached=cached)
+        if self.cashflow_model is not None:
+            metrics = self.cashflow_model.evaluate(investment, buffered, quote['electricity_price'],
+                                                   quote['battery_kwh'])
+            response.update(npv=metrics.npv, irr=metrics.irr,
+                            discounted_payback_years=metrics.discounted_payback_years)
+        return {name: value if value is None or isinstance(value, (bool, int, str)) else _finite(value)
+                for name, value in response.items()}
+
+    def metrics(self):
+        """Latenzen je Endpunkt, Cache-Statistik und Bündelung"""
+        return {
+            'latency': {route: metrics.snapshot() for route, metrics in self.latency.items()},
+            'profile_cache': self.profiles.stats(),
+            'result_cache': self.results.stats(),
+            'batches': self.batches,
+            'batched_configurations': self.batched_configs,
+            'workers': self.workers,
+        }
+
+    async def handle(self, method, target, body):
+        """Eine HTTP-Anfrage beantworten; liefert (Status, JSON-fähige Antwort)"""
+        url = urlsplit(target)
+        if url.path == '/health':
+            return 200, {'status': 'ok'}
+        if url.path == '/metrics':
+            return 200, self.metrics()
+        if url.path != '/quote':
+            return 404, {'error': f"Unbekannter Pfad: {url.path}"}
+        try:
+            if method == 'GET':
+                return 200, await self.quote(dict(parse_qsl(url.query)))
+            if method != 'POST':
+                return 405, {'error': "Nur GET und POST"}
+            payload = json.loads(body or b'{}')
+            if isinstance(payload, list):
+                return 200, list(await asyncio.gather(*(self.quote(params) for params in payload)))
+            return 200, await self.quote(payload)
+        except (ValueError, TypeError) as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            return 502, {'error': f"{type(e).__name__}: {e}"}
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        """JSON-Antwort mit Status und Connection-Header schreiben"""
+        data = json.dumps(payload).encode('utf-8')
+        writer.write((f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                      f"Content-Type: application/json\r\n"
+                      f"Content-Length: {len(data)}\r\n"
+                      f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1')
+                     + data)
+        await writer.drain()
+
+    async def _connection(self, reader, writer):
+        """HTTP/1.1 mit Keep-Alive: Anfragen einer Verbindung nacheinander beantworten"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                start = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError
+                except ValueError:
+                    # Ohne gültige Anfragezeile bzw. Länge ist das Ende der Anfrage unbekannt
+                    await self._respond(writer, 400, {'error': "Ungültige Anfrage"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length)
+
+                status, payload = await self.handle(method, target, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                route = urlsplit(target).path
+                self.latency.setdefault(route, LatencyMetrics()).observe(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Verbindung abgebrochen
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """HTTP-Server starten und bis zum Abbruch laufen lassen"""
+        server = await asyncio.start_server(self._connection, host, port)
+        print(f"Angebotsdienst läuft auf http://{host}:{port} ({self.workers} Worker)")
+        async with server:
+            await server.serve_forever()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP-Dienst für Ertrags- und Amortisationsangebote")
+    parser.add_argument('--host', default='127.0.0.1', help="Adresse (Standard: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8080, help="Port (Standard: 8080)")
+    parser.add_argument('--workers', type=int, default=4, help="Gleichzeitige Simulationen")
+    parser.add_argument('--profile-cache', type=int, default=256, help="Anzahl 1 kWp-Profile im Speicher")
+    parser.add_argument('--result-cache', type=int, default=100000, help="Anzahl Jahreserträge im Speicher")
+    parser.add_argument('--batch-window-ms', type=float, default=2.0,
+                        help="Wartezeit zum Bündeln gleichzeitiger Anfragen je Profil")
+    parser.add_argument('--cache-dir', help="Verzeichnis des PVGIS-Caches")
+    parser.add_argument('--offline', action='store_true', default=None,
+                        help="Nur Cache verwenden, bei fehlendem Eintrag abbrechen")
+    args = parser.parse_args(argv)
+
+    import main
+    from pvgis_fetch import PVGISFetcher
+
+    overrides = {'pvgis_cache_dir': args.cache_dir, 'offline': args.offline}
+    main.configure(**{name: value for name, value in overrides.items() if value is not None})
+
+    with PVGISFetcher(cache=main.get_pvgis_cache()) as fetcher:
+        service = QuoteService(fetcher, main.get_price_model(), main.get_cashflow_model(),
+                               workers=args.workers, profile_cache_size=args.profile_cache,
+                               result_cache_size=args.result_cache,
+                               batch_window=args.batch_window_ms / 1000)
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from dispatch import broadcast_batteries, dispatch_periods
+from periods import MONTHLY, period_bins
+
+QUANTITIES = ('unlimited', 'limited', 'buffered')
+
+
+class StreamingSimulator:
+    """Speicher-Simulation über beliebig lange Zeitreihen in Abschnitten
+
+    Die Stundenwerte werden abschnittsweise (z.B. Jahr für Jahr) übergeben.
+    Der Ladestand wird über Abschnittsgrenzen fortgeschrieben, gespeichert
+    werden nur Monatssummen und Gesamtsummen - der Speicherbedarf hängt
+    daher nicht von der Länge der Zeitreihe ab. Batterien dürfen wie in
+    ``dispatch_periods`` Verlustparameter haben (``battery.Battery``).
+    """
+
+    def __init__(self, battery_capacities_kwh, max_feed_kw, labels=None):
+        self.batteries = battery_capacities_kwh
+        self.capacity, self.feed_limit, params = broadcast_batteries(battery_capacities_kwh, max_feed_kw)
+        self.labels = list(labels) if labels is not None else list(self.capacity)
+        if len(self.labels) != self.capacity.shape[0]:
+            raise ValueError("Anzahl der Bezeichnungen passt nicht zu den Konfigurationen")
+        # Batterie zu Beginn leer bzw. auf der Reserve
+        self.soc = params.reserve.copy() if params is not None else np.zeros(self.capacity.shape)
+        self.totals = {name: np.zeros(self.capacity.shape) for name in QUANTITIES}
+        self.hours = 0
+        self._monthly = {}  # Monatscode (Jahr*12 + Monat-1) -> Summen je Größe
+        self._last_timestamp = None
+
+    def update(self, data):
+        """Nächsten Abschnitt mit PVGIS-Daten (Spalte P in W) simulieren"""
+        index = pd.DatetimeIndex(pd.to_datetime(data.index))
+        if len(index) == 0:
+            return
+        if self._last_timestamp is not None and index[0] <= self._last_timestamp:
+            raise ValueError("Abschnitte müssen zeitlich aufsteigend übergeben werden")
+        self._last_timestamp = index[-1]
+
+        pv = data['P'].to_numpy(dtype=float) / 1000  # in kW
+        bins = period_bins(index, MONTHLY)
+        aggregates, _, self.soc = dispatch_periods(pv, self.batteries, self.feed_limit, [bins],
+                                                   soc_kwh=self.soc)
+        sums = aggregates[MONTHLY]
+
+        # Monatscodes (Jahr*12 + Monat-1), damit angebrochene Monate über Abschnitte addiert werden
+        codes = bins.labels.year * 12 + bins.labels.month - 1
+        for i, code in enumerate(codes):
+            month = self._monthly.setdefault(code, {name: np.zeros(self.capacity.shape) for name in QUANTITIES})
+            month['unlimited'] += sums['unlimited'][i]
+            month['limited'] += sums['limited'][:, i]
+            month['buffered'] += sums['buffered'][:, i]
+            self.totals['unlimited'] += sums['unlimited'][i]
+            self.totals['limited'] += sums['limited'][:, i]
+            self.totals['buffered'] += sums['buffered'][:, i]
+        self.hours += len(index)
+
+    def monthly_sums(self):
+        """Monatssummen (kWh); Spalten: (Größe, Konfiguration)"""
+        codes = sorted(self._monthly)
+        index = pd.DatetimeIndex([pd.Timestamp(year=c // 12, month=c % 12 + 1, day=1) + pd.offsets.MonthEnd(0)
+                                  for c in codes])
+        columns = pd.MultiIndex.from_product([QUANTITIES, self.labels])
+        rows = [np.concatenate([self._monthly[c][name] for name in QUANTITIES]) for c in codes]
+        return pd.DataFrame(rows, index=index, columns=columns)
+
+    def monthly_cumulative(self):
+        """Kumulierte Werte zum Monatsende seit Beginn des Streams"""
+        return self.monthly_sums().cumsum()
+
+    def annual_sums(self):
+        """Jahressummen (kWh); Spalten wie ``monthly_sums``"""
+        monthly = self.monthly_sums()
+        return monthly.groupby(monthly.index.year).sum()
+
+
+def simulate_stream(chunks, battery_capacities_kwh, max_feed_kw, labels=None):
+    """Alle Abschnitte eines Iterators (z.B. ``iter_pvgis_years``) durchsimulieren"""
+    simulator = StreamingSimulator(battery_capacities_kwh, max_feed_kw, labels=labels)
+    for chunk in chunks:
+        simulator.update(chunk)
+    return simulator
+
+
+def iter_pvgis_years(fetcher, latitude, longitude, years, **job_kwargs):
+    """PVGIS-Daten Jahr für Jahr liefern; die nächsten Jahre werden im Hintergrund geladen"""
+    from pvgis_fetch import FetchJob
+
+    jobs = (FetchJob(latitude, longitude, year, **job_kwargs) for year in years)
+    for result in fetcher.fetch_ordered(jobs):
+        if result.error is not None:
+            raise result.error
+        yield result.data
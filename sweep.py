@@ -0,0 +1,116 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from battery import battery_list, capacity_of, scale_batteries
+from dispatch import dispatch_totals
+
+# Referenzprofil im Worker-Prozess (wird aus dem Shared Memory eingeblendet)
+_profile = None
+_profile_shm = None
+
+
+def _attach_profile(name, length):
+    """Worker-Initialisierung: Referenzprofil ohne Kopie aus dem Shared Memory lesen"""
+    global _profile, _profile_shm
+    _profile_shm = shared_memory.SharedMemory(name=name)
+    _profile = np.ndarray((length,), dtype=np.float64, buffer=_profile_shm.buf)
+
+
+def _sweep_chunk(batteries, feed_limits):
+    return dispatch_totals(_profile, batteries, feed_limits)
+
+
+def sweep_yields(reference_pv_kw, peak_powers_kwp, battery_capacities_kwh, max_feeds_kw,
+                 processes=None, chunk_size=4096):
+    """Jahresertrag (kWh) für alle Kombinationen aus kWp × Batterie × Einspeiselimit
+
+    ``reference_pv_kw`` ist das stündliche Profil einer 1 kWp-Anlage. Da die
+    Speicher-Simulation linear in der Leistung ist, gilt
+    ertrag(k·pv, C, L) = k · ertrag(pv, C/k, L/k) - alle Anlagengrößen laufen
+    daher gemeinsam gegen dasselbe Referenzprofil. Batterien sind Kapazitäten
+    oder haben Verlustparameter (``battery.Battery``, skaliert mit
+    ``battery.scale_battery``). Liefert ein Array der Form
+    (kWp, Batterie, Einspeiselimit).
+    """
+    pv = np.ascontiguousarray(reference_pv_kw, dtype=np.float64)
+    peak_powers = np.asarray(peak_powers_kwp, dtype=float)
+    if np.any(peak_powers <= 0):
+        # Skalierung auf das 1 kWp-Profil teilt durch die Peakleistung
+        raise ValueError("peak_powers_kwp muss größer als 0 sein")
+    batteries = battery_list(battery_capacities_kwh)
+    peaks, battery_index, feeds = np.meshgrid(peak_powers, np.arange(len(batteries)),
+                                              np.asarray(max_feeds_kw, dtype=float), indexing='ij')
+    scaled_batteries = scale_batteries([batteries[i] for i in battery_index.ravel()], peaks.ravel())
+    scaled_feeds = (feeds / peaks).ravel()
+    n_configs = scaled_feeds.shape[0]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, -(-n_configs // chunk_size)))
+
+    if processes == 1:
+        totals = dispatch_totals(pv, scaled_batteries, scaled_feeds)
+    else:
+        # Gleich große Blöcke je Prozess, damit alle Worker gleich lange rechnen
+        bounds = np.linspace(0, n_configs, max(processes, -(-n_configs // chunk_size)) + 1).astype(int)
+        shm = shared_memory.SharedMemory(create=True, size=pv.nbytes)
+        try:
+            np.ndarray(pv.shape, dtype=np.float64, buffer=shm.buf)[:] = pv
+            with ProcessPoolExecutor(max_workers=processes, initializer=_attach_profile,
+                                     initargs=(shm.name, pv.shape[0])) as executor:
+                parts = executor.map(_sweep_chunk,
+                                     [scaled_batteries[a:b] for a, b in zip(bounds[:-1], bounds[1:])],
+                                     [scaled_feeds[a:b] for a, b in zip(bounds[:-1], bounds[1:])])
+                totals = np.concatenate(list(parts))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    return totals.reshape(peaks.shape) * peaks
+
+
+def run_sweep(reference_pv_kw, peak_powers_kwp, battery_capacities_kwh, max_feeds_kw,
+              electricity_prices, price_model, processes=None, chunk_size=4096, cashflow_model=None):
+    """Vollständiges Parametergitter auswerten und als Tabelle (eine Zeile je Punkt) liefern
+
+    Batteriekapazität 0 entspricht dem Betrieb ohne Speicher; Batterien mit
+    Verlusten wie bei ``sweep_yields``. ``price_model``
+    ist eine Funktion (kWp, kWh) -> Investition in €, z.B. ``PriceModel``.
+    Mit einem ``cashflow.CashflowModel`` kommen Kapitalwert, interner Zinsfuß
+    und dynamische Amortisationszeit je Gitterpunkt hinzu.
+    """
+    yields = sweep_yields(reference_pv_kw, peak_powers_kwp, battery_capacities_kwh,
+                          max_feeds_kw, processes=processes, chunk_size=chunk_size)
+    prices = np.asarray(electricity_prices, dtype=float)
+    battery_kwh = [capacity_of(battery) for battery in battery_list(battery_capacities_kwh)]
+    peaks, capacities, feeds, price = np.meshgrid(np.asarray(peak_powers_kwp, dtype=float),
+                                                  np.asarray(battery_kwh, dtype=float),
+                                                  np.asarray(max_feeds_kw, dtype=float),
+                                                  prices, indexing='ij')
+    annual_yield = np.broadcast_to(yields[..., np.newaxis], peaks.shape)
+    savings = annual_yield * price
+    investment = np.asarray(price_model(peaks, capacities), dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payback = np.where(savings > 0, investment / savings, np.inf)
+
+    table = pd.DataFrame({
+        'peak_power_kwp': peaks.ravel(),
+        'battery_kwh': capacities.ravel(),
+        'max_feed_kw': feeds.ravel(),
+        'electricity_price': price.ravel(),
+        'annual_yield_kwh': annual_yield.ravel(),
+        'annual_savings': savings.ravel(),
+        'investment': investment.ravel(),
+        'payback_years': payback.ravel(),
+    })
+    if cashflow_model is not None:
+        metrics = cashflow_model.evaluate(table['investment'].to_numpy(), table['annual_yield_kwh'].to_numpy(),
+                                          table['electricity_price'].to_numpy(), table['battery_kwh'].to_numpy())
+        table['npv'] = metrics.npv
+        table['irr'] = metrics.irr
+        table['discounted_payback_years'] = metrics.discounted_payback_years
+    return table
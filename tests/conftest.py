@@ -0,0 +1,33 @@
+"""Gemeinsame Testdaten: synthetisches PV-Profil und eine Referenz-Simulation Stunde für Stunde"""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def simulate_hourly(pv_kw, capacity_kwh, max_feed_kw):
+    """Referenz: verlustfreie Batterie in einer einfachen Python-Schleife, gepufferte Einspeisung in kW"""
+    soc = 0.0
+    fed = []
+    for pv in pv_kw:
+        if pv > max_feed_kw:
+            soc = min(soc + pv - max_feed_kw, capacity_kwh)
+            fed.append(max_feed_kw)
+        else:
+            discharge = min(max_feed_kw - pv, soc)
+            soc -= discharge
+            fed.append(pv + discharge)
+    return np.array(fed)
+
+
+@pytest.fixture
+def profile():
+    """Acht Wochen Stundenwerte ab Februar (kW): Tagesgang mit zufälliger Bewölkung"""
+    index = pd.date_range('2023-02-01', periods=8 * 7 * 24, freq='h', tz='UTC')
+    rng = np.random.default_rng(1)
+    sun = np.clip(np.sin((index.hour.to_numpy() - 6) / 12 * np.pi), 0.0, None)
+    return pd.Series(1.6 * sun * rng.uniform(0.1, 1.0, len(index)), index=index)
+
+
+@pytest.fixture
+def reference():
+    return simulate_hourly
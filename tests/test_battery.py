@@ -0,0 +1,70 @@
+"""Die Kerne des Batteriemodells müssen dasselbe rechnen"""
+import numpy as np
+import pytest
+
+import battery
+from battery import Battery, broadcast_params, loss_params, lossy_dispatch
+from dispatch import dispatch_batch
+
+CAPACITIES = np.linspace(0.0, 6.0, 7)
+FEED_LIMIT = 0.6
+
+
+@pytest.fixture
+def pv():
+    """Zwei Wochen Stundenwerte: Tagesgang mit zufälliger Bewölkung (kW)"""
+    rng = np.random.default_rng(0)
+    hours = np.arange(14 * 24)
+    sun = np.clip(np.sin((hours % 24 - 6) / 12 * np.pi), 0.0, None)
+    return 1.8 * sun * rng.uniform(0.2, 1.0, hours.shape[0])
+
+
+@pytest.fixture
+def lossy():
+    specs = [Battery(c, round_trip_efficiency=0.9, max_charge_kw=1.2, max_discharge_kw=0.8, reserve_soc=0.1,
+                     self_discharge_per_day=0.02, inverter_efficiency=0.96) for c in CAPACITIES]
+    return broadcast_params(loss_params(specs), CAPACITIES.shape)
+
+
+def _run(pv, params, compiled, monkeypatch):
+    if not compiled:
+        monkeypatch.setattr(battery, '_compiled_kernel', lambda: None)
+    codes = (np.arange(pv.shape[-1]) // 24)[np.newaxis]  # Tagessummen
+    return lossy_dispatch(pv, params, np.full(CAPACITIES.shape, FEED_LIMIT), keep_hourly=True,
+                          period_codes=codes, n_periods=14)
+
+
+def _assert_same(a, b):
+    for x, y in zip(a, b):
+        np.testing.assert_allclose(x, y, rtol=1e-12, atol=1e-12)
+
+
+def test_numpy_matches_loop_template(pv, lossy, monkeypatch):
+    # Die reine Python-Schleife ist die Vorlage des numba-Kerns
+    monkeypatch.setattr(battery, '_compiled_kernel', lambda: battery._lossy_loop)
+    template = _run(pv, lossy, compiled=True, monkeypatch=monkeypatch)
+    _assert_same(template, _run(pv, lossy, compiled=False, monkeypatch=monkeypatch))
+
+
+def test_compiled_matches_numpy(pv, lossy, monkeypatch):
+    pytest.importorskip('numba')
+    assert battery._compiled_kernel() is not None
+    compiled = _run(pv, lossy, compiled=True, monkeypatch=monkeypatch)
+    _assert_same(compiled, _run(pv, lossy, compiled=False, monkeypatch=monkeypatch))
+
+
+def test_compiled_matches_numpy_per_profile(pv, lossy, monkeypatch):
+    pytest.importorskip('numba')
+    profiles = pv * np.linspace(0.5, 1.5, CAPACITIES.shape[0])[:, np.newaxis]
+    compiled = _run(profiles, lossy, compiled=True, monkeypatch=monkeypatch)
+    _assert_same(compiled, _run(profiles, lossy, compiled=False, monkeypatch=monkeypatch))
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_lossless_params_match_dispatch_batch(pv, compiled, monkeypatch):
+    if compiled:
+        pytest.importorskip('numba')
+    params = broadcast_params(loss_params([Battery(c) for c in CAPACITIES]), CAPACITIES.shape)
+    _, discharge, _, _ = _run(pv, params, compiled, monkeypatch)
+    buffered = np.minimum(pv, FEED_LIMIT) + discharge.T
+    np.testing.assert_allclose(buffered, dispatch_batch(pv, CAPACITIES, FEED_LIMIT), rtol=1e-12, atol=1e-12)
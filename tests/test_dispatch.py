@@ -0,0 +1,38 @@
+"""Gebündelte Speicher-Simulation gegen die Referenz-Schleife"""
+import numpy as np
+from numpy.testing import assert_allclose
+
+from dispatch import dispatch_batch, dispatch_chunk, dispatch_totals
+
+CAPACITIES = np.array([0.0, 0.5, 1.0, 2.048, 4.096, 8.192])
+FEED_LIMITS = np.array([0.2, 0.6, 0.8])
+
+
+def test_dispatch_batch(profile, reference):
+    pv = profile.to_numpy()
+    buffered = dispatch_batch(pv, CAPACITIES[:, np.newaxis], FEED_LIMITS)
+    expected = [reference(pv, c, f) for c in CAPACITIES for f in FEED_LIMITS]
+    assert_allclose(buffered, expected, atol=1e-12)
+
+
+def test_dispatch_chunk_continues_soc(profile, reference):
+    pv = profile.to_numpy()
+    first, soc = dispatch_chunk(pv[:500], CAPACITIES, 0.6)
+    second, _ = dispatch_chunk(pv[500:], CAPACITIES, 0.6, soc_kwh=soc)
+    expected = [reference(pv, c, 0.6) for c in CAPACITIES]
+    assert_allclose(np.hstack([first, second]), expected, atol=1e-12)
+
+
+def test_dispatch_totals(profile, reference):
+    pv = profile.to_numpy()
+    totals = dispatch_totals(pv, CAPACITIES[:, np.newaxis], FEED_LIMITS)
+    expected = [reference(pv, c, f).sum() for c in CAPACITIES for f in FEED_LIMITS]
+    assert_allclose(totals, expected, rtol=1e-12)
+
+
+def test_dispatch_totals_per_profile(profile, reference):
+    pv = profile.to_numpy()
+    profiles = np.array([pv * scale for scale in (0.5, 1.0, 1.5)])
+    totals = dispatch_totals(profiles, [1.0, 2.0, 4.0], 0.6)
+    expected = [reference(p, c, 0.6).sum() for p, c in zip(profiles, (1.0, 2.0, 4.0))]
+    assert_allclose(totals, expected, rtol=1e-12)
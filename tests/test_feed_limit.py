@@ -0,0 +1,29 @@
+"""Einspeiselimit-Abfragen aus der Dauerlinie gegen direkte Summen"""
+import numpy as np
+from numpy.testing import assert_allclose
+
+from feed_limit import FeedLimitIndex
+
+LIMITS = np.array([0.0, 0.1, 0.6, 0.8, 1.2, 5.0])
+
+
+def test_limited_yield(profile):
+    index = FeedLimitIndex(profile)
+    expected = [np.minimum(profile.to_numpy(), x).sum() for x in LIMITS]
+    assert_allclose(index.limited_yield(LIMITS), expected, rtol=1e-12)
+    assert_allclose(index.curtailed_energy(LIMITS), profile.sum() - np.array(expected), atol=1e-9)
+    assert_allclose(index.duration_curve(), np.sort(profile.to_numpy())[::-1])
+
+
+def test_monthly_limited_yield(profile):
+    monthly = FeedLimitIndex(profile).monthly_limited_yield(LIMITS)
+    for x in LIMITS:
+        expected = profile.clip(upper=x).resample('ME').sum()
+        assert_allclose(monthly[x].to_numpy(), expected.to_numpy(), rtol=1e-12)
+    assert list(monthly.index) == list(expected.index)
+
+
+def test_sub_hourly_steps(profile):
+    quarter_hours = np.repeat(profile.to_numpy(), 4)
+    index = FeedLimitIndex(quarter_hours, dt_hours=0.25)
+    assert_allclose(index.limited_yield(0.6), np.minimum(profile.to_numpy(), 0.6).sum(), rtol=1e-12)
@@ -0,0 +1,58 @@
+"""Optimierer gegen eine vollständige Suche über ein Raster"""
+import numpy as np
+import pytest
+
+from battery import Battery
+from dispatch import dispatch_totals
+from optimize import annuity_factor, optimize_configuration
+from pricing import PriceModel
+
+PEAKS = np.array([0.8, 1.6, 2.4, 3.2])
+BATTERIES = np.array([0.0, 2.048, 4.096, 8.192])
+
+
+@pytest.fixture
+def price_model():
+    base = np.array([[500.0], [800.0], [1100.0], [1400.0]])
+    return PriceModel(PEAKS, BATTERIES, base + np.array([0.0, 900.0, 1500.0, 2600.0]))
+
+
+def _grid_search(profile, reference, price_model, objective):
+    pv = profile.to_numpy()
+    annuity = annuity_factor(0.03, 20)
+    best = None
+    for peak in np.linspace(PEAKS[0], PEAKS[-1], 29):
+        for battery in np.linspace(0.0, BATTERIES[-1], 65):
+            savings = reference(pv * peak, battery, 0.6).sum() * 0.3
+            investment = float(price_model(peak, battery))
+            score = investment / savings if objective == 'payback' else investment - savings * annuity
+            if best is None or score < best[0]:
+                best = score, peak, battery
+    return best
+
+
+@pytest.mark.parametrize('objective', ['payback', 'npv'])
+def test_optimizer_beats_grid_search(profile, reference, price_model, objective):
+    result = optimize_configuration(profile.to_numpy(), price_model, 0.3, 0.6, (PEAKS[0], PEAKS[-1]),
+                                    BATTERIES[-1], objective=objective)
+    # Der gemeldete Ertrag muss zur gemeldeten Konfiguration passen
+    expected_yield = reference(profile.to_numpy() * result.peak_power_kwp, result.battery_kwh, 0.6).sum()
+    assert result.annual_yield_kwh == pytest.approx(expected_yield, rel=1e-9)
+    score = result.payback_years if objective == 'payback' else -result.npv
+    grid_score, _, _ = _grid_search(profile, reference, price_model, objective)
+    assert score <= grid_score + 1e-9 * abs(grid_score)
+
+
+def test_lossy_battery_model(profile, price_model):
+    def battery_model(capacity):
+        return Battery(capacity, round_trip_efficiency=0.9, max_charge_kw=1.0, max_discharge_kw=0.8,
+                       reserve_soc=0.1, inverter_efficiency=0.96)
+
+    lossless = optimize_configuration(profile.to_numpy(), price_model, 0.3, 0.6, (PEAKS[0], PEAKS[-1]),
+                                      BATTERIES[-1], objective='npv')
+    result = optimize_configuration(profile.to_numpy(), price_model, 0.3, 0.6, (PEAKS[0], PEAKS[-1]),
+                                    BATTERIES[-1], objective='npv', battery_model=battery_model)
+    expected_yield = dispatch_totals(profile.to_numpy() * result.peak_power_kwp,
+                                     [battery_model(result.battery_kwh)], 0.6)[0]
+    assert result.annual_yield_kwh == pytest.approx(expected_yield, rel=1e-9)
+    assert result.npv < lossless.npv
@@ -0,0 +1,32 @@
+"""Zeitraumsummen aus dem Simulationskern gegen resample der Referenz-Schleife"""
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_allclose
+
+from dispatch import dispatch_periods
+from periods import DAILY, MONTHLY, WEEKLY, period_bins
+
+CAPACITIES = np.array([0.0, 1.0, 4.096])
+
+
+def test_dispatch_periods(profile, reference):
+    bins = [period_bins(profile.index, freq) for freq in (MONTHLY, WEEKLY, DAILY)]
+    aggregates, buffered, _ = dispatch_periods(profile.to_numpy(), CAPACITIES, 0.6, bins,
+                                               keep_hourly=True)
+    hourly = [pd.Series(reference(profile.to_numpy(), c, 0.6), index=profile.index) for c in CAPACITIES]
+    assert_allclose(buffered, hourly, atol=1e-12)
+    for b in bins:
+        sums = aggregates[b.freq]
+        assert_allclose(sums['unlimited'], profile.resample(b.freq).sum(), rtol=1e-12)
+        assert_allclose(sums['limited'], [profile.clip(upper=0.6).resample(b.freq).sum()] * 3,
+                        rtol=1e-12)
+        assert_allclose(sums['buffered'], [s.resample(b.freq).sum() for s in hourly], rtol=1e-12)
+
+
+def test_hourly_values_are_optional(profile):
+    bins = [period_bins(profile.index, MONTHLY)]
+    with_hourly = dispatch_periods(profile.to_numpy(), CAPACITIES, 0.6, bins, keep_hourly=True)
+    without = dispatch_periods(profile.to_numpy(), CAPACITIES, 0.6, bins)
+    assert without[1] is None
+    assert_allclose(without[0][MONTHLY]['buffered'], with_hourly[0][MONTHLY]['buffered'], rtol=1e-12)
+    assert_allclose(without[2], with_hourly[2])
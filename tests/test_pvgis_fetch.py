@@ -0,0 +1,146 @@
+"""PVGISFetcher gegen einen lokalen HTTP-Server mit vorgefertigten PVGIS-Antworten"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from pvgis_fetch import FetchJob, PVGISFetcher
+
+
+def _pvgis_json(year, peakpower):
+    """Minimale seriescalc-Antwort (ein Tag), wie sie pvlib.iotools.read_pvgis_hourly liest"""
+    hourly = [{'time': f'{year}0101:{hour:02d}10', 'P': 100.0 * peakpower * max(0, 6 - abs(hour - 12)),
+               'G(i)': 0.0, 'H_sun': 0.0, 'T2m': 5.0, 'WS10m': 3.0, 'Int': 0} for hour in range(24)]
+    return json.dumps({'inputs': {'location': {}}, 'outputs': {'hourly': hourly},
+                       'meta': {'inputs': {}, 'outputs': {}}})
+
+
+class _PVGISStandIn(ThreadingHTTPServer):
+    """Beantwortet 'seriescalc' zunächst mit den Status aus ``script``, dann mit Daten"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.script = []        # (status, headers) der nächsten Antworten
+        self.delay = lambda year: 0.0
+        self.requests = []      # (Zeitpunkt, Jahr) je Anfrage
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        year = int(query['startyear'][0])
+        with server.lock:
+            server.requests.append((time.monotonic(), year))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            status, headers = server.script.pop(0) if server.script else (200, {})
+        try:
+            time.sleep(server.delay(year))
+            body = (_pvgis_json(year, float(query['peakpower'][0])) if status == 200
+                    else json.dumps({'message': f'Status {status}'})).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = _PVGISStandIn()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _fetcher(server, **kwargs):
+    kwargs = dict(dict(rate_limit=None, backoff=0.01, max_backoff=5.0, timeout=5), **kwargs)
+    return PVGISFetcher(url=server.url, **kwargs)
+
+
+def test_fetch_parses_pvgis_json(server):
+    with _fetcher(server) as fetcher:
+        data = fetcher.fetch(FetchJob(54.17, 9.38, 2023, peakpower=2.0))
+    assert len(data) == 24
+    assert data.index[0].year == 2023
+    assert data['P'].max() == pytest.approx(1200.0)
+
+
+def test_retry_after_429(server):
+    server.script = [(429, {'Retry-After': '0.4'})]
+    with _fetcher(server) as fetcher:
+        data = fetcher.fetch(FetchJob(54.17, 9.38, 2023))
+    assert len(data) == 24
+    (first, _), (second, _) = server.requests
+    # Wartezeit aus dem Header (mit Jitter 0.5..1), nicht der Backoff von 0.01 s
+    assert second - first >= 0.2
+
+
+def test_retry_after_5xx(server):
+    server.script = [(503, {}), (500, {}), (502, {})]
+    with _fetcher(server) as fetcher:
+        data = fetcher.fetch(FetchJob(54.17, 9.38, 2023))
+    assert len(data) == 24
+    assert len(server.requests) == 4
+
+
+def test_gives_up_after_retries(server):
+    server.script = [(503, {})] * 3
+    with _fetcher(server, retries=2) as fetcher:
+        results = list(fetcher.fetch_many([FetchJob(54.17, 9.38, 2023)]))
+    assert results[0].data is None
+    assert 'nach 3 Versuchen' in str(results[0].error)
+    assert len(server.requests) == 3
+
+
+def test_client_error_is_not_retried(server):
+    server.script = [(400, {})]
+    with _fetcher(server) as fetcher:
+        results = list(fetcher.fetch_many([FetchJob(54.17, 9.38, 2023)]))
+    assert str(results[0].error) == 'Status 400'
+    assert len(server.requests) == 1
+
+
+def test_concurrency_is_capped(server):
+    server.delay = lambda year: 0.05
+    jobs = [FetchJob(54.17, 9.38, year) for year in range(2005, 2021)]
+    with _fetcher(server, max_workers=3) as fetcher:
+        results = list(fetcher.fetch_many(jobs))
+    assert sorted(r.job.year for r in results) == [job.year for job in jobs]
+    assert all(r.error is None for r in results)
+    assert 1 < server.max_active <= 3
+
+
+def test_fetch_ordered_keeps_job_order(server):
+    # spätere Jahre antworten zuerst
+    server.delay = lambda year: 0.02 * (2020 - year)
+    jobs = [FetchJob(54.17, 9.38, year) for year in range(2013, 2021)]
+    with _fetcher(server, max_workers=4) as fetcher:
+        results = list(fetcher.fetch_ordered(jobs))
+    assert [r.job for r in results] == jobs
+    assert [r.data.index[0].year for r in results] == [job.year for job in jobs]
+    assert server.max_active <= 4
@@ -0,0 +1,59 @@
+"""Eigenverbrauch mit und ohne Batterieverluste gegen eine Referenz-Schleife"""
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from battery import Battery
+from dispatch import dispatch_totals, limited_totals
+from selfconsumption import simulate_self_consumption
+
+LOSSY = Battery(2.0, round_trip_efficiency=0.9, max_charge_kw=1.0, max_discharge_kw=0.5, reserve_soc=0.1,
+                self_discharge_per_day=0.01, inverter_efficiency=0.96)
+
+
+@pytest.fixture
+def loads(profile):
+    rng = np.random.default_rng(2)
+    return rng.uniform(0.05, 0.8, (4, len(profile)))
+
+
+def _reference(pv_kw, load_kw, battery, max_feed_kw):
+    """Energieflüsse (direct, charged, discharged, exported, curtailed) Stunde für Stunde"""
+    eta = np.sqrt(battery.round_trip_efficiency) * battery.inverter_efficiency
+    retention = (1 - battery.self_discharge_per_day) ** (1 / 24)
+    reserve = soc = battery.reserve_soc * battery.capacity_kwh
+    flows = np.zeros(5)
+    for pv, load in zip(pv_kw, load_kw):
+        soc *= retention
+        direct = min(load, pv, max_feed_kw)
+        spare, headroom = pv - direct, max_feed_kw - direct
+        charge = max(min(spare, battery.max_charge_kw, (battery.capacity_kwh - soc) / eta), 0.0)
+        soc += charge * eta
+        spare -= charge
+        exported = min(spare, headroom)
+        discharge = min(load - direct, headroom, battery.max_discharge_kw, max(soc - reserve, 0.0) * eta)
+        soc -= discharge / eta
+        flows += direct, charge, discharge, exported, spare - exported
+    return flows
+
+
+def test_battery_losses(profile, loads):
+    flows = simulate_self_consumption(profile.to_numpy(), loads, LOSSY, 0.8, chunk_size=3)
+    got = np.array([flows.direct, flows.charged, flows.discharged, flows.exported, flows.curtailed]).T
+    expected = [_reference(profile.to_numpy(), load, LOSSY, 0.8) for load in loads]
+    assert_allclose(got, expected, rtol=1e-10, atol=1e-10)
+    assert_allclose(flows.grid_import, flows.load - flows.direct - flows.discharged)
+
+
+def test_ideal_battery_matches_capacity(profile, loads):
+    ideal = simulate_self_consumption(profile.to_numpy(), loads, Battery(2.0), 0.8)
+    plain = simulate_self_consumption(profile.to_numpy(), loads, 2.0, 0.8)
+    for a, b in zip(ideal, plain):
+        assert_allclose(a, b, rtol=1e-12)
+
+
+def test_high_load_equals_dispatch(profile):
+    # Last immer über dem Limit: Entladung wie in der Speicher-Simulation
+    flows = simulate_self_consumption(profile.to_numpy(), np.full(len(profile), 5.0), LOSSY, 0.8)
+    expected = dispatch_totals(profile.to_numpy(), [LOSSY], 0.8) - limited_totals(profile.to_numpy(), 0.8)
+    assert_allclose(flows.discharged, expected, rtol=1e-10)
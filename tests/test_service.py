@@ -0,0 +1,91 @@
+"""Angebotsdienst über eine echte TCP-Verbindung mit festem 1 kWp-Profil"""
+import asyncio
+import json
+
+import pandas as pd
+import pytest
+from numpy.testing import assert_allclose
+
+from battery import Battery
+from dispatch import dispatch_totals
+from pvgis_fetch import FetchResult
+from service import QuoteService
+
+
+class _Fetcher:
+    """Liefert für jeden Job dasselbe Profil (W, wie PVGIS)"""
+
+    def __init__(self, profile):
+        self.data = pd.DataFrame({'P': profile.to_numpy() * 1000}, index=profile.index)
+        self.calls = 0
+
+    def fetch_ordered(self, jobs):
+        for job in jobs:
+            self.calls += 1
+            yield FetchResult(job, self.data, None, False)
+
+
+async def _exchange(port, request):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return head.split(b'\r\n')[0].decode(), json.loads(body)
+
+
+def _serve(service, *requests):
+    async def run():
+        server = await asyncio.start_server(service._connection, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return await asyncio.gather(*(_exchange(port, request) for request in requests))
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def service(profile):
+    service = QuoteService(_Fetcher(profile), price_model=lambda peak, battery: 1000.0 + 500 * battery,
+                           batch_window=0.05)
+    yield service
+    service.close()
+
+
+def test_malformed_request_line(service):
+    (status, payload), = _serve(service, b'kaputt\r\n\r\n')
+    assert status == 'HTTP/1.1 400 Bad Request'
+    assert 'error' in payload
+
+
+def test_invalid_content_length(service):
+    (status, _), = _serve(service, b'POST /quote HTTP/1.1\r\nContent-Length: viel\r\n\r\n')
+    assert status == 'HTTP/1.1 400 Bad Request'
+
+
+def test_concurrent_quotes_share_one_simulation(service, profile, reference):
+    requests = [(f'GET /quote?latitude=54.17&longitude=9.38&peak_power_kwp={peak}&battery_kwh=2.048 '
+                 f'HTTP/1.1\r\nConnection: close\r\n\r\n').encode() for peak in (1.0, 2.0, 3.0)]
+    responses = _serve(service, *requests)
+    assert [status for status, _ in responses] == ['HTTP/1.1 200 OK'] * 3
+    for peak, (_, quote) in zip((1.0, 2.0, 3.0), responses):
+        expected = reference(profile.to_numpy() * peak, 2.048, 0.8).sum()
+        assert_allclose(quote['annual_yield_kwh'], expected, rtol=1e-9)
+    assert service.batches == 1 and service.batched_configs == 3
+    assert service.fetcher.calls == 1
+    assert not service._flushes
+
+
+def test_battery_losses_reach_the_simulation(service, profile):
+    lossless = ('GET /quote?latitude=54.17&longitude=9.38&peak_power_kwp=2&battery_kwh=2.048 '
+                'HTTP/1.1\r\nConnection: close\r\n\r\n').encode()
+    lossy = ('GET /quote?latitude=54.17&longitude=9.38&peak_power_kwp=2&battery_kwh=2.048'
+             '&round_trip_efficiency=0.9&max_charge_kw=1.0&reserve_soc=0.1 '
+             'HTTP/1.1\r\nConnection: close\r\n\r\n').encode()
+    (_, ideal), (_, quote) = _serve(service, lossless, lossy)
+    expected = dispatch_totals(profile.to_numpy() * 2,
+                               [Battery(2.048, round_trip_efficiency=0.9, max_charge_kw=1.0, reserve_soc=0.1)],
+                               0.8)[0]
+    assert_allclose(quote['annual_yield_kwh'], expected, rtol=1e-9)
+    assert quote['annual_yield_kwh'] < ideal['annual_yield_kwh']
+    assert quote['round_trip_efficiency'] == 0.9 and ideal['round_trip_efficiency'] is None
@@ -0,0 +1,35 @@
+"""Parameter-Sweep über das 1 kWp-Profil gegen direkte Simulation der skalierten Profile"""
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from battery import Battery
+from dispatch import dispatch_totals
+from sweep import sweep_yields
+
+PEAKS = [0.8, 2.0]
+FEEDS = [0.6, 0.8]
+LOSSY = Battery(2.048, round_trip_efficiency=0.92, max_charge_kw=1.0, max_discharge_kw=0.8, reserve_soc=0.1,
+                self_discharge_per_day=0.001, inverter_efficiency=0.96)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_sweep_with_battery_losses(profile, processes):
+    batteries = [0.0, LOSSY, 4.096]
+    yields = sweep_yields(profile.to_numpy(), PEAKS, batteries, FEEDS, processes=processes, chunk_size=4)
+    for i, peak in enumerate(PEAKS):
+        for j, feed in enumerate(FEEDS):
+            expected = dispatch_totals(profile.to_numpy() * peak, [Battery(0.0), LOSSY, Battery(4.096)], feed)
+            assert_allclose(yields[i, :, j], expected, rtol=1e-10)
+
+
+def test_sweep_lossless(profile, reference):
+    yields = sweep_yields(profile.to_numpy(), PEAKS, [0.0, 2.048], FEEDS, processes=1)
+    expected = [[[reference(profile.to_numpy() * peak, c, feed).sum() for feed in FEEDS] for c in (0.0, 2.048)]
+                for peak in PEAKS]
+    assert_allclose(yields, expected, rtol=1e-10)
+
+
+def test_rejects_non_positive_peak(profile):
+    with pytest.raises(ValueError, match='größer als 0'):
+        sweep_yields(profile.to_numpy(), [0.0, 1.0], [2.048], FEEDS, processes=1)
@@ -0,0 +1,22 @@
+"""Exakte Ertragskurve über der Kapazität gegen Einzelsimulationen"""
+import numpy as np
+from numpy.testing import assert_allclose
+
+from dispatch import yield_capacity_curve
+
+
+def test_curve_matches_simulation(profile, reference):
+    pv = profile.to_numpy()
+    xs, ys = yield_capacity_curve(pv, 0.6, 8.0)
+    assert xs[0] == 0.0 and xs[-1] == 8.0
+    # Stützstellen und Punkte dazwischen
+    capacities = np.union1d(xs, np.linspace(0.0, 8.0, 41))
+    expected = [reference(pv, c, 0.6).sum() for c in capacities]
+    assert_allclose(np.interp(capacities, xs, ys), expected, rtol=1e-10)
+
+
+def test_curve_without_battery(profile):
+    pv = profile.to_numpy()
+    xs, ys = yield_capacity_curve(pv, 0.6, 0.0)
+    assert_allclose(xs, [0.0])
+    assert_allclose(ys, [np.minimum(pv, 0.6).sum()])